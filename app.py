@@ -15,9 +15,15 @@ app.config.from_object('config')
 # Initialize Firestore
 db = firestore.Client()
 
-# Initialize Storage Manager
+# Storage Manager, created on first use so startup does not wait on GCS
 from storage_manager import StorageManager
-storage_manager = StorageManager()
+_storage_manager = None
+
+def get_storage_manager():
+    global _storage_manager
+    if _storage_manager is None:
+        _storage_manager = StorageManager()
+    return _storage_manager
 
 @app.route('/')
 def index():
@@ -78,7 +84,7 @@ def create_post():
             files = request.files.getlist('files')
             for file in files:
                 # Upload to GCS with auto-extension
-                url = storage_manager.upload_file(
+                url = get_storage_manager().upload_file(
                     file=file,
                     user_id=user_id,
                     content_type='post'
@@ -30,6 +30,37 @@ def create_app(config_name='default'):
         redis_client = None
         print("Redis connection failed - caching disabled")
     
+    from app.serialization import configure_serializer
+    configure_serializer(app)
+    
+    from app.rendering import configure_rendering
+    configure_rendering(app)
+    
+    if redis_client and app.config.get('CACHE_L1_ENABLED'):
+        from app.local_cache import init_local_cache
+        init_local_cache(app, redis_client)
+    
+    from app.view_counts import init_view_counts
+    init_view_counts(app)
+    
+    from app.dashboard_stats import init_dashboard_stats
+    init_dashboard_stats(app)
+    
+    from app.storage_stats import init_storage_stats
+    init_storage_stats(app)
+    
+    # The GCS client connects on first use; warming up starts that in the
+    # background, so booting a worker never waits on cloud latency
+    if app.config.get('STORAGE_WARM_UP'):
+        from storage import storage
+        storage.warm_up()
+    
+    from app.search import init_search
+    init_search(app)
+    
+    from app.media_store import init_media_store
+    init_media_store(app)
+    
     # Register blueprints
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -1,11 +1,18 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
 from flask_login import login_required, current_user
 from functools import wraps
 from app import db
 from app.models import User, Post, Comment, MediaFile
-from app.utils import cache_delete
+from app.view_counts import prefetch_pending_views
+from app.unique_views import unique_view_counts
+from app.trigram import substring_filter
+from app.dashboard_stats import get_snapshot
+from app import daily_stats, repositories, storage_stats
+from app.media_store import get_media_backend, stored_key
+from app.utils import cache_bump, cache_stats, keyset_paginate
 from datetime import datetime, timedelta
-from sqlalchemy import func, desc
+import time
+from sqlalchemy import desc
 from storage import storage
 
 bp = Blueprint('admin', __name__)
@@ -23,59 +30,16 @@ def admin_required(f):
 @login_required
 @admin_required
 def dashboard():
-    # Get statistics
-    total_users = User.query.count()
-    total_posts = Post.query.count()
-    total_comments = Comment.query.count()
-    total_media = MediaFile.query.count()
-    
-    # Get recent activity
-    recent_users = User.query.order_by(desc(User.created_at)).limit(5).all()
-    recent_posts = Post.query.order_by(desc(Post.created_at)).limit(5).all()
-    recent_comments = Comment.query.order_by(desc(Comment.created_at)).limit(5).all()
-    # Get growth statistics (last 30 days)
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    new_users_30d = User.query.filter(User.created_at >= thirty_days_ago).count()
-    new_posts_30d = Post.query.filter(Post.created_at >= thirty_days_ago).count()
-
-    # Get storage usage
-    total_storage = db.session.query(func.sum(MediaFile.file_size)).scalar() or 0
-    total_storage_mb = total_storage / (1024 * 1024)
-
-    try:
-        gcs_stats = storage.get_storage_stats()
-        storage_info = {
-            'total_storage_gb': gcs_stats.get('total_size_gb', 0),
-            'total_files': gcs_stats.get('total_files', 0),
-            'current_bucket': gcs_stats.get('current_bucket', 'N/A'),
-            'buckets_used': len(gcs_stats.get('buckets', [])),
-            'max_buckets': gcs_stats.get('max_buckets', 10)
-        }
-    except Exception as e:
-        storage_info = {
-            'total_storage_gb': 0,
-            'total_files': 0,
-            'current_bucket': 'Error',
-            'buckets_used': 0,
-            'max_buckets': 10
-        }
-    
-    stats = {
-        'total_users': total_users,
-        'total_posts': total_posts,
-        'total_comments': total_comments,
-        'total_media': total_media,
-        'new_users_30d': new_users_30d,
-        'new_posts_30d': new_posts_30d,
-        'total_storage_mb': round(total_storage_mb, 2),
-        'storage_info': storage_info
-    }
+    # Counts, recent activity and storage totals come from a snapshot kept
+    # fresh in the background, so the page costs the same at any table size
+    snapshot = get_snapshot()
     
     return render_template('admin/dashboard.html', 
-                         stats=stats,
-                         recent_users=recent_users,
-                         recent_posts=recent_posts,
-                         recent_comments=recent_comments)
+                         stats=snapshot['stats'],
+                         recent_users=snapshot['recent_users'],
+                         recent_posts=snapshot['recent_posts'],
+                         recent_comments=snapshot['recent_comments'],
+                         snapshot_age=int(time.time() - snapshot['generated_at']))
 
 @bp.route('/storage')
 @login_required
@@ -83,15 +47,15 @@ def dashboard():
 def storage_management():
     """Google Cloud Storage management dashboard"""
     try:
-        # Get detailed storage statistics
-        storage_stats = storage.get_storage_stats()
+        # Bucket statistics from the background-refreshed snapshot
+        stats = storage_stats.get_stats()
         
         # Ensure buckets list exists
-        if 'buckets' not in storage_stats:
-            storage_stats['buckets'] = []
+        if 'buckets' not in stats:
+            stats['buckets'] = []
         
         # Calculate usage percentages and classes for each bucket
-        for bucket in storage_stats.get('buckets', []):
+        for bucket in stats.get('buckets', []):
             # Ensure usage_percentage exists
             if 'usage_percentage' not in bucket:
                 bucket['usage_percentage'] = (bucket.get('size_gb', 0) / storage.storage_quota_gb) * 100 if storage.storage_quota_gb > 0 else 0
@@ -102,7 +66,9 @@ def storage_management():
         recent_uploads = MediaFile.query.order_by(desc(MediaFile.created_at)).limit(10).all()
         
         return render_template('admin/storage_management.html', 
-                             storage_stats=storage_stats,
+                             storage_stats=stats,
+                             stats_age=storage_stats.stats_age(stats),
+                             refreshing=storage_stats.is_refreshing(),
                              recent_uploads=recent_uploads)
     except Exception as e:
         flash(f'Error loading storage stats: {str(e)}', 'error')
@@ -115,20 +81,34 @@ def storage_management():
                                  'current_bucket': 'Error',
                                  'max_buckets': 10
                              },
+                             stats_age=None,
+                             refreshing=False,
                              recent_uploads=[])
 
+@bp.route('/storage/refresh-stats', methods=['POST'])
+@login_required
+@admin_required
+def refresh_storage_stats():
+    """Start listing the buckets in the background"""
+    storage_stats.request_refresh()
+    flash('Storage statistics are being refreshed; reload the page in a moment.', 'info')
+    return redirect(url_for('admin.storage_management'))
+
 
 # ADD NEW ROUTE: Storage API endpoint
 @bp.route('/api/storage-stats')
 @login_required
 @admin_required
 def api_storage_stats():
-    """API endpoint for storage statistics"""
+    """API endpoint for storage statistics (the last snapshot and its age in seconds)"""
     try:
-        stats = storage.get_storage_stats()
+        stats = storage_stats.get_stats()
         return jsonify({
             'success': True,
-            'data': stats
+            'data': stats,
+            'age': storage_stats.stats_age(stats),
+            'refreshing': storage_stats.is_refreshing(),
+            'backend': storage.health()
         })
     except Exception as e:
         return jsonify({
@@ -136,6 +116,27 @@ def api_storage_stats():
             'error': str(e)
         }), 500
 
+@bp.route('/api/storage-stats/refresh', methods=['POST'])
+@login_required
+@admin_required
+def api_refresh_storage_stats():
+    """Start listing the buckets in the background; poll /api/storage-stats for the result"""
+    storage_stats.request_refresh()
+    return jsonify({
+        'success': True,
+        'refreshing': True
+    }), 202
+
+@bp.route('/api/cache-stats')
+@login_required
+@admin_required
+def api_cache_stats():
+    """Per-tier cache hit/miss counters for the worker serving the request"""
+    return jsonify({
+        'success': True,
+        'data': cache_stats()
+    })
+
 # ADD NEW ROUTE: Extend storage manually
 @bp.route('/storage/extend', methods=['POST'])
 @login_required
@@ -169,11 +170,13 @@ def cleanup_storage():
         # Find old media files
         old_files = MediaFile.query.filter(MediaFile.created_at < cutoff_date).all()
         
-        deleted_count = 0
+        # Remove their objects in one batch, then the rows
+        get_media_backend().delete_many(
+            key for key in map(stored_key, old_files) if key
+        )
         for file in old_files:
-            if storage.delete_file(file.file_url):
-                db.session.delete(file)
-                deleted_count += 1
+            db.session.delete(file)
+        deleted_count = len(old_files)
         
         db.session.commit()
         flash(f'Cleaned up {deleted_count} old files', 'success')
@@ -191,19 +194,18 @@ def manage_users():
     
     query = User.query
     if search:
-        query = query.filter(
-            User.username.contains(search) | 
-            User.email.contains(search) |
-            User.first_name.contains(search) |
-            User.last_name.contains(search)
+        query = query.filter(substring_filter(User, search))
+    
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        users = keyset_paginate(query, User, cursor, per_page=current_app.config['ADMIN_PER_PAGE'])
+    else:
+        users = query.order_by(desc(User.created_at), desc(User.id)).paginate(
+            page=page,
+            per_page=current_app.config['ADMIN_PER_PAGE'],
+            error_out=False
         )
     
-    users = query.order_by(desc(User.created_at)).paginate(
-        page=page,
-        per_page=20,
-        error_out=False
-    )
-    
     return render_template('admin/users.html', users=users, search=search)
 
 @bp.route('/users/<int:user_id>/toggle-status', methods=['POST'])
@@ -273,9 +275,8 @@ def delete_user(user_id):
     db.session.delete(user)
     db.session.commit()
     
-    # Clear cache
-    for page in range(1, 6):
-        cache_delete(f"feed_page_{page}")
+    # Invalidate every cached feed page
+    cache_bump('feed')
     
     flash(f'User {username} has been deleted successfully.', 'success')
     return redirect(url_for('admin.manage_users'))
@@ -287,17 +288,25 @@ def manage_posts():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
     
-    query = Post.query
+    query = repositories.admin_posts()
     if search:
-        query = query.filter(Post.title.contains(search) | Post.content.contains(search))
+        query = query.filter(substring_filter(Post, search))
+    
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        posts = keyset_paginate(query, Post, cursor, per_page=current_app.config['ADMIN_PER_PAGE'])
+    else:
+        posts = query.order_by(desc(Post.created_at), desc(Post.id)).paginate(
+            page=page,
+            per_page=current_app.config['ADMIN_PER_PAGE'],
+            error_out=False
+        )
     
-    posts = query.order_by(desc(Post.created_at)).paginate(
-        page=page,
-        per_page=20,
-        error_out=False
-    )
+    prefetch_pending_views(posts.items)
+    unique_views = unique_view_counts(post.id for post in posts.items) \
+        if current_app.config['ENABLE_UNIQUE_VIEWS'] else None
     
-    return render_template('admin/posts.html', posts=posts, search=search)
+    return render_template('admin/posts.html', posts=posts, search=search, unique_views=unique_views)
 
 @bp.route('/posts/<int:post_id>/toggle-status', methods=['POST'])
 @login_required
@@ -308,9 +317,8 @@ def toggle_post_status(post_id):
     post.is_published = not post.is_published
     db.session.commit()
     
-    # Clear cache
-    for page in range(1, 6):
-        cache_delete(f"feed_page_{page}")
+    # Invalidate every cached feed page
+    cache_bump('feed', f"post:{post.id}")
     
     status = 'published' if post.is_published else 'unpublished'
     flash(f'Post "{post.title}" has been {status}.', 'success')
@@ -323,11 +331,15 @@ def toggle_post_status(post_id):
 def manage_comments():
     page = request.args.get('page', 1, type=int)
     
-    comments = Comment.query.order_by(desc(Comment.created_at)).paginate(
-        page=page,
-        per_page=20,
-        error_out=False
-    )
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        comments = keyset_paginate(repositories.admin_comments(), Comment, cursor, per_page=current_app.config['ADMIN_PER_PAGE'])
+    else:
+        comments = repositories.admin_comments().order_by(desc(Comment.created_at), desc(Comment.id)).paginate(
+            page=page,
+            per_page=current_app.config['ADMIN_PER_PAGE'],
+            error_out=False
+        )
     
     return render_template('admin/comments.html', comments=comments)
 
@@ -336,10 +348,14 @@ def manage_comments():
 @admin_required
 def delete_comment(comment_id):
     comment = Comment.query.get_or_404(comment_id)
+    post_id = comment.post_id
     
     db.session.delete(comment)
     db.session.commit()
     
+    # Refresh the post's cached feed card (comment count)
+    cache_bump(f"post:{post_id}")
+    
     flash('Comment deleted successfully.', 'success')
     return redirect(url_for('admin.manage_comments'))
 
@@ -353,6 +369,9 @@ def toggle_comment_approval(comment_id):
     comment.is_approved = not comment.is_approved
     db.session.commit()
     
+    # Refresh the post's cached feed card (comment count)
+    cache_bump(f"post:{comment.post_id}")
+    
     status = 'approved' if comment.is_approved else 'hidden'
     flash(f'Comment has been {status}.', 'success')
     
@@ -365,15 +384,17 @@ def manage_media():
     page = request.args.get('page', 1, type=int)
     file_type = request.args.get('type', 'all')
     
-    query = MediaFile.query
-    if file_type != 'all':
-        query = query.filter_by(file_type=file_type)
+    query = repositories.media_files(file_type if file_type != 'all' else None)
     
-    media_files = query.order_by(desc(MediaFile.created_at)).paginate(
-        page=page,
-        per_page=20,
-        error_out=False
-    )
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        media_files = keyset_paginate(query, MediaFile, cursor, per_page=current_app.config['ADMIN_PER_PAGE'])
+    else:
+        media_files = query.order_by(desc(MediaFile.created_at), desc(MediaFile.id)).paginate(
+            page=page,
+            per_page=current_app.config['ADMIN_PER_PAGE'],
+            error_out=False
+        )
     
     return render_template('admin/media.html', media_files=media_files, current_type=file_type)
 
@@ -383,13 +404,14 @@ def manage_media():
 def delete_media(media_id):
     media_file = MediaFile.query.get_or_404(media_id)
     
-    # DELETE FROM GOOGLE CLOUD STORAGE - UPDATED
-    if media_file.file_url:
+    # Delete the stored object from the media backend
+    key = stored_key(media_file)
+    if key:
         try:
-            if storage.delete_file(media_file.file_url):
-                flash('File deleted from cloud storage', 'info')
+            if get_media_backend().delete(key):
+                flash('File deleted from storage', 'info')
         except Exception as e:
-            flash(f'Error deleting from cloud: {str(e)}', 'warning')
+            flash(f'Error deleting from storage: {str(e)}', 'warning')
     
     db.session.delete(media_file)
     db.session.commit()
@@ -401,45 +423,30 @@ def delete_media(media_id):
 @login_required
 @admin_required
 def analytics():
-    # User growth over last 12 months
-    user_growth = []
-    for i in range(12):
-        date = datetime.utcnow() - timedelta(days=30*i)
-        count = User.query.filter(User.created_at <= date).count()
-        user_growth.append({
-            'month': date.strftime('%Y-%m'),
-            'count': count
-        })
-    user_growth.reverse()
-    
-    # Post activity over last 30 days
-    post_activity = []
-    for i in range(30):
-        date = datetime.utcnow() - timedelta(days=i)
-        start_date = date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_date = start_date + timedelta(days=1)
-        count = Post.query.filter(
-            Post.created_at >= start_date,
-            Post.created_at < end_date
-        ).count()
-        post_activity.append({
-            'date': start_date.strftime('%Y-%m-%d'),
-            'count': count
-        })
-    post_activity.reverse()
+    # Everything below reads the daily_stats rollups (`flask rollup-stats`),
+    # a few hundred rows per year of range
+    days = min(max(request.args.get('days', 30, type=int), 1), 3650)
+    end_date = datetime.utcnow().date()
+    start_date = end_date - timedelta(days=days - 1)
+    
+    # User growth: totals at each month end, at least the last 12 months
+    user_growth = daily_stats.user_growth(max(12, (days + 29) // 30))
+    
+    # Daily activity over the selected range (the chart in at most 120 bars)
+    post_activity = daily_stats.daily_series(start_date, end_date)
+    activity_chart = daily_stats.bucketed(post_activity)
+    totals = {
+        name: sum(day[name] for day in post_activity)
+        for name in ('new_users', 'new_posts', 'new_comments', 'views')
+    }
     
-    # Top contributors
-    top_contributors = db.session.query(
-        User.username,
-        User.first_name,
-        User.last_name,
-        func.count(Post.id).label('post_count')
-    ).join(Post).group_by(User.id).order_by(desc('post_count')).limit(10).all()
+    # Top contributors over the selected range
+    top_contributors = daily_stats.top_contributors(start_date, end_date)
     
     # ADD: Storage growth tracking
     storage_growth = []
     try:
-        stats = storage.get_storage_stats()
+        stats = storage_stats.get_stats()
         for bucket in stats.get('buckets', []):
             storage_growth.append({
                 'bucket': bucket['name'],
@@ -453,7 +460,11 @@ def analytics():
                          user_growth=user_growth,
                          post_activity=post_activity,
                          top_contributors=top_contributors,
-                         storage_growth=storage_growth)  # ADD THIS
+                         storage_growth=storage_growth,
+                         days=days,
+                         activity_chart=activity_chart,
+                         totals=totals,
+                         last_rollup=daily_stats.last_rollup())
 
 @bp.route('/settings', methods=['GET', 'POST'])
 @login_required
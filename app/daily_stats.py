@@ -0,0 +1,250 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from app import db, redis_client
+from app.models import User, Post, Comment, MediaFile, DailyStats, DailyUserStats
+from app.unique_views import DAY_KEY_TTL, unique_visitors
+
+# Daily rollups behind the admin analytics page
+#
+# daily_stats holds one row per UTC day with the users, posts, comments and
+# media (count and bytes) created that day, the page views flushed that day
+# and the day's unique visitors; daily_user_stats holds posts and comments
+# per author per day. Charts over any range then read a few hundred rows per
+# year instead of counting the source tables.
+#
+# rollup() recomputes whole days from the source tables, so re-running it is
+# harmless; run_rollup() (`flask rollup-stats`) continues from the last day
+# it counted, re-counting the trailing STATS_ROLLUP_LOOKBACK days to pick up
+# late changes. Views are not derivable from the tables: flush_views() adds
+# them to the current day with add_views(), and rollup() leaves them alone.
+# Unique visitors come from the per-day HyperLogLogs while Redis keeps them.
+
+COUNTED = ('new_users', 'new_posts', 'new_comments', 'new_media', 'media_bytes')
+
+
+def _as_date(value):
+    # func.date() gives a date on PostgreSQL and an ISO string on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def _bounds(start, end):
+    return datetime.combine(start, datetime.min.time()), \
+        datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+
+def _upsert_insert(table):
+    """An INSERT supporting ON CONFLICT DO UPDATE, on the dialects that have one"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(table)
+
+
+def _per_day(model, start, end, *aggregates, by_user=False):
+    lo, hi = _bounds(start, end)
+    day = func.date(model.created_at)
+    columns = [day, model.user_id] if by_user else [day]
+    return db.session.execute(
+        select(*columns, *aggregates)
+        .where(model.created_at >= lo, model.created_at < hi)
+        .group_by(*columns)
+    ).all()
+
+
+def rollup(start, end):
+    """Recompute the rollup rows for the days ``start``..``end`` (inclusive)"""
+    rows = {start + timedelta(days=i): dict.fromkeys(COUNTED, 0)
+            for i in range((end - start).days + 1)}
+
+    for model, name in ((User, 'new_users'), (Post, 'new_posts'), (Comment, 'new_comments')):
+        for day, count in _per_day(model, start, end, func.count()):
+            rows[_as_date(day)][name] = count
+    for day, count, size in _per_day(MediaFile, start, end, func.count(),
+                                     func.coalesce(func.sum(MediaFile.file_size), 0)):
+        rows[_as_date(day)].update(new_media=count, media_bytes=size)
+
+    per_user = {}
+    for model, name in ((Post, 'posts'), (Comment, 'comments')):
+        for day, user_id, count in _per_day(model, start, end, func.count(), by_user=True):
+            key = (_as_date(day), user_id)
+            per_user.setdefault(key, {'day': key[0], 'user_id': user_id, 'posts': 0, 'comments': 0})
+            per_user[key][name] = count
+
+    now = datetime.utcnow()
+    values = [dict(counts, day=day, rolled_up_at=now) for day, counts in rows.items()]
+    table = DailyStats.__table__
+    statement = _upsert_insert(table)
+    if statement is not None:
+        statement = statement.on_conflict_do_update(
+            index_elements=['day'],
+            set_={name: statement.excluded[name] for name in COUNTED + ('rolled_up_at',)}
+        )
+        db.session.execute(statement, values)
+    else:
+        existing = set(db.session.scalars(
+            select(table.c.day).where(table.c.day >= start, table.c.day <= end)
+        ))
+        for row in values:
+            if row['day'] in existing:
+                db.session.execute(update(table).where(table.c.day == row['day']).values(row))
+            else:
+                db.session.execute(insert(table).values(row))
+
+    # Unique visitors only while the per-day sketches still exist
+    if redis_client:
+        oldest = datetime.utcnow().date() - timedelta(seconds=DAY_KEY_TTL)
+        visitors = [{'d': day, 'n': unique_visitors(day)} for day in rows if day >= oldest]
+        visitors = [row for row in visitors if row['n']]
+        if visitors:
+            db.session.execute(
+                update(table).where(table.c.day == bindparam('d'))
+                .values(unique_visitors=bindparam('n')),
+                visitors
+            )
+
+    db.session.execute(delete(DailyUserStats).where(
+        DailyUserStats.day >= start, DailyUserStats.day <= end
+    ))
+    if per_user:
+        db.session.execute(insert(DailyUserStats), list(per_user.values()))
+    db.session.commit()
+    return len(rows)
+
+
+def _first_day():
+    """Earliest day with any source row (today for an empty database)"""
+    firsts = [db.session.query(func.min(model.created_at)).scalar()
+              for model in (User, Post, Comment, MediaFile)]
+    firsts = [first for first in firsts if first is not None]
+    return min(firsts).date() if firsts else datetime.utcnow().date()
+
+
+def run_rollup(since=None, lookback=2, chunk_days=31, progress=None):
+    """Bring the rollups up to date; returns the number of days (re)counted.
+
+    Starts at ``since`` if given, else at the last day already counted (or
+    the first day with data), moved back ``lookback`` days from today at
+    most. Each chunk of ``chunk_days`` commits on its own, so an
+    interrupted backfill resumes where it stopped.
+    """
+    today = datetime.utcnow().date()
+    if since is None:
+        since = db.session.query(func.max(DailyStats.day))\
+            .filter(DailyStats.rolled_up_at.isnot(None)).scalar()
+        if since is None:
+            since = _first_day()
+        since = min(since, today - timedelta(days=lookback))
+
+    total = 0
+    start = since
+    while start <= today:
+        end = min(start + timedelta(days=chunk_days - 1), today)
+        total += rollup(start, end)
+        if progress:
+            progress(end)
+        start = end + timedelta(days=1)
+    return total
+
+
+def add_views(views, day=None):
+    """Add flushed page views to ``day`` (default today) in the caller's transaction"""
+    day = day or datetime.utcnow().date()
+    table = DailyStats.__table__
+    statement = _upsert_insert(table)
+    if statement is not None:
+        db.session.execute(
+            statement.values(day=day, views=views).on_conflict_do_update(
+                index_elements=['day'],
+                set_={'views': table.c.views + statement.excluded.views}
+            )
+        )
+        return
+    result = db.session.execute(
+        update(table).where(table.c.day == day).values(views=table.c.views + views)
+    )
+    if not result.rowcount:
+        db.session.execute(insert(table).values(day=day, views=views))
+
+
+SERIES = COUNTED + ('views', 'unique_visitors')
+
+
+def daily_series(start, end):
+    """One dict per day ``start``..``end`` (inclusive); days without a row are zeros"""
+    table = DailyStats.__table__
+    found = {
+        row[0]: row[1:] for row in db.session.execute(
+            select(table.c.day, *(table.c[name] for name in SERIES))
+            .where(table.c.day >= start, table.c.day <= end)
+        )
+    }
+    zeros = (0,) * len(SERIES)
+    series = []
+    for i in range((end - start).days + 1):
+        day = start + timedelta(days=i)
+        entry = dict(zip(SERIES, found.get(day, zeros)))
+        entry['date'] = day.isoformat()
+        series.append(entry)
+    return series
+
+
+def bucketed(series, max_points=120):
+    """Sum consecutive days of a daily_series() so a chart has at most ``max_points`` bars"""
+    size = -(-len(series) // max_points)
+    buckets = []
+    for i in range(0, len(series), size):
+        days = series[i:i + size]
+        bucket = {name: sum(day[name] for day in days) for name in SERIES if name != 'unique_visitors'}
+        bucket['date'] = days[0]['date']
+        buckets.append(bucket)
+    return buckets
+
+
+def user_growth(months, today=None):
+    """Total users at the end of each of the last ``months`` calendar months"""
+    today = today or datetime.utcnow().date()
+    first = today.replace(day=1)
+    for _ in range(months - 1):
+        first = (first - timedelta(days=1)).replace(day=1)
+
+    total = db.session.query(func.coalesce(func.sum(DailyStats.new_users), 0))\
+        .filter(DailyStats.day < first).scalar()
+    by_month = {}
+    for day, new_users in db.session.query(DailyStats.day, DailyStats.new_users)\
+            .filter(DailyStats.day >= first, DailyStats.day <= today):
+        label = day.strftime('%Y-%m')
+        by_month[label] = by_month.get(label, 0) + new_users
+
+    growth = []
+    month = first
+    while month <= today:
+        label = month.strftime('%Y-%m')
+        total += by_month.get(label, 0)
+        growth.append({'month': label, 'count': total})
+        month = (month + timedelta(days=32)).replace(day=1)
+    return growth
+
+
+def top_contributors(start, end, limit=10):
+    """Authors with the most posts between ``start`` and ``end`` (inclusive)"""
+    post_count = func.sum(DailyUserStats.posts).label('post_count')
+    return db.session.query(
+        User.username,
+        User.first_name,
+        User.last_name,
+        post_count
+    ).join(DailyUserStats, DailyUserStats.user_id == User.id)\
+        .filter(DailyUserStats.day >= start, DailyUserStats.day <= end)\
+        .group_by(User.id, User.username, User.first_name, User.last_name)\
+        .having(post_count > 0)\
+        .order_by(post_count.desc())\
+        .limit(limit).all()
+
+
+def last_rollup():
+    """When the rollup job last ran (None if never)"""
+    return db.session.query(func.max(DailyStats.rolled_up_at)).scalar()
@@ -0,0 +1,116 @@
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import desc, func, select
+from sqlalchemy.orm import joinedload, undefer
+from app import db
+from app.models import User, Post, Comment, MediaFile
+from app.snapshots import BackgroundSnapshot
+
+# Admin dashboard snapshot
+#
+# Everything the dashboard shows (table counts, 30-day growth, storage
+# totals, recent activity and the bucket summary) is gathered by
+# collect_snapshot(): the counts in one aggregate statement, the recent
+# rows in three LIMIT 5 index scans, the bucket summary from the storage
+# stats snapshot (app.storage_stats).
+# It is served as a BackgroundSnapshot (app.snapshots), re-collected every
+# DASHBOARD_REFRESH seconds while the dashboard has been viewed within
+# DASHBOARD_IDLE seconds, so rendering the page never touches the big
+# tables or buckets. Only the very first view of a deployment collects it
+# inline, or any view once it is DASHBOARD_IDLE old when DASHBOARD_REFRESH
+# is 0.
+
+
+def _count(model, *criteria):
+    return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+
+def aggregate_statement(since):
+    """One SELECT of scalar subqueries covering every dashboard counter"""
+    return select(
+        _count(User).label('total_users'),
+        _count(Post).label('total_posts'),
+        _count(Comment).label('total_comments'),
+        _count(MediaFile).label('total_media'),
+        _count(User, User.created_at >= since).label('new_users_30d'),
+        _count(Post, Post.created_at >= since).label('new_posts_30d'),
+        select(func.coalesce(func.sum(MediaFile.file_size), 0)).scalar_subquery().label('total_storage'),
+    )
+
+
+def _storage_info():
+    from app.storage_stats import get_stats
+
+    try:
+        gcs_stats = get_stats()
+        return {
+            'total_storage_gb': gcs_stats.get('total_size_gb', 0),
+            'total_files': gcs_stats.get('total_files', 0),
+            'current_bucket': gcs_stats.get('current_bucket', 'N/A'),
+            'buckets_used': len(gcs_stats.get('buckets', [])),
+            'max_buckets': gcs_stats.get('max_buckets', 10)
+        }
+    except Exception as e:
+        logging.error(f"Collecting storage stats for the dashboard failed: {e}")
+        return {
+            'total_storage_gb': 0,
+            'total_files': 0,
+            'current_bucket': 'Error',
+            'buckets_used': 0,
+            'max_buckets': 10
+        }
+
+
+def collect_snapshot():
+    """Gather a fresh snapshot (plain, JSON-serializable values only)"""
+    counts = db.session.execute(
+        aggregate_statement(datetime.utcnow() - timedelta(days=30))
+    ).one()._asdict()
+    total_storage = counts.pop('total_storage') or 0
+
+    recent_users = User.query.order_by(desc(User.created_at)).limit(5).all()
+    recent_posts = Post.query.options(joinedload(Post.author))\
+        .order_by(desc(Post.created_at)).limit(5).all()
+    recent_comments = Comment.query.options(undefer(Comment.content), joinedload(Comment.author))\
+        .order_by(desc(Comment.created_at)).limit(5).all()
+
+    return {
+        'stats': dict(
+            counts,
+            total_storage_mb=round(total_storage / (1024 * 1024), 2),
+            storage_info=_storage_info()
+        ),
+        'recent_users': [
+            {'username': user.username, 'full_name': user.get_full_name(),
+             'avatar_url': user.avatar_url}
+            for user in recent_users
+        ],
+        'recent_posts': [
+            {'id': post.id, 'title': post.title, 'author_name': post.author.get_full_name()}
+            for post in recent_posts
+        ],
+        'recent_comments': [
+            {'excerpt': comment.content[:50] + ('...' if len(comment.content) > 50 else ''),
+             'author_name': comment.author.get_full_name()}
+            for comment in recent_comments
+        ],
+    }
+
+
+_snapshot = BackgroundSnapshot('dashboard:snapshot', collect_snapshot, 'DASHBOARD_REFRESH',
+                               inline=True, lock_timeout=60)
+
+
+def refresh_snapshot():
+    """Collect and publish a new snapshot; returns it"""
+    return _snapshot.refresh()
+
+
+def get_snapshot():
+    """The latest snapshot"""
+    return _snapshot.get()
+
+
+def init_dashboard_stats(app):
+    """Remember the app so the refresher thread can open app contexts"""
+    _snapshot.init_app(app)
@@ -0,0 +1,387 @@
+import heapq
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+from array import array
+from collections import Counter
+from functools import lru_cache
+from itertools import accumulate
+
+# Embedded full-text engine: an in-memory inverted index with BM25 ranking.
+#
+# Every indexed document gets an internal document number, assigned in
+# increasing order, so postings only ever grow at the end. Per term the
+# postings are two arrays: the gaps between successive document numbers
+# (stored in the narrowest typecode that holds them, widened on demand) and
+# the term frequencies (saturating at 255, where BM25 has long flattened
+# out). Re-indexing or removing a document tombstones its old number;
+# compact() drops tombstones once they make up a quarter of the index.
+#
+# Nothing here knows about Flask or the database; app/search.py feeds it.
+
+SNAPSHOT_FORMAT = 1
+
+TOKEN = re.compile(r'[^\W_]+', re.UNICODE)
+_GAP_TYPECODES = ('B', 'H', 'I', 'Q')
+_GAP_LIMITS = {typecode: 2 ** (8 * array(typecode).itemsize) for typecode in _GAP_TYPECODES}
+_MAX_TF = 255
+
+
+def tokenize(text):
+    return TOKEN.findall((text or '').lower())
+
+
+def analyze(text):
+    """Lower-cased, stemmed terms of ``text`` in order"""
+    return [stem(token) for token in tokenize(text)]
+
+
+# Porter stemmer (M.F. Porter, 1980, with the published 'bli'/'logi' revisions)
+
+_STEP2 = (('ational', 'ate'), ('tional', 'tion'), ('enci', 'ence'), ('anci', 'ance'),
+          ('izer', 'ize'), ('bli', 'ble'), ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'),
+          ('ousli', 'ous'), ('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate'),
+          ('alism', 'al'), ('iveness', 'ive'), ('fulness', 'ful'), ('ousness', 'ous'),
+          ('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble'), ('logi', 'log'))
+_STEP3 = (('icate', 'ic'), ('ative', ''), ('alize', 'al'), ('iciti', 'ic'), ('ical', 'ic'),
+          ('ful', ''), ('ness', ''))
+_STEP4 = ('al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment', 'ent',
+          'ion', 'ou', 'ism', 'ate', 'iti', 'ous', 'ive', 'ize')
+
+
+def _consonant(word, i):
+    ch = word[i]
+    if ch in 'aeiou':
+        return False
+    if ch == 'y':
+        return i == 0 or not _consonant(word, i - 1)
+    return True
+
+
+def _measure(word):
+    """Number of vowel-consonant sequences in ``word``"""
+    m = 0
+    after_vowel = False
+    for i in range(len(word)):
+        vowel = not _consonant(word, i)
+        if after_vowel and not vowel:
+            m += 1
+        after_vowel = vowel
+    return m
+
+
+def _has_vowel(word):
+    return any(not _consonant(word, i) for i in range(len(word)))
+
+
+def _double_consonant(word):
+    return len(word) > 1 and word[-1] == word[-2] and _consonant(word, len(word) - 1)
+
+
+def _cvc(word):
+    return (len(word) > 2 and _consonant(word, len(word) - 3)
+            and not _consonant(word, len(word) - 2) and _consonant(word, len(word) - 1)
+            and word[-1] not in 'wxy')
+
+
+def _replace(word, rules, min_measure):
+    for suffix, replacement in rules:
+        if word.endswith(suffix):
+            base = word[:-len(suffix)]
+            return base + replacement if _measure(base) > min_measure else word
+    return word
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    if len(word) <= 2 or not word.isalpha():
+        return word
+
+    # Step 1a: plurals
+    if word.endswith('sses') or word.endswith('ies'):
+        word = word[:-2]
+    elif word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+
+    # Step 1b: -eed, -ed, -ing
+    if word.endswith('eed'):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+    else:
+        for suffix in ('ed', 'ing'):
+            if word.endswith(suffix) and _has_vowel(word[:-len(suffix)]):
+                word = word[:-len(suffix)]
+                if word.endswith(('at', 'bl', 'iz')):
+                    word += 'e'
+                elif _double_consonant(word) and word[-1] not in 'lsz':
+                    word = word[:-1]
+                elif _measure(word) == 1 and _cvc(word):
+                    word += 'e'
+                break
+
+    # Step 1c: y -> i
+    if word.endswith('y') and _has_vowel(word[:-1]):
+        word = word[:-1] + 'i'
+
+    word = _replace(word, _STEP2, 0)
+    word = _replace(word, _STEP3, 0)
+
+    # Step 4: strip suffixes from long stems
+    for suffix in _STEP4:
+        if word.endswith(suffix):
+            base = word[:-len(suffix)]
+            if _measure(base) > 1 and (suffix != 'ion' or base.endswith(('s', 't'))):
+                word = base
+            break
+
+    # Step 5: tidy a trailing -e and -ll
+    if word.endswith('e'):
+        base = word[:-1]
+        m = _measure(base)
+        if m > 1 or (m == 1 and not _cvc(base)):
+            word = base
+    if word.endswith('ll') and _measure(word) > 1:
+        word = word[:-1]
+    return word
+
+
+class InvertedIndex:
+    """Thread-safe inverted index over documents with weighted text fields
+
+    ``fields`` maps field names to integer weights; a term occurring in a
+    field of weight w counts w times towards its frequency and the
+    document length (a simple BM25F).
+    """
+
+    def __init__(self, fields, k1=1.2, b=0.75):
+        self.fields = dict(fields)
+        self.k1 = k1
+        self.b = b
+        self.changes = 0
+        self._postings = {}          # term -> [gaps array, tfs array, last docno]
+        self._doc_ids = array('q')   # docno -> external id, -1 once tombstoned
+        self._doc_lens = array('d')  # docno -> weighted length
+        self._docnos = {}            # external id -> live docno
+        self._versions = {}          # external id -> caller-supplied version
+        self._total_len = 0.0
+        self._dead = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docnos)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docnos
+
+    def ids(self):
+        with self._lock:
+            return list(self._docnos)
+
+    def version(self, doc_id):
+        return self._versions.get(doc_id)
+
+    def add(self, doc_id, fields, version=None):
+        """Index (or re-index) ``doc_id`` from a mapping of field name to text"""
+        freqs = Counter()
+        length = 0
+        for name, weight in self.fields.items():
+            terms = analyze(fields.get(name))
+            length += weight * len(terms)
+            for term in terms:
+                freqs[term] += weight
+        with self._lock:
+            self._tombstone(doc_id)
+            docno = len(self._doc_ids)
+            self._doc_ids.append(doc_id)
+            self._doc_lens.append(length)
+            self._docnos[doc_id] = docno
+            self._versions[doc_id] = version
+            self._total_len += length
+            for term, freq in freqs.items():
+                self._append(term, docno, min(freq, _MAX_TF))
+            self.changes += 1
+            self._maybe_compact()
+
+    def remove(self, doc_id):
+        with self._lock:
+            removed = self._tombstone(doc_id)
+            if removed:
+                self.changes += 1
+                self._maybe_compact()
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._postings = {}
+            self._doc_ids = array('q')
+            self._doc_lens = array('d')
+            self._docnos = {}
+            self._versions = {}
+            self._total_len = 0.0
+            self._dead = 0
+            self.changes += 1
+
+    def _maybe_compact(self):
+        if self._dead > 64 and self._dead * 4 > len(self._doc_ids):
+            self.compact()
+
+    def _tombstone(self, doc_id):
+        docno = self._docnos.pop(doc_id, None)
+        if docno is None:
+            return False
+        self._versions.pop(doc_id, None)
+        self._doc_ids[docno] = -1
+        self._total_len -= self._doc_lens[docno]
+        self._dead += 1
+        return True
+
+    def _append(self, term, docno, tf):
+        entry = self._postings.get(term)
+        if entry is None:
+            self._postings[term] = [array('B', [docno]) if docno < 256 else _gaps([docno]),
+                                    array('B', [tf]), docno]
+            return
+        gaps, tfs, last = entry
+        gap = docno - last
+        if gap >= _GAP_LIMITS[gaps.typecode]:
+            gaps = entry[0] = _gaps(gaps, gap)
+        gaps.append(gap)
+        tfs.append(tf)
+        entry[2] = docno
+
+    def compact(self):
+        """Renumber live documents and drop tombstoned postings"""
+        with self._lock:
+            if not self._dead:
+                return
+            renumber = {}
+            doc_ids, doc_lens = array('q'), array('d')
+            for docno, doc_id in enumerate(self._doc_ids):
+                if doc_id >= 0:
+                    renumber[docno] = len(doc_ids)
+                    doc_ids.append(doc_id)
+                    doc_lens.append(self._doc_lens[docno])
+            postings = {}
+            for term, (gaps, tfs, _) in self._postings.items():
+                kept = [(renumber[docno], tf) for docno, tf in zip(accumulate(gaps), tfs)
+                        if docno in renumber]
+                if not kept:
+                    continue
+                docnos = [docno for docno, _ in kept]
+                postings[term] = [_gaps([b - a for a, b in zip([0] + docnos, docnos)]),
+                                  array('B', (tf for _, tf in kept)), docnos[-1]]
+            self._postings = postings
+            self._doc_ids = doc_ids
+            self._doc_lens = doc_lens
+            self._docnos = {doc_id: docno for docno, doc_id in enumerate(doc_ids)}
+            self._dead = 0
+
+    def search(self, query, limit=10):
+        """BM25 top-``limit`` documents containing every query term
+
+        Returns ``([(doc_id, score), ...], total_matches)``, best first, ties
+        going to the most recently indexed document.
+        """
+        terms = set(analyze(query))
+        if not terms:
+            return [], 0
+        with self._lock:
+            live = len(self._docnos)
+            entries = [self._postings.get(term) for term in terms]
+            if not live or None in entries:
+                return [], 0
+            avg_len = self._total_len / live or 1.0
+            doc_ids, doc_lens, k1, b = self._doc_ids, self._doc_lens, self.k1, self.b
+            scores = None
+            # Rarest term first: it bounds the candidate set the others refine
+            for gaps, tfs, _ in sorted(entries, key=lambda entry: len(entry[1])):
+                df = len(tfs)
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                term_scores = {}
+                for docno, tf in zip(accumulate(gaps), tfs):
+                    if (scores is None or docno in scores) and doc_ids[docno] >= 0:
+                        norm = k1 * (1 - b + b * doc_lens[docno] / avg_len)
+                        term_scores[docno] = idf * tf * (k1 + 1) / (tf + norm)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {docno: score + term_scores[docno]
+                              for docno, score in scores.items() if docno in term_scores}
+                if not scores:
+                    return [], 0
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+            return [(doc_ids[docno], score) for docno, score in top], len(scores)
+
+    def save(self, path):
+        """Write a compacted snapshot atomically (temp file + rename)"""
+        with self._lock:
+            self.compact()
+            state = {
+                'format': SNAPSHOT_FORMAT,
+                'fields': self.fields,
+                'postings': self._postings,
+                'doc_ids': self._doc_ids,
+                'doc_lens': self._doc_lens,
+                'versions': self._versions,
+                'total_len': self._total_len,
+            }
+            directory = os.path.dirname(os.path.abspath(path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.search-snapshot-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self.changes = 0
+
+    def load(self, path):
+        """Replace the contents with a snapshot written by save()
+
+        Returns False (leaving the index untouched) if the snapshot is
+        missing or was written for another format or field set. Only load
+        snapshots this application wrote itself: they are pickles.
+        """
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        if state.get('format') != SNAPSHOT_FORMAT or state.get('fields') != self.fields:
+            return False
+        with self._lock:
+            self._postings = state['postings']
+            self._doc_ids = state['doc_ids']
+            self._doc_lens = state['doc_lens']
+            self._docnos = {doc_id: docno for docno, doc_id in enumerate(self._doc_ids)}
+            self._versions = state['versions']
+            self._total_len = state['total_len']
+            self._dead = 0
+            self.changes = 0
+        return True
+
+    def stats(self):
+        with self._lock:
+            postings = sum(len(tfs) for _, tfs, _ in self._postings.values())
+            size = sum(gaps.itemsize * len(gaps) + len(tfs)
+                       for gaps, tfs, _ in self._postings.values())
+            return {
+                'documents': len(self._docnos),
+                'tombstones': self._dead,
+                'terms': len(self._postings),
+                'postings': postings,
+                'postings_bytes': size,
+            }
+
+
+def _gaps(values, at_least=0):
+    """Array of document-number gaps in the narrowest typecode that fits"""
+    largest = max(max(values, default=0), at_least)
+    for typecode in _GAP_TYPECODES:
+        if largest < _GAP_LIMITS[typecode]:
+            return array(typecode, values)
+    raise OverflowError(largest)
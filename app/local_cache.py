@@ -0,0 +1,168 @@
+import os
+import socket
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+# Per-worker L1 cache sitting in front of Redis.
+#
+# Entries are decoded Python values, so an L1 hit skips both the Redis round
+# trip and JSON decoding. Workers keep each other coherent by publishing the
+# keys they write or delete on a Redis pub/sub channel; every subscriber drops
+# those keys from its own L1. Entry TTLs bound staleness if a message is lost.
+
+local_cache = None
+
+
+class LocalCache:
+    """Thread-safe LRU cache bounded by entry count and total payload bytes"""
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, default_ttl=30):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size, ttl=None):
+        """Store ``value``; ``size`` is the encoded payload length in bytes"""
+        if size > self.max_bytes:
+            return False
+        ttl = self.default_ttl if ttl is None else min(ttl, self.default_ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+_settings = None  # (redis_client, channel) once init_local_cache() has run
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def worker_id():
+    """Identify this process in invalidation messages ("<host>:<pid>")"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def publish_invalidation(*keys):
+    """Tell every other worker to drop ``keys`` from its L1"""
+    if not _settings or not keys:
+        return
+    redis_client, channel = _settings
+    sender = worker_id()
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.publish(channel, f"{sender} {key}")
+        pipe.execute()
+    except Exception as e:
+        logging.warning(f"Cache invalidation publish failed: {e}")
+
+
+def _listen(redis_client, channel, cache):
+    """Subscriber loop; clears the whole L1 whenever messages may have been lost"""
+    me = worker_id()
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(channel)
+            for message in pubsub.listen():
+                data = message.get('data')
+                if isinstance(data, bytes):
+                    data = data.decode()
+                sender, _, key = data.partition(' ')
+                if sender != me:
+                    cache.delete(key)
+        except Exception as e:
+            logging.warning(f"Cache invalidation listener disconnected: {e}")
+        cache.clear()
+        time.sleep(1)
+
+
+def get_local_cache():
+    """Return this worker's L1 (None when disabled)
+
+    The subscriber thread is started on first use in each process so that
+    workers forked after create_app() still receive invalidations.
+    """
+    global _listener_pid
+    if local_cache is None or _listener_pid == os.getpid():
+        return local_cache
+    with _listener_lock:
+        if _listener_pid != os.getpid():
+            local_cache.clear()
+            redis_client, channel = _settings
+            threading.Thread(
+                target=_listen,
+                args=(redis_client, channel, local_cache),
+                name='cache-invalidation',
+                daemon=True
+            ).start()
+            _listener_pid = os.getpid()
+    return local_cache
+
+
+def init_local_cache(app, redis_client):
+    """Enable the L1 tier for this app using the CACHE_L1_* settings"""
+    global local_cache, _settings
+    _settings = (redis_client, app.config['CACHE_INVALIDATION_CHANNEL'])
+    local_cache = LocalCache(
+        max_entries=app.config['CACHE_L1_MAX_ENTRIES'],
+        max_bytes=app.config['CACHE_L1_MAX_BYTES'],
+        default_ttl=app.config['CACHE_L1_TTL']
+    )
+    return local_cache
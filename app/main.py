@@ -1,12 +1,21 @@
 import os
+import hashlib
+import tempfile
 from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app, jsonify, send_from_directory
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from app import db
+from app import db, repositories
 from app.models import User, Post, Comment, MediaFile
+from app.view_counts import prefetch_pending_views
+from app.unique_views import record_unique_view, unique_view_counts
+from app.search import get_search_backend
+from app.media_store import get_media_backend, media_key
+from app.typeahead import MIN_QUERY_LENGTH, suggest
 from app.utils import (allowed_file, get_file_type, generate_unique_filename, 
-                      compress_image, upload_to_s3, validate_file_content, 
-                      get_file_size_mb, cache_get, cache_set, cache_delete)
+                      compress_image, validate_file_content, 
+                      get_file_size_mb, cache_delete, cache_key, cache_keys,
+                      cache_bump, cache_get_many, cached, keyset_paginate,
+                      encode_cursor)
 from datetime import datetime
 from sqlalchemy import desc
 
@@ -15,52 +24,87 @@ bp = Blueprint('main', __name__)
 @bp.route('/')
 def index():
     page = request.args.get('page', 1, type=int)
-    
-    # Try to get from cache first
-    cache_key = f"feed_page_{page}"
-    cached_posts = cache_get(cache_key)
-    
-    if cached_posts:
-        posts = cached_posts
-    else:
-        # Get posts with pagination
-        posts_query = Post.query.filter_by(is_published=True).order_by(desc(Post.created_at))
-        posts_pagination = posts_query.paginate(
-            page=page, 
-            per_page=current_app.config['POSTS_PER_PAGE'],
-            error_out=False
-        )
+    cursor = request.args.get('cursor')
+    
+    def load_feed_page():
+        published = Post.query.filter_by(is_published=True)
+        if cursor is not None:
+            # Keyset mode: constant cost no matter how deep the page is
+            posts_pagination = keyset_paginate(
+                published, Post, cursor,
+                per_page=current_app.config['POSTS_PER_PAGE']
+            )
+        else:
+            # Get posts with pagination
+            posts_query = published.order_by(desc(Post.created_at), desc(Post.id))
+            posts_pagination = posts_query.paginate(
+                page=page, 
+                per_page=current_app.config['POSTS_PER_PAGE'],
+                error_out=False
+            )
         
-        posts = {
-            'items': [
-                {
-                    'id': post.id,
-                    'title': post.title,
-                    'content_html': post.content_html,
-                    'summary': post.summary,
-                    'author': post.author.get_full_name(),
-                    'author_username': post.author.username,
-                    'created_at': post.created_at.strftime('%Y-%m-%d %H:%M'),
-                    'view_count': post.view_count,
-                    'comment_count': post.comments.count()
-                } for post in posts_pagination.items
-            ],
+        return {
+            'ids': [post.id for post in posts_pagination.items],
             'has_next': posts_pagination.has_next,
             'has_prev': posts_pagination.has_prev,
             'next_num': posts_pagination.next_num,
             'prev_num': posts_pagination.prev_num,
-            'page': page,
+            'next_cursor': _next_cursor(posts_pagination),
+            'page': posts_pagination.page,
             'pages': posts_pagination.pages
         }
-        
-        # Cache for 5 minutes
-        cache_set(cache_key, posts, 300)
+    
+    # Cached for 5 minutes; only one worker rebuilds an expired page
+    if cursor is not None:
+        feed_key = cache_key('feed', 'cursor', cursor or 'start')
+    else:
+        feed_key = cache_key('feed', 'page', page)
+    page_info = cached(feed_key, load_feed_page, timeout=300)
+    posts = dict(page_info, items=_post_cards(page_info['ids']))
     
     # Get recent media files
     recent_media = MediaFile.query.order_by(desc(MediaFile.created_at)).limit(6).all()
     
     return render_template('index.html', posts=posts, recent_media=recent_media)
 
+def _post_card(post):
+    return {
+        'id': post.id,
+        'title': post.title,
+        'summary_html': post.get_summary_html(),
+        'summary': post.summary,
+        'author': post.author.get_full_name(),
+        'author_username': post.author.username,
+        'created_at': post.created_at.strftime('%Y-%m-%d %H:%M'),
+        'view_count': post.get_view_count(),
+        'approved_comment_count': post.approved_comment_count
+    }
+
+def _post_cards(post_ids):
+    """Feed cards for ``post_ids`` in order, cached per post
+
+    Generations and cards are each fetched with one MGET and missing cards
+    are built from a single query, so the Redis round trips per page stay
+    constant whatever the page size.
+    """
+    keys = dict(zip(cache_keys([f"post:{post_id}" for post_id in post_ids], 'card'), post_ids))
+    
+    def load_cards(missing):
+        ids = [keys[key] for key in missing]
+        posts = prefetch_pending_views(repositories.post_cards(ids).all())
+        by_id = {post.id: _post_card(post) for post in posts}
+        return {key: by_id[keys[key]] for key in missing if keys[key] in by_id}
+    
+    cards = cache_get_many(keys, loader=load_cards, timeout=300)
+    return [cards[key] for key in keys if key in cards]
+
+def _next_cursor(pagination):
+    """Cursor for the page after ``pagination`` in either pagination mode"""
+    if getattr(pagination, 'next_cursor', None) or not pagination.has_next:
+        return getattr(pagination, 'next_cursor', None)
+    last = pagination.items[-1]
+    return encode_cursor(last.created_at, last.id)
+
 @bp.route('/upload', methods=['GET', 'POST'])
 @login_required
 def upload_media():
@@ -84,8 +128,9 @@ def upload_media():
             upload_dir = current_app.config['UPLOAD_FOLDER']
             os.makedirs(upload_dir, exist_ok=True)
             
-            # Save file temporarily
-            temp_path = os.path.join(upload_dir, filename)
+            # Save file temporarily (keeping the extension for validation)
+            fd, temp_path = tempfile.mkstemp(dir=upload_dir, prefix='incoming-', suffix=f'-{filename}')
+            os.close(fd)
             file.save(temp_path)
             
             # Validate file content
@@ -108,20 +153,19 @@ def upload_media():
             if file_type == 'image':
                 compress_image(temp_path)
             
-            # Upload to S3 if configured
-            s3_key = None
-            s3_url = None
-            if current_app.config.get('AWS_S3_BUCKET'):
-                s3_key, s3_url = upload_to_s3(
-                    temp_path, 
-                    filename, 
-                    current_app.config['AWS_S3_BUCKET']
-                )
-                
-                # Remove local file if S3 upload successful
-                if s3_url:
-                    os.remove(temp_path)
-                    temp_path = None
+            # Store it through the configured backend (STORAGE_BACKEND)
+            backend = get_media_backend()
+            key = media_key(filename)
+            try:
+                with open(temp_path, 'rb') as f:
+                    # The key to record (gcs qualifies it with its bucket)
+                    key = backend.put(key, f, mime_type).key
+            except Exception as e:
+                current_app.logger.error(f"Storing upload {key} failed: {e}")
+                flash('Upload failed, please try again.', 'error')
+                return redirect(request.url)
+            finally:
+                os.remove(temp_path)
             
             # Create media file record
             media_file = MediaFile(
@@ -130,9 +174,9 @@ def upload_media():
                 file_type=file_type,
                 file_size=int(file_size_mb * 1024 * 1024),
                 mime_type=mime_type,
-                s3_key=s3_key,
-                s3_url=s3_url,
-                local_path=temp_path,
+                s3_key=key,
+                s3_url=backend.url(key) if backend.remote else None,
+                local_path=backend.path(key) if backend.name == 'local' else None,
                 description=description,
                 user_id=current_user.id
             )
@@ -153,18 +197,19 @@ def upload_media():
 @bp.route('/media')
 def media_gallery():
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     file_type = request.args.get('type', 'all')
     
-    query = MediaFile.query
-    
-    if file_type != 'all':
-        query = query.filter_by(file_type=file_type)
+    query = repositories.media_files(file_type if file_type != 'all' else None)
     
-    media_files = query.order_by(desc(MediaFile.created_at)).paginate(
-        page=page,
-        per_page=12,
-        error_out=False
-    )
+    if cursor is not None:
+        media_files = keyset_paginate(query, MediaFile, cursor, per_page=current_app.config['MEDIA_PER_PAGE'])
+    else:
+        media_files = query.order_by(desc(MediaFile.created_at), desc(MediaFile.id)).paginate(
+            page=page,
+            per_page=current_app.config['MEDIA_PER_PAGE'],
+            error_out=False
+        )
     
     return render_template('media_gallery.html', media_files=media_files, current_type=file_type)
 
@@ -191,9 +236,8 @@ def create_blog():
         db.session.add(post)
         db.session.commit()
         
-        # Clear cache
-        for page in range(1, 6):  # Clear first 5 pages of cache
-            cache_delete(f"feed_page_{page}")
+        # Invalidate every cached feed page
+        cache_bump('feed')
         
         flash('Blog post created successfully!', 'success')
         return redirect(url_for('main.blog_detail', id=post.id))
@@ -202,27 +246,44 @@ def create_blog():
 
 @bp.route('/blog/<int:id>')
 def blog_detail(id):
-    post = Post.query.get_or_404(id)
+    post = repositories.post_detail(id).first_or_404()
     
     # Increment view count
     post.increment_view_count()
+    unique_views = None
+    if current_app.config['ENABLE_UNIQUE_VIEWS']:
+        record_unique_view(post.id, _visitor_id())
+        unique_views = unique_view_counts([post.id])[post.id]
     
     # Get comments with pagination
     page = request.args.get('page', 1, type=int)
-    comments = Comment.query.filter_by(post_id=id, is_approved=True)\
-                           .order_by(desc(Comment.created_at))\
-                           .paginate(
-                               page=page,
-                               per_page=current_app.config['COMMENTS_PER_PAGE'],
-                               error_out=False)
+    cursor = request.args.get('cursor')
+    approved_comments = repositories.post_comments(id)
+    if cursor is not None:
+        comments = keyset_paginate(approved_comments, Comment, cursor,
+                                   per_page=current_app.config['COMMENTS_PER_PAGE'])
+    else:
+        comments = approved_comments.order_by(desc(Comment.created_at), desc(Comment.id))\
+                                    .paginate(
+                                        page=page,
+                                        per_page=current_app.config['COMMENTS_PER_PAGE'],
+                                        error_out=False)
     
     # Get related posts by the same author
-    related_posts = Post.query.filter_by(user_id=post.user_id, is_published=True)\
+    related_posts = repositories.author_posts(post.user_id)\
                              .filter(Post.id != post.id)\
                              .order_by(desc(Post.created_at))\
                              .limit(3).all()
     
-    return render_template('blog_detail.html', post=post, comments=comments, related_posts=related_posts)
+    return render_template('blog_detail.html', post=post, comments=comments, related_posts=related_posts,
+                           unique_views=unique_views)
+
+def _visitor_id():
+    """Stable visitor identity for unique-view counting (never stored in clear)"""
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    fingerprint = f"{request.remote_addr}|{request.user_agent.string}"
+    return 'anon:' + hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
 
 
 @bp.route('/blog/<int:id>/comment', methods=['POST'])
@@ -244,6 +305,9 @@ def add_comment(id):
     db.session.add(comment)
     db.session.commit()
     
+    # Refresh the post's cached feed card (comment count)
+    cache_bump(f"post:{id}")
+    
     flash('Comment added successfully!', 'success')
     return redirect(url_for('main.blog_detail', id=id))
 
@@ -266,9 +330,8 @@ def edit_blog(id):
         
         db.session.commit()
         
-        # Clear cache
-        for page in range(1, 6):
-            cache_delete(f"feed_page_{page}")
+        # Invalidate every cached feed page
+        cache_bump('feed', f"post:{post.id}")
         
         flash('Blog post updated successfully!', 'success')
         return redirect(url_for('main.blog_detail', id=id))
@@ -288,9 +351,8 @@ def delete_blog(id):
     db.session.delete(post)
     db.session.commit()
     
-    # Clear cache
-    for page in range(1, 6):
-        cache_delete(f"feed_page_{page}")
+    # Invalidate every cached feed page
+    cache_bump('feed', f"post:{id}")
     
     flash('Blog post deleted successfully!', 'success')
     return redirect(url_for('main.index'))
@@ -301,7 +363,7 @@ def user_profile(username):
     
     # Get user's posts
     page = request.args.get('page', 1, type=int)
-    posts = Post.query.filter_by(user_id=user.id, is_published=True)\
+    posts = repositories.author_posts(user.id)\
                      .order_by(desc(Post.created_at))\
                      .paginate(
                          page=page,
@@ -324,50 +386,79 @@ def search():
     if not query:
         return render_template('search_results.html', posts=None, media_files=None, query='')
     
-    # Search posts
-    posts = Post.query.filter(
-        Post.title.contains(query) | Post.content.contains(query),
-        Post.is_published == True
-    ).order_by(desc(Post.created_at)).paginate(
-        page=page,
-        per_page=current_app.config['POSTS_PER_PAGE'],
-        error_out=False
-    )
-    
-    # Search media files
-    media_files = MediaFile.query.filter(
-        MediaFile.description.contains(query) | MediaFile.original_filename.contains(query)
-    ).order_by(desc(MediaFile.created_at)).limit(10).all()
+    # Ranked full-text search (see app/search.py for the backends)
+    backend = get_search_backend()
+    posts = backend.search_posts(query, page=page, per_page=current_app.config['POSTS_PER_PAGE'])
+    media_files = backend.search_media(query, limit=10)
     
     return render_template('search_results.html', posts=posts, media_files=media_files, query=query)
 
+@bp.route('/api/search')
+def api_search():
+    """Search-as-you-type suggestions (posts, users, media) for static/js/main.js"""
+    query = request.args.get('q', '').strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return jsonify([])
+    
+    results = suggest(query, _visitor_id(), limit=current_app.config['TYPEAHEAD_RESULTS'])
+    if results is None:
+        # Too soon after this client's previous lookup; a debounced client never gets here
+        response = jsonify([])
+        response.status_code = 429
+        response.headers['Retry-After'] = '1'
+        return response
+    return jsonify(results)
+
+# What /api/posts returns per post, in order
+API_POST_FIELDS = {
+    'id': lambda post: post.id,
+    'title': lambda post: post.title,
+    'content_html': lambda post: post.content_html,
+    'summary_html': lambda post: post.get_summary_html(),
+    'author': lambda post: post.author.get_full_name(),
+    'created_at': lambda post: post.created_at.isoformat(),
+    'view_count': lambda post: post.get_view_count(),
+}
+
 @bp.route('/api/posts')
 def api_posts():
-    """API endpoint for posts - useful for AJAX loading"""
+    """API endpoint for posts - useful for AJAX loading
+
+    Pass ``cursor`` (empty for the first page) to use keyset pagination;
+    ``page`` is still accepted for backwards compatibility. ``fields`` (a
+    comma-separated subset of API_POST_FIELDS) trims each post; leaving out
+    content_html keeps full bodies out of the query.
+    """
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
+    fields = request.args.get('fields')
+    if fields:
+        wanted = fields.split(',')
+        fields = [name for name in API_POST_FIELDS if name in wanted]
+    else:
+        fields = list(API_POST_FIELDS)
+    published = repositories.published_posts(with_html='content_html' in fields)
     
-    posts = Post.query.filter_by(is_published=True)\
-                     .order_by(desc(Post.created_at))\
-                     .paginate(
-                         page=page,
-                         per_page=current_app.config['POSTS_PER_PAGE'],
-                         error_out=False
-                     )
+    if cursor is not None:
+        posts = keyset_paginate(published, Post, cursor,
+                                per_page=current_app.config['POSTS_PER_PAGE'])
+    else:
+        posts = published.order_by(desc(Post.created_at), desc(Post.id))\
+                         .paginate(
+                             page=page,
+                             per_page=current_app.config['POSTS_PER_PAGE'],
+                             error_out=False
+                         )
     
     return jsonify({
         'posts': [
-            {
-                'id': post.id,
-                'title': post.title,
-                'content_html': post.content_html,
-                'author': post.author.get_full_name(),
-                'created_at': post.created_at.isoformat(),
-                'view_count': post.view_count
-            } for post in posts.items
+            {name: API_POST_FIELDS[name](post) for name in fields}
+            for post in prefetch_pending_views(posts.items)
         ],
         'has_next': posts.has_next,
         'has_prev': posts.has_prev,
-        'page': page,
+        'next_cursor': _next_cursor(posts),
+        'page': posts.page,
         'pages': posts.pages
     })
 
@@ -0,0 +1,36 @@
+from storage_backends import create_backend
+
+# Where uploaded media is stored
+#
+# One storage_backends.StorageBackend per app, picked by STORAGE_BACKEND.
+# Media objects live under 'uploads/<filename>'. MediaFile rows record the
+# key put() returned in s3_key whatever the backend (on gcs it names the
+# bucket too), plus s3_url for remote backends and local_path for the local
+# one.
+
+media_backend = None
+
+
+def media_key(filename):
+    return f"uploads/{filename}"
+
+
+def stored_key(media_file):
+    """The backend key of a MediaFile's object (None if it was never stored)"""
+    if media_file.s3_key:
+        return media_file.s3_key
+    # Local uploads from before the backends recorded only their path
+    if media_file.local_path:
+        return media_key(media_file.filename)
+    return None
+
+
+def get_media_backend():
+    return media_backend
+
+
+def init_media_store(app):
+    """Create the storage backend for this app (see STORAGE_BACKEND)"""
+    global media_backend
+    media_backend = create_backend(app.config)
+    return media_backend
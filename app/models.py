@@ -1,10 +1,11 @@
+import hashlib
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-import bleach
-import markdown
+from sqlalchemy import event, func, inspect, select, update
 from app import db
+from app.rendering import RENDERER_VERSION, render_comment, render_post, summary_source
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -20,6 +21,10 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Denormalized counters (published posts / approved comments)
+    published_post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    approved_comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relationships
     posts = db.relationship('Post', backref='author', lazy='dynamic', cascade='all, delete-orphan')
     comments = db.relationship('Comment', backref='author', lazy='dynamic', cascade='all, delete-orphan')
@@ -40,14 +45,26 @@ class User(UserMixin, db.Model):
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text, nullable=False)
-    content_html = db.Column(db.Text)
+    # The body (up to tens of KB) is deferred: list queries never fetch it and
+    # single-post views load it with undefer_group('body')
+    content = db.deferred(db.Column(db.Text, nullable=False), group='body')
+    content_html = db.deferred(db.Column(db.Text), group='body')
+    render_version = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
     summary = db.Column(db.String(300))
+    summary_html = db.Column(db.Text)  # rendered summary (or start of the body) for feeds
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    is_published = db.Column(db.Boolean, default=True)
+    # Digest of title and content, set on every write that changes them; the
+    # in-process search index versions posts by it (updated_at also moves on
+    # view and counter updates)
+    content_hash = db.Column(db.String(16))
+    # active_history keeps the previous value around for the counter hooks
+    is_published = db.column_property(db.Column(db.Boolean, default=True), active_history=True)
     view_count = db.Column(db.Integer, default=0)
     
+    # Denormalized counter (approved comments)
+    approved_comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Foreign keys
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     
@@ -60,36 +77,42 @@ class Post(db.Model):
         self.generate_html()
     
     def generate_html(self):
-        allowed_tags = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
-                       'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
-                       'h1', 'h2', 'h3', 'p', 'br', 'img']
-        allowed_attrs = {
-            '*': ['class'],
-            'a': ['href', 'rel'],
-            'img': ['src', 'alt', 'width', 'height']
-        }
-        self.content_html = bleach.linkify(
-            bleach.clean(
-                markdown.markdown(self.content, output_format='html'),
-                tags=allowed_tags,
-                attributes=allowed_attrs,
-                strip=True
-            )
-        )
+        self.content_html = render_post(self.content)
+        self.summary_html = render_post(summary_source(self.summary, self.content))
+        self.render_version = RENDERER_VERSION
+    
+    def get_summary_html(self):
+        """Rendered feed summary, rendered on the spot for rows rerender-html has not filled in yet
+
+        The fallback may load the deferred body of such a post.
+        """
+        if self.summary_html is None:
+            return render_post(summary_source(self.summary, self.content))
+        return self.summary_html
     
     def increment_view_count(self):
-        self.view_count += 1
-        db.session.commit()
+        """Buffer a view; flush_views() later applies it to view_count in bulk"""
+        from app.view_counts import record_view
+        record_view(self.id)
+    
+    def get_view_count(self):
+        """Stored view count plus views not yet flushed to the database"""
+        pending = getattr(self, '_pending_views', None)
+        if pending is None:
+            from app.view_counts import pending_views
+            pending = pending_views([self.id]).get(self.id, 0)
+        return (self.view_count or 0) + pending
     
     def __repr__(self):
         return f'<Post {self.title}>'
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    content = db.Column(db.Text, nullable=False)
-    content_html = db.Column(db.Text)
+    content = db.deferred(db.Column(db.Text, nullable=False), group='body')
+    content_html = db.deferred(db.Column(db.Text), group='body')
+    render_version = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
-    is_approved = db.Column(db.Boolean, default=True)
+    is_approved = db.column_property(db.Column(db.Boolean, default=True), active_history=True)
     
     # Foreign keys
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
@@ -100,18 +123,8 @@ class Comment(db.Model):
         self.generate_html()
     
     def generate_html(self):
-        allowed_tags = ['a', 'abbr', 'acronym', 'b', 'code', 'em', 'i', 'strong', 'br', 'p']
-        allowed_attrs = {
-            'a': ['href', 'rel']
-        }
-        self.content_html = bleach.linkify(
-            bleach.clean(
-                markdown.markdown(self.content, output_format='html'),
-                tags=allowed_tags,
-                attributes=allowed_attrs,
-                strip=True
-            )
-        )
+        self.content_html = render_comment(self.content)
+        self.render_version = RENDERER_VERSION
     
     def __repr__(self):
         return f'<Comment {self.id}>'
@@ -148,6 +161,35 @@ class MediaFile(db.Model):
     def __repr__(self):
         return f'<MediaFile {self.filename}>'
 
+class DailyStats(db.Model):
+    """Site-wide totals per UTC day, maintained by app.daily_stats"""
+    __tablename__ = 'daily_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    new_users = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    new_posts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    new_comments = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    new_media = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    media_bytes = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    views = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    unique_visitors = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rolled_up_at = db.Column(db.DateTime)  # NULL until the rollup job has counted this day
+    
+    def __repr__(self):
+        return f'<DailyStats {self.day}>'
+
+class DailyUserStats(db.Model):
+    """Posts and comments written per user per UTC day (days with activity only)"""
+    __tablename__ = 'daily_user_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    posts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comments = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    def __repr__(self):
+        return f'<DailyUserStats {self.day} user={self.user_id}>'
+
 # Database indexes for performance optimization
 db.Index('idx_user_email', User.email)
 db.Index('idx_user_username', User.username)
@@ -156,4 +198,116 @@ db.Index('idx_post_user_id', Post.user_id)
 db.Index('idx_comment_post_id', Comment.post_id)
 db.Index('idx_comment_created_at', Comment.created_at)
 db.Index('idx_media_user_id', MediaFile.user_id)
-db.Index('idx_media_created_at', MediaFile.created_at)
\ No newline at end of file
+db.Index('idx_media_created_at', MediaFile.created_at)
+
+# Composite indexes backing keyset pagination on (created_at, id)
+db.Index('idx_user_created_id', User.created_at, User.id)
+db.Index('idx_post_published_created_id', Post.is_published, Post.created_at, Post.id)
+db.Index('idx_comment_post_created_id', Comment.post_id, Comment.created_at, Comment.id)
+db.Index('idx_media_created_id', MediaFile.created_at, MediaFile.id)
+
+# Denormalized counter maintenance
+#
+# The counters are adjusted with ``SET col = col + n`` on the flush connection,
+# so they commit (or roll back) together with the row that caused the change
+# and concurrent writers never overwrite each other.
+
+def _adjust_counter(connection, model, ident, **deltas):
+    table = model.__table__
+    connection.execute(
+        update(table)
+        .where(table.c.id == ident)
+        .values({name: table.c[name] + delta for name, delta in deltas.items()})
+    )
+
+def _toggled(target, attr):
+    """Return +1/-1 if a boolean attribute flipped in this flush, else 0"""
+    history = inspect(target).attrs[attr].history
+    if not history.has_changes():
+        return 0
+    was = bool(history.deleted[0]) if history.deleted else False
+    now = bool(history.added[0]) if history.added else False
+    return int(now) - int(was)
+
+@event.listens_for(Post, 'after_insert')
+def _post_inserted(mapper, connection, target):
+    if target.is_published:
+        _adjust_counter(connection, User, target.user_id, published_post_count=1)
+
+@event.listens_for(Post, 'after_delete')
+def _post_deleted(mapper, connection, target):
+    if target.is_published:
+        _adjust_counter(connection, User, target.user_id, published_post_count=-1)
+
+@event.listens_for(Post, 'after_update')
+def _post_updated(mapper, connection, target):
+    delta = _toggled(target, 'is_published')
+    if delta:
+        _adjust_counter(connection, User, target.user_id, published_post_count=delta)
+
+@event.listens_for(Comment, 'after_insert')
+def _comment_inserted(mapper, connection, target):
+    if target.is_approved:
+        _adjust_counter(connection, Post, target.post_id, approved_comment_count=1)
+        _adjust_counter(connection, User, target.user_id, approved_comment_count=1)
+
+@event.listens_for(Comment, 'after_delete')
+def _comment_deleted(mapper, connection, target):
+    if target.is_approved:
+        _adjust_counter(connection, Post, target.post_id, approved_comment_count=-1)
+        _adjust_counter(connection, User, target.user_id, approved_comment_count=-1)
+
+@event.listens_for(Comment, 'after_update')
+def _comment_updated(mapper, connection, target):
+    delta = _toggled(target, 'is_approved')
+    if delta:
+        _adjust_counter(connection, Post, target.post_id, approved_comment_count=delta)
+        _adjust_counter(connection, User, target.user_id, approved_comment_count=delta)
+
+def post_content_hash(title, content):
+    return hashlib.blake2b(f"{title or ''}\0{content or ''}".encode(), digest_size=8).hexdigest()
+
+@event.listens_for(Post, 'before_insert')
+def _post_hash_inserted(mapper, connection, target):
+    target.content_hash = post_content_hash(target.title, target.content)
+
+@event.listens_for(Post, 'before_update')
+def _post_hash_updated(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.title.history.has_changes() or state.attrs.content.history.has_changes():
+        target.content_hash = post_content_hash(target.title, target.content)
+
+def reconcile_counters():
+    """Recompute denormalized counters in bulk and repair any drift.
+
+    Runs one correlated UPDATE per counter that only touches rows whose stored
+    value differs from the real count. Returns the number of rows fixed per
+    counter.
+    """
+    post_comments = select(func.count(Comment.id)).where(
+        Comment.post_id == Post.id, Comment.is_approved == True
+    ).scalar_subquery()
+    user_posts = select(func.count(Post.id)).where(
+        Post.user_id == User.id, Post.is_published == True
+    ).scalar_subquery()
+    user_comments = select(func.count(Comment.id)).where(
+        Comment.user_id == User.id, Comment.is_approved == True
+    ).scalar_subquery()
+    
+    fixes = [
+        ('post.approved_comment_count', Post, Post.approved_comment_count, post_comments),
+        ('user.published_post_count', User, User.published_post_count, user_posts),
+        ('user.approved_comment_count', User, User.approved_comment_count, user_comments),
+    ]
+    
+    repaired = {}
+    for label, model, column, actual in fixes:
+        result = db.session.execute(
+            update(model)
+            .where(column != actual)
+            .values({column.key: actual})
+            .execution_options(synchronize_session=False)
+        )
+        repaired[label] = result.rowcount
+    db.session.commit()
+    return repaired
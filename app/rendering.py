@@ -0,0 +1,314 @@
+import os
+import re
+import hashlib
+import threading
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import markdown
+from bleach.html5lib_shim import HTML_TAGS_BLOCK_LEVEL
+from bleach.linkifier import LinkifyFilter
+from bleach.sanitizer import Cleaner
+from sqlalchemy import bindparam, select, update
+from app import db
+from app.local_cache import LocalCache
+
+# Markdown -> sanitized HTML for posts and comments.
+#
+# Each Renderer keeps its Markdown and Cleaner objects instead of rebuilding
+# them per call (one pair per thread, since neither is thread-safe). Linkify
+# runs as a filter inside the clean pass, so the HTML is parsed once rather
+# than once by clean() and again by linkify().
+#
+# Output is memoized by SHA-256 of the source: first in a per-process LRU,
+# then optionally in Redis so bulk jobs and other workers reuse each other's
+# work. Entries are content-addressed and never need invalidating; bump
+# RENDERER_VERSION whenever the allow-lists or the Markdown setup change and
+# old entries simply stop being looked up.
+
+RENDERER_VERSION = 1
+
+# Characters of the body rendered as a post's feed summary when it has none
+SUMMARY_SOURCE_LENGTH = 300
+
+POST_TAGS = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
+             'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
+             'h1', 'h2', 'h3', 'p', 'br', 'img']
+POST_ATTRS = {
+    '*': ['class'],
+    'a': ['href', 'rel'],
+    'img': ['src', 'alt', 'width', 'height']
+}
+
+COMMENT_TAGS = ['a', 'abbr', 'acronym', 'b', 'code', 'em', 'i', 'strong', 'br', 'p']
+COMMENT_ATTRS = {
+    'a': ['href', 'rel']
+}
+
+
+class Renderer:
+    """Markdown + bleach pipeline for one allow-list, with a content-hash memo
+
+    Sources of at least ``incremental_threshold`` characters are rendered
+    block by block (see split_blocks), memoizing each block separately, so an
+    edit to a long post only re-renders the blocks that changed.
+    """
+
+    def __init__(self, name, tags, attributes, memo_entries=4096,
+                 memo_bytes=16 * 1024 * 1024, redis_ttl=7 * 86400, incremental_threshold=None):
+        self.name = name
+        self.tags = tags
+        self.attributes = attributes
+        self.redis_ttl = redis_ttl
+        self.incremental_threshold = incremental_threshold
+        self.use_redis = False
+        self.memo = LocalCache(max_entries=memo_entries, max_bytes=memo_bytes,
+                               default_ttl=redis_ttl)
+        self._state = threading.local()
+
+    def _pipeline(self):
+        state = self._state
+        if not hasattr(state, 'md'):
+            state.md = markdown.Markdown(output_format='html')
+            state.cleaner = Cleaner(tags=self.tags, attributes=self.attributes,
+                                    strip=True, filters=[LinkifyFilter])
+        return state
+
+    def render_uncached(self, source):
+        state = self._pipeline()
+        return state.cleaner.clean(state.md.reset().convert(source or ''))
+
+    def memo_key(self, source, kind='doc'):
+        digest = hashlib.sha256((source or '').encode()).hexdigest()
+        return f"render:{self.name}:{kind}:v{RENDERER_VERSION}:{digest}"
+
+    def render(self, source):
+        return self.render_many([source])[0]
+
+    def render_many(self, sources):
+        """Render a list of sources, looking memo misses up in Redis with one MGET"""
+        keys = [self.memo_key(source) for source in sources]
+        return self._memoized(keys, lambda i: self._render_fresh(sources[i]))
+
+    def render_incremental(self, source):
+        """Render ``source`` from per-block memo entries; same output as render_uncached()"""
+        blocks = split_blocks(source or '')
+        if not blocks or len(blocks) == 1:
+            return self.render_uncached(source)
+
+        keys = [self.memo_key(block, 'block') for block in blocks]
+        parts = self._memoized(keys, lambda i: self._render_block(blocks[i]))
+        # The first character of a block entry records whether bleach puts a
+        # newline in front of it when it is not the first block (see _render_block)
+        return '\n'.join(
+            ('\n' if i and part[0] == '1' else '') + part[1:]
+            for i, part in enumerate(parts)
+        )
+
+    def _render_fresh(self, source):
+        if self.incremental_threshold and len(source or '') >= self.incremental_threshold:
+            return self.render_incremental(source)
+        return self.render_uncached(source)
+
+    def _render_block(self, block):
+        state = self._pipeline()
+        html = state.md.reset().convert(block)
+        # bleach replaces a stripped block-level start tag with a newline,
+        # except when it is the very first token of the document
+        match = _FIRST_TAG.match(html)
+        spaced = bool(match) and match.group(1).lower() in HTML_TAGS_BLOCK_LEVEL \
+            and match.group(1).lower() not in self.tags
+        return ('1' if spaced else '0') + state.cleaner.clean(html)
+
+    def _memoized(self, keys, compute):
+        """Values for ``keys`` from the LRU, then Redis (one MGET), then ``compute(index)``"""
+        results = [self.memo.get(key) for key in keys]
+        missing = [i for i, value in enumerate(results) if value is None]
+        if not missing:
+            return results
+
+        redis_client = self._redis()
+        if redis_client:
+            try:
+                values = redis_client.mget([keys[i] for i in missing])
+                for i, value in zip(missing, values):
+                    if value is not None:
+                        results[i] = value.decode() if isinstance(value, bytes) else value
+                        self.memo.set(keys[i], results[i], len(value))
+            except Exception as e:
+                logging.warning(f"Render memo lookup failed: {e}")
+                redis_client = None
+
+        computed = {}
+        for i in missing:
+            if results[i] is None:
+                value = computed.get(keys[i])
+                if value is None:
+                    value = computed[keys[i]] = compute(i)
+                    self.memo.set(keys[i], value, len(value))
+                results[i] = value
+
+        if redis_client and computed:
+            try:
+                pipe = redis_client.pipeline(transaction=False)
+                for key, value in computed.items():
+                    pipe.setex(key, self.redis_ttl, value)
+                pipe.execute()
+            except Exception as e:
+                logging.warning(f"Render memo store failed: {e}")
+        return results
+
+    def _redis(self):
+        if not self.use_redis:
+            return None
+        from app import redis_client
+        return redis_client
+
+
+_FIRST_TAG = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)')
+_BLANK_LINES = re.compile(r'\n(?:[ \t]*\n)+')
+# Lines that may continue the previous block across blank lines: indented
+# content (code, list item paragraphs), list items, blockquotes, setext rules
+_CONTINUATION = re.compile(r'[ \t]|[*+-][ \t]|\d+[.)][ \t]|>|[=-]+[ \t]*$')
+# Raw HTML (other than autolinks) can span or leak across blocks, and
+# reference definitions apply to the whole document
+_NOT_SPLITTABLE = re.compile(
+    r'<(?!(?:https?|ftp)://[^<>]*>|[^<> !@]+@[^@<> ]+>)[A-Za-z!/?]|^ {0,3}\[[^\]]+\]:',
+    re.MULTILINE
+)
+
+
+def split_blocks(source):
+    """Split Markdown into top-level blocks that render independently
+
+    Rendering each block and joining the results with newlines gives exactly
+    the full render. Returns None for documents that cannot be split safely.
+    """
+    text = source.replace('\r\n', '\n').replace('\r', '\n').strip('\n')
+    if _NOT_SPLITTABLE.search(text):
+        return None
+    first_line = text.split('\n', 1)[0]
+    if first_line and not first_line.strip():
+        # A leading whitespace-only line can open an indented code block
+        return None
+    # Keep the separators: blank lines inside a merged block (e.g. in code) are content
+    parts = _BLANK_LINES.split(text)
+    separators = _BLANK_LINES.findall(text)
+    blocks = []
+    for i, part in enumerate(parts):
+        if blocks and (not part.strip() or _CONTINUATION.match(part)):
+            blocks[-1] += separators[i - 1] + part
+        elif blocks or part.strip():
+            blocks.append(part)
+    return blocks
+
+
+post_renderer = Renderer('post', POST_TAGS, POST_ATTRS, incremental_threshold=4096)
+comment_renderer = Renderer('comment', COMMENT_TAGS, COMMENT_ATTRS)
+
+RENDERERS = {renderer.name: renderer for renderer in (post_renderer, comment_renderer)}
+
+
+def summary_source(summary, content):
+    """Markdown shown for a post in feeds: its summary, else the start of the body"""
+    return summary or (content or '')[:SUMMARY_SOURCE_LENGTH]
+
+
+def render_post(source):
+    return post_renderer.render(source)
+
+
+def render_comment(source):
+    return comment_renderer.render(source)
+
+
+def configure_rendering(app):
+    """Apply the RENDER_MEMO_* settings"""
+    for renderer in (post_renderer, comment_renderer):
+        renderer.use_redis = app.config['RENDER_MEMO_REDIS']
+        renderer.redis_ttl = app.config['RENDER_MEMO_TTL']
+        renderer.memo = LocalCache(
+            max_entries=app.config['RENDER_MEMO_ENTRIES'],
+            max_bytes=app.config['RENDER_MEMO_BYTES'],
+            default_ttl=app.config['RENDER_MEMO_TTL']
+        )
+
+
+def _render_rows(name, rows):
+    """Render ``(id, source[, summary])`` rows; runs inside the re-render worker processes"""
+    renderer = RENDERERS[name]
+    html = renderer.render_many([row[1] for row in rows])
+    params = [{'row_id': row[0], 'html': value} for row, value in zip(rows, html)]
+    if name == 'post':
+        summaries = renderer.render_many([summary_source(row[2], row[1]) for row in rows])
+        for param, value in zip(params, summaries):
+            param['summary_html'] = value
+    return params
+
+
+def rerender_html(model, workers=None, batch_size=500, force=False, progress=None):
+    """Bring the stored content_html (and a post's summary_html) of ``model`` up to RENDERER_VERSION
+
+    Rows are streamed in id order with yield_per, ``batch_size`` rows per
+    worker task, and written back with one executemany UPDATE per batch that
+    also stamps render_version. Each window of batches is committed before
+    the next is read, so an interrupted run resumes by skipping current rows
+    (``force`` re-renders those too). Returns the number of rows re-rendered.
+    """
+    table = model.__table__
+    name = table.name
+    workers = workers or os.cpu_count() or 1
+    window = batch_size * workers * 2
+    rendered = {'content_html': bindparam('html'), 'render_version': RENDERER_VERSION}
+    sources = [table.c.id, table.c.content]
+    if name == 'post':
+        rendered['summary_html'] = bindparam('summary_html')
+        sources.append(table.c.summary)
+    if 'updated_at' in table.c:
+        # Keep the onupdate from stamping the row: re-rendering is not an edit
+        rendered['updated_at'] = table.c.updated_at
+    statement = update(table)\
+        .where(table.c.id == bindparam('row_id'))\
+        .values(rendered)
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    last_id = 0
+    total = 0
+    try:
+        while True:
+            query = select(*sources)\
+                .where(table.c.id > last_id)\
+                .order_by(table.c.id)\
+                .limit(window)\
+                .execution_options(yield_per=batch_size)
+            if not force:
+                query = query.where(table.c.render_version != RENDERER_VERSION)
+
+            # Read the whole window before writing so no cursor stays open across the commit
+            batches = []
+            for partition in db.session.execute(query).partitions():
+                rows = [tuple(row) for row in partition]
+                last_id = rows[-1][0]
+                batches.append(executor.submit(_render_rows, name, rows) if executor else rows)
+            if not batches:
+                break
+
+            ids = []
+            for batch in batches:
+                params = batch.result() if executor else _render_rows(name, batch)
+                db.session.execute(statement, params)
+                ids.extend(param['row_id'] for param in params)
+            db.session.commit()
+            total += len(ids)
+
+            if name == 'post':
+                from app.utils import cache_bump
+                cache_bump(*(f"post:{ident}" for ident in ids))
+            if progress:
+                progress(total)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    return total
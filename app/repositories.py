@@ -0,0 +1,87 @@
+from sqlalchemy.orm import joinedload, load_only, selectinload, undefer, undefer_group
+from app.models import Post, Comment, MediaFile
+
+# Queries behind the list views
+#
+# Each function returns the (unordered, unpaginated) query for one view with
+# the loader options its template needs, so rendering a page never lazy-loads
+# a relationship row by row:
+#
+#   joinedload(..., innerjoin=True)  the row's own author/uploader, fetched
+#                                    in the same SELECT (the FK is NOT NULL)
+#   selectinload                     parents shared by many rows or two levels
+#                                    away (a comment's post and that post's
+#                                    author): one SELECT ... WHERE id IN (...)
+#                                    per page, each parent loaded once
+#
+# The statements per page are therefore fixed whatever the page size. Callers
+# keep their own filters, ordering and (keyset) pagination.
+#
+# Post and comment bodies are deferred (column group 'body'); listings also
+# name their columns with load_only, so a page of posts carries titles and
+# rendered summaries, never the full Markdown and HTML.
+
+POST_LIST_COLUMNS = (
+    Post.id, Post.title, Post.summary, Post.summary_html, Post.created_at,
+    Post.is_published, Post.view_count, Post.approved_comment_count, Post.user_id,
+)
+
+
+def _post_list():
+    return Post.query.options(load_only(*POST_LIST_COLUMNS))
+
+
+def post_cards(post_ids):
+    """Feed cards: the given posts with their authors"""
+    return _post_list().options(joinedload(Post.author, innerjoin=True))\
+        .filter(Post.id.in_(post_ids))
+
+
+def published_posts(with_html=False):
+    """Published posts with their authors (API listing)
+
+    ``with_html`` also loads each post's full content_html.
+    """
+    query = _post_list().filter_by(is_published=True)\
+        .options(joinedload(Post.author, innerjoin=True))
+    return query.options(undefer(Post.content_html)) if with_html else query
+
+
+def author_posts(user_id):
+    """A user's published posts (profile page, related posts)"""
+    return _post_list().filter_by(user_id=user_id, is_published=True)
+
+
+def post_detail(post_id):
+    """One post with its body and author (blog detail page)"""
+    return Post.query.options(undefer_group('body'), joinedload(Post.author, innerjoin=True))\
+        .filter_by(id=post_id)
+
+
+def post_comments(post_id):
+    """A post's approved comments with their rendered HTML and authors"""
+    return Comment.query.filter_by(post_id=post_id, is_approved=True)\
+        .options(undefer(Comment.content_html), joinedload(Comment.author, innerjoin=True))
+
+
+def media_files(file_type=None):
+    """Media files with their uploaders, optionally of one type (gallery and admin)"""
+    query = MediaFile.query.options(joinedload(MediaFile.uploader, innerjoin=True))
+    if file_type:
+        query = query.filter_by(file_type=file_type)
+    return query
+
+
+def admin_posts():
+    """All posts with their authors (admin console)"""
+    return _post_list().options(joinedload(Post.author, innerjoin=True))
+
+
+def admin_comments():
+    """All comments (Markdown source) with their authors, post titles and the posts' authors"""
+    return Comment.query.options(
+        undefer(Comment.content),
+        joinedload(Comment.author, innerjoin=True),
+        selectinload(Comment.post).load_only(Post.id, Post.title, Post.user_id)
+        .selectinload(Post.author)
+    )
@@ -0,0 +1,606 @@
+import atexit
+import math
+import re
+import sqlite3
+import threading
+import time
+import zlib
+import logging
+from markupsafe import Markup, escape
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import joinedload, undefer
+from app import db
+from app.inverted_index import TOKEN, InvertedIndex, analyze, stem
+from app.models import Post, MediaFile
+
+# Full-text search over posts and media.
+#
+# A SearchBackend answers ranked, paginated queries with highlighted snippets
+# and keeps its index in step with the post/media tables. The backend is
+# picked from SEARCH_BACKEND ('auto' chooses by database):
+#
+#   fts5      SQLite FTS5 tables (porter stemming, BM25 ranking), written by
+#             the mapper events below in the same transaction as the row
+#   postgres  tsvector columns generated from the row and a GIN index, so the
+#             database keeps them current; ranked with ts_rank_cd
+#   memory    the pure-Python index in app/inverted_index.py, held by each
+#             worker; for SQLite builds without FTS5 and small deployments
+#   like      the old unindexed LIKE '%q%' scan, for anything else
+#
+# Backfill or repair an index with `flask rebuild-search-index`.
+
+# Highlight markers put around matches by the database, swapped for <mark>
+# tags after the snippet text has been HTML-escaped
+_MARK_START = '\ue000'
+_MARK_END = '\ue001'
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+search_backend = None
+
+
+class SearchPage:
+    """One page of ranked post results, shaped like a Flask-SQLAlchemy pagination"""
+
+    def __init__(self, items, total, page, per_page, snippets=None):
+        self.items = items
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+        self.pages = max(1, math.ceil(total / per_page)) if total else 0
+        self.has_prev = page > 1
+        self.has_next = page < self.pages
+        self.prev_num = page - 1 if self.has_prev else None
+        self.next_num = page + 1 if self.has_next else None
+        self.snippets = snippets or {}
+
+    def snippet(self, post):
+        return highlight(self.snippets.get(post.id, ''))
+
+
+def highlight(snippet):
+    """Escape a marked-up snippet and turn the match markers into <mark> tags"""
+    return Markup(
+        str(escape(snippet or ''))
+        .replace(_MARK_START, '<mark>')
+        .replace(_MARK_END, '</mark>')
+    )
+
+
+def query_terms(query):
+    return _WORD.findall((query or '').lower())
+
+
+def _post_content(connection, post):
+    """A flushed post's Markdown, read on ``connection`` if the (deferred) body was never loaded"""
+    if 'content' not in inspect(post).unloaded:
+        return post.content
+    table = Post.__table__
+    return connection.execute(db.select(table.c.content).where(table.c.id == post.id)).scalar()
+
+
+def _load_in_order(model, ids, *options):
+    if not ids:
+        return []
+    rows = model.query.options(*options).filter(model.id.in_(ids)).all()
+    by_id = {row.id: row for row in rows}
+    return [by_id[ident] for ident in ids if ident in by_id]
+
+
+class SearchBackend:
+    """Unindexed LIKE '%q%' search; also the interface the other backends implement"""
+
+    name = 'like'
+    snippet_words = 24
+
+    def init_app(self, app):
+        """Per-app setup once the backend has been chosen"""
+
+    def create_schema(self, connection):
+        """Create the index structures if they are missing"""
+
+    def rebuild(self, connection):
+        """Re-index every post and media file; returns (posts, media) indexed"""
+        return 0, 0
+
+    def index_post(self, connection, post):
+        pass
+
+    def remove_post(self, connection, post_id):
+        pass
+
+    def index_media(self, connection, media):
+        pass
+
+    def remove_media(self, connection, media_id):
+        pass
+
+    def search_posts(self, query, page=1, per_page=10):
+        posts = Post.query.options(joinedload(Post.author), undefer(Post.content)).filter(
+            Post.title.contains(query) | Post.content.contains(query),
+            Post.is_published == True
+        ).order_by(Post.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
+        snippets = {post.id: self._excerpt(post.content, query) for post in posts.items}
+        return SearchPage(posts.items, posts.total, page, per_page, snippets)
+
+    def search_media(self, query, limit=10):
+        return MediaFile.query.filter(
+            MediaFile.description.contains(query) | MediaFile.original_filename.contains(query)
+        ).order_by(MediaFile.created_at.desc()).limit(limit).all()
+
+    def _excerpt(self, content, query):
+        """Window of text around the first occurrence of ``query``"""
+        content = content or ''
+        at = content.lower().find(query.lower())
+        if at < 0:
+            return ' '.join(content.split()[:self.snippet_words])
+        start = max(0, at - 80)
+        end = min(len(content), at + len(query) + 80)
+        return ('…' if start else '') + content[start:at] + _MARK_START \
+            + content[at:at + len(query)] + _MARK_END + content[at + len(query):end] \
+            + ('…' if end < len(content) else '')
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5 index with BM25 ranking (titles weighted 10x over content)"""
+
+    name = 'fts5'
+    tables = ('post_fts', 'media_fts')
+
+    def __init__(self):
+        self._has_tables = None
+
+    def _ready(self, connection):
+        """Whether the FTS tables exist (checked once per process)
+
+        They are created by `flask init-db` or the migration, not by
+        db.create_all(); until then searches use LIKE and writes skip the index.
+        """
+        if self._has_tables is None:
+            try:
+                found = connection.execute(text(
+                    "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN (:post, :media)"
+                ), {'post': self.tables[0], 'media': self.tables[1]}).scalar()
+            except Exception as e:
+                logging.warning(f"Could not check for the FTS tables: {e}")
+                return False
+            self._has_tables = found == len(self.tables)
+        return self._has_tables
+
+    def create_schema(self, connection):
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts "
+            "USING fts5(title, content, tokenize='porter unicode61')"
+        ))
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS media_fts "
+            "USING fts5(original_filename, description, tokenize='porter unicode61')"
+        ))
+        self._has_tables = True
+
+    def rebuild(self, connection):
+        self.create_schema(connection)
+        connection.execute(text("DELETE FROM post_fts"))
+        posts = connection.execute(text(
+            "INSERT INTO post_fts (rowid, title, content) SELECT id, title, content FROM post"
+        )).rowcount
+        connection.execute(text("DELETE FROM media_fts"))
+        media = connection.execute(text(
+            "INSERT INTO media_fts (rowid, original_filename, description) "
+            "SELECT id, original_filename, coalesce(description, '') FROM media_file"
+        )).rowcount
+        return posts, media
+
+    def index_post(self, connection, post):
+        if not self._ready(connection):
+            return
+        self.remove_post(connection, post.id)
+        connection.execute(
+            text("INSERT INTO post_fts (rowid, title, content) VALUES (:id, :title, :content)"),
+            {'id': post.id, 'title': post.title, 'content': _post_content(connection, post)}
+        )
+
+    def remove_post(self, connection, post_id):
+        if not self._ready(connection):
+            return
+        connection.execute(text("DELETE FROM post_fts WHERE rowid = :id"), {'id': post_id})
+
+    def index_media(self, connection, media):
+        if not self._ready(connection):
+            return
+        self.remove_media(connection, media.id)
+        connection.execute(
+            text("INSERT INTO media_fts (rowid, original_filename, description) "
+                 "VALUES (:id, :filename, :description)"),
+            {'id': media.id, 'filename': media.original_filename,
+             'description': media.description or ''}
+        )
+
+    def remove_media(self, connection, media_id):
+        if not self._ready(connection):
+            return
+        connection.execute(text("DELETE FROM media_fts WHERE rowid = :id"), {'id': media_id})
+
+    @staticmethod
+    def match_expression(query):
+        """Quote every term so user input can never be parsed as FTS5 syntax"""
+        return ' '.join(f'"{term}"' for term in query_terms(query))
+
+    def search_posts(self, query, page=1, per_page=10):
+        if not self._ready(db.session):
+            return super().search_posts(query, page, per_page)
+        match = self.match_expression(query)
+        if not match:
+            return SearchPage([], 0, page, per_page)
+        params = {'match': match, 'limit': per_page, 'offset': (page - 1) * per_page,
+                  'start': _MARK_START, 'end': _MARK_END, 'words': self.snippet_words}
+        # CROSS JOIN pins the FTS index as the outer loop; left to itself the
+        # planner may scan post and re-run the MATCH once per row
+        rows = db.session.execute(text(
+            "SELECT post_fts.rowid, snippet(post_fts, 1, :start, :end, '…', :words) "
+            "FROM post_fts CROSS JOIN post ON post.id = post_fts.rowid "
+            "WHERE post_fts MATCH :match AND post.is_published = 1 "
+            "ORDER BY bm25(post_fts, 10.0, 1.0) LIMIT :limit OFFSET :offset"
+        ), params).all()
+        total = db.session.execute(text(
+            "SELECT count(*) FROM post_fts CROSS JOIN post ON post.id = post_fts.rowid "
+            "WHERE post_fts MATCH :match AND post.is_published = 1"
+        ), params).scalar()
+        posts = _load_in_order(Post, [row[0] for row in rows], joinedload(Post.author))
+        return SearchPage(posts, total, page, per_page, {row[0]: row[1] for row in rows})
+
+    def search_media(self, query, limit=10):
+        if not self._ready(db.session):
+            return super().search_media(query, limit)
+        match = self.match_expression(query)
+        if not match:
+            return []
+        ids = db.session.execute(text(
+            "SELECT rowid FROM media_fts WHERE media_fts MATCH :match "
+            "ORDER BY bm25(media_fts, 5.0, 1.0) LIMIT :limit"
+        ), {'match': match, 'limit': limit}).scalars().all()
+        return _load_in_order(MediaFile, ids)
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Generated tsvector columns with GIN indexes, ranked with ts_rank_cd
+
+    Postgres has no built-in BM25; ts_rank_cd with length normalization
+    (cover density, title weighted A over content B) is the closest match.
+    """
+
+    name = 'postgres'
+    headline_options = 'MaxWords=35, MinWords=15, MaxFragments=2, FragmentDelimiter=" … "'
+
+    def create_schema(self, connection):
+        connection.execute(text(
+            "ALTER TABLE post ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(content, '')), 'B')) STORED"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_post_search_vector ON post USING gin (search_vector)"
+        ))
+        connection.execute(text(
+            "ALTER TABLE media_file ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(original_filename, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_media_search_vector ON media_file USING gin (search_vector)"
+        ))
+
+    def rebuild(self, connection):
+        # The generated columns are recomputed by Postgres on every write
+        self.create_schema(connection)
+        posts = connection.execute(text("SELECT count(*) FROM post")).scalar()
+        media = connection.execute(text("SELECT count(*) FROM media_file")).scalar()
+        return posts, media
+
+    def search_posts(self, query, page=1, per_page=10):
+        if not query_terms(query):
+            return SearchPage([], 0, page, per_page)
+        params = {'query': query, 'limit': per_page, 'offset': (page - 1) * per_page,
+                  'options': f'StartSel="{_MARK_START}", StopSel="{_MARK_END}", '
+                             + self.headline_options}
+        rows = db.session.execute(text(
+            "WITH matches AS ("
+            "  SELECT post.id, post.content,"
+            "         ts_rank_cd(post.search_vector, q.query, 1) AS rank, q.query"
+            "  FROM post, websearch_to_tsquery('english', :query) AS q(query)"
+            "  WHERE post.search_vector @@ q.query AND post.is_published"
+            "  ORDER BY rank DESC, post.id DESC LIMIT :limit OFFSET :offset"
+            ") "
+            "SELECT id, ts_headline('english', content, query, :options) "
+            "FROM matches ORDER BY rank DESC, id DESC"
+        ), params).all()
+        total = db.session.execute(text(
+            "SELECT count(*) FROM post "
+            "WHERE search_vector @@ websearch_to_tsquery('english', :query) AND is_published"
+        ), params).scalar()
+        posts = _load_in_order(Post, [row[0] for row in rows], joinedload(Post.author))
+        return SearchPage(posts, total, page, per_page, {row[0]: row[1] for row in rows})
+
+    def search_media(self, query, limit=10):
+        if not query_terms(query):
+            return []
+        ids = db.session.execute(text(
+            "SELECT media_file.id FROM media_file, websearch_to_tsquery('english', :query) AS q(query) "
+            "WHERE media_file.search_vector @@ q.query "
+            "ORDER BY ts_rank_cd(media_file.search_vector, q.query, 1) DESC LIMIT :limit"
+        ), {'query': query, 'limit': limit}).scalars().all()
+        return _load_in_order(MediaFile, ids)
+
+
+class MemorySearchBackend(SearchBackend):
+    """BM25 over an in-process inverted index (app/inverted_index.py)
+
+    Each worker holds its own index, loaded on first use from the snapshot
+    file (SEARCH_SNAPSHOT_PATH) or built from the database, and then
+    reconciled against the database every SEARCH_MEMORY_REFRESH seconds,
+    which also picks up writes made by other workers. Posts are versioned
+    by Post.content_hash, so only edited posts are re-read and re-indexed.
+    Writes made by this worker are applied when their transaction commits.
+    """
+
+    name = 'memory'
+    post_fields = {'title': 10, 'content': 1}
+    media_fields = {'original_filename': 5, 'description': 1}
+
+    def __init__(self):
+        self.posts = InvertedIndex(self.post_fields)
+        self.media = InvertedIndex(self.media_fields)
+        self.snapshot_path = None
+        self.refresh_interval = 30
+        self._checked_at = None
+        self._refresh_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.snapshot_path = app.config['SEARCH_SNAPSHOT_PATH']
+        self.refresh_interval = app.config['SEARCH_MEMORY_REFRESH']
+        with app.app_context():
+            event.listen(db.engine, 'commit', self._apply_pending)
+            event.listen(db.engine, 'rollback', self._discard_pending)
+        atexit.register(self.save_snapshot)
+
+    # Index updates are queued on the connection during flush and applied
+    # only once the transaction commits, so a rollback leaves no trace
+
+    def _queue(self, connection, operation):
+        connection.info.setdefault('search_pending', []).append(operation)
+
+    def _apply_pending(self, connection):
+        for index, doc_id, fields, version in connection.info.pop('search_pending', ()):
+            if fields is None:
+                index.remove(doc_id)
+            else:
+                index.add(doc_id, fields, version)
+
+    def _discard_pending(self, connection):
+        connection.info.pop('search_pending', None)
+
+    def index_post(self, connection, post):
+        if not post.is_published:
+            return self.remove_post(connection, post.id)
+        self._queue(connection, (self.posts, post.id,
+                                 {'title': post.title, 'content': _post_content(connection, post)},
+                                 post.content_hash))
+
+    def remove_post(self, connection, post_id):
+        self._queue(connection, (self.posts, post_id, None, None))
+
+    def index_media(self, connection, media):
+        fields = {'original_filename': media.original_filename, 'description': media.description}
+        self._queue(connection, (self.media, media.id, fields, _fingerprint(fields)))
+
+    def remove_media(self, connection, media_id):
+        self._queue(connection, (self.media, media_id, None, None))
+
+    def rebuild(self, connection):
+        self.posts.clear()
+        self.media.clear()
+        posts, media = self.reconcile(connection)
+        self._checked_at = time.monotonic()
+        self.save_snapshot()
+        return posts, media
+
+    def reconcile(self, connection, batch_size=500):
+        """Bring both indexes in line with the database; returns (posts, media) re-indexed"""
+        current = dict(connection.execute(
+            db.select(Post.id, Post.content_hash).where(Post.is_published == True)
+        ).all())
+        for post_id in self.posts.ids():
+            if post_id not in current:
+                self.posts.remove(post_id)
+        stale = [post_id for post_id, version in current.items()
+                 if post_id not in self.posts or self.posts.version(post_id) != version]
+        for i in range(0, len(stale), batch_size):
+            rows = connection.execute(
+                db.select(Post.id, Post.title, Post.content, Post.content_hash)
+                .where(Post.id.in_(stale[i:i + batch_size]))
+            )
+            for post_id, title, content, content_hash in rows:
+                self.posts.add(post_id, {'title': title, 'content': content}, content_hash)
+
+        media = {}
+        for media_id, filename, description in connection.execute(
+            db.select(MediaFile.id, MediaFile.original_filename, MediaFile.description)
+        ):
+            media[media_id] = {'original_filename': filename, 'description': description}
+        for media_id in self.media.ids():
+            if media_id not in media:
+                self.media.remove(media_id)
+        stale_media = 0
+        for media_id, fields in media.items():
+            version = _fingerprint(fields)
+            if self.media.version(media_id) != version or media_id not in self.media:
+                self.media.add(media_id, fields, version)
+                stale_media += 1
+        return len(stale), stale_media
+
+    def _ensure_current(self):
+        now = time.monotonic()
+        if self._checked_at is not None and (
+            not self.refresh_interval or now - self._checked_at < self.refresh_interval
+        ):
+            return
+        if not self._refresh_lock.acquire(blocking=self._checked_at is None):
+            return  # another thread is already reconciling; serve what we have
+        try:
+            if self._checked_at is None and self.snapshot_path:
+                try:
+                    self.posts.load(self.snapshot_path + '.posts')
+                    self.media.load(self.snapshot_path + '.media')
+                except Exception as e:
+                    logging.warning(f"Ignoring unreadable search snapshot: {e}")
+            first_load = self._checked_at is None
+            self.reconcile(db.session)
+            self._checked_at = time.monotonic()
+            if first_load:
+                self.save_snapshot()
+        finally:
+            self._refresh_lock.release()
+
+    def save_snapshot(self, force=False):
+        if not self.snapshot_path:
+            return
+        try:
+            if force or self.posts.changes:
+                self.posts.save(self.snapshot_path + '.posts')
+            if force or self.media.changes:
+                self.media.save(self.snapshot_path + '.media')
+        except OSError as e:
+            logging.warning(f"Could not write search snapshot: {e}")
+
+    def search_posts(self, query, page=1, per_page=10):
+        self._ensure_current()
+        hits, total = self.posts.search(query, limit=page * per_page)
+        ids = [post_id for post_id, _ in hits[(page - 1) * per_page:]]
+        posts = _load_in_order(Post, ids, joinedload(Post.author), undefer(Post.content))
+        wanted = set(analyze(query))
+        snippets = {post.id: self._stemmed_excerpt(post.content, wanted) for post in posts}
+        return SearchPage(posts, total, page, per_page, snippets)
+
+    def search_media(self, query, limit=10):
+        self._ensure_current()
+        hits, _ = self.media.search(query, limit=limit)
+        return _load_in_order(MediaFile, [media_id for media_id, _ in hits])
+
+    def _stemmed_excerpt(self, content, wanted):
+        """Window of words starting just before the first word matching ``wanted``"""
+        content = content or ''
+        words = list(TOKEN.finditer(content))
+        first = next((i for i, word in enumerate(words)
+                      if stem(word.group().lower()) in wanted), None)
+        if first is None:
+            return ' '.join(content.split()[:self.snippet_words])
+        start = max(0, first - self.snippet_words // 4)
+        window = words[start:start + self.snippet_words]
+        pieces = ['…' if start else '']
+        position = window[0].start()
+        for word in window:
+            if stem(word.group().lower()) in wanted:
+                pieces += [content[position:word.start()], _MARK_START, word.group(), _MARK_END]
+                position = word.end()
+        pieces.append(content[position:window[-1].end()])
+        if start + self.snippet_words < len(words):
+            pieces.append('…')
+        return ''.join(pieces)
+
+
+def _fingerprint(fields):
+    return zlib.crc32('\0'.join(value or '' for value in fields.values()).encode())
+
+
+BACKENDS = {
+    SearchBackend.name: SearchBackend,
+    SQLiteFTSBackend.name: SQLiteFTSBackend,
+    PostgresSearchBackend.name: PostgresSearchBackend,
+    MemorySearchBackend.name: MemorySearchBackend,
+}
+
+
+def _sqlite_has_fts5():
+    try:
+        connection = sqlite3.connect(':memory:')
+        connection.execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        connection.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def choose_backend(app):
+    name = app.config['SEARCH_BACKEND']
+    if name == 'auto':
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        if uri.startswith('sqlite'):
+            name = 'fts5' if _sqlite_has_fts5() else 'memory'
+        elif uri.startswith('postgres'):
+            name = 'postgres'
+        else:
+            name = 'like'
+    return BACKENDS[name]()
+
+
+def get_search_backend():
+    return search_backend or SearchBackend()
+
+
+def init_search(app):
+    """Pick the search backend for this app (see SEARCH_BACKEND)"""
+    global search_backend
+    search_backend = choose_backend(app)
+    search_backend.init_app(app)
+    return search_backend
+
+
+# Index maintenance, on the flush connection so the index commits (or rolls
+# back) together with the row
+
+def _changed(target, *attrs):
+    state = inspect(target)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+def _sync(method, connection, arg):
+    if search_backend is None:
+        return
+    try:
+        getattr(search_backend, method)(connection, arg)
+    except Exception as e:
+        # A broken index must never block writing posts; rebuild-search-index repairs it
+        logging.error(f"Search index update failed ({method}): {e}")
+
+
+@event.listens_for(Post, 'after_insert')
+def _post_inserted(mapper, connection, target):
+    _sync('index_post', connection, target)
+
+
+@event.listens_for(Post, 'after_update')
+def _post_updated(mapper, connection, target):
+    if _changed(target, 'title', 'content', 'is_published'):
+        _sync('index_post', connection, target)
+
+
+@event.listens_for(Post, 'after_delete')
+def _post_deleted(mapper, connection, target):
+    _sync('remove_post', connection, target.id)
+
+
+@event.listens_for(MediaFile, 'after_insert')
+def _media_inserted(mapper, connection, target):
+    _sync('index_media', connection, target)
+
+
+@event.listens_for(MediaFile, 'after_update')
+def _media_updated(mapper, connection, target):
+    if _changed(target, 'original_filename', 'description'):
+        _sync('index_media', connection, target)
+
+
+@event.listens_for(MediaFile, 'after_delete')
+def _media_deleted(mapper, connection, target):
+    _sync('remove_media', connection, target.id)
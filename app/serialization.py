@@ -0,0 +1,115 @@
+import json
+import pickle
+import zlib
+
+# Optional imports with fallbacks
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+# Cache payload format
+#
+# Every payload written by CacheSerializer starts with one header byte:
+#
+#     0x80 | codec << 3 | compression
+#
+# Entries written before the header existed are plain JSON, whose first byte
+# is always ASCII (< 0x80), so they keep decoding as JSON.
+
+CODECS = {'json': 0, 'pickle': 1, 'msgpack': 2}
+COMPRESSIONS = {'none': 0, 'zlib': 1, 'zstd': 2}
+
+_HEADER_FLAG = 0x80
+
+
+class CacheSerializer:
+    """Encode/decode cache values with a pluggable codec and optional compression
+
+    ``pickle`` (protocol 5) is the fastest codec and handles any Python value,
+    but anyone able to write to Redis could then run code in the app, so only
+    use it with a trusted, private Redis.
+    """
+
+    def __init__(self, codec='msgpack', compression='zstd', compress_threshold=1024, level=3):
+        self.configure(codec, compression, compress_threshold, level)
+
+    def configure(self, codec='msgpack', compression='zstd', compress_threshold=1024, level=3):
+        if codec == 'msgpack' and not HAS_MSGPACK:
+            codec = 'json'
+        if compression == 'zstd' and not HAS_ZSTD:
+            compression = 'zlib'
+        if codec not in CODECS:
+            raise ValueError(f"Unknown cache codec: {codec}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown cache compression: {compression}")
+        self.codec = codec
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+        self.level = level
+        self._zstd_compressor = zstandard.ZstdCompressor(level=level) if HAS_ZSTD else None
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if HAS_ZSTD else None
+
+    def dumps(self, value):
+        if self.codec == 'pickle':
+            body = pickle.dumps(value, protocol=5)
+        elif self.codec == 'msgpack':
+            body = msgpack.packb(value, use_bin_type=True)
+        else:
+            body = json.dumps(value, separators=(',', ':')).encode()
+
+        compression = self.compression if len(body) >= self.compress_threshold else 'none'
+        if compression == 'zstd':
+            body = self._zstd_compressor.compress(body)
+        elif compression == 'zlib':
+            body = zlib.compress(body, self.level)
+
+        header = _HEADER_FLAG | CODECS[self.codec] << 3 | COMPRESSIONS[compression]
+        return bytes((header,)) + body
+
+    def loads(self, payload):
+        if not payload:
+            return None
+        header = payload[0]
+        if not header & _HEADER_FLAG:
+            # Legacy entry written as plain JSON
+            return json.loads(payload)
+
+        codec = (header >> 3) & 0x0F
+        compression = header & 0x07
+        body = memoryview(payload)[1:]
+
+        if compression == COMPRESSIONS['zstd']:
+            if not HAS_ZSTD:
+                raise ValueError("zstd-compressed cache entry but zstandard is not installed")
+            body = self._zstd_decompressor.decompress(body)
+        elif compression == COMPRESSIONS['zlib']:
+            body = zlib.decompress(body)
+
+        if codec == CODECS['pickle']:
+            return pickle.loads(body)
+        if codec == CODECS['msgpack']:
+            if not HAS_MSGPACK:
+                raise ValueError("msgpack cache entry but msgpack is not installed")
+            return msgpack.unpackb(body, raw=False)
+        return json.loads(bytes(body))
+
+
+serializer = CacheSerializer()
+
+
+def configure_serializer(app):
+    """Apply the CACHE_SERIALIZER / CACHE_COMPRESSION* settings"""
+    serializer.configure(
+        codec=app.config['CACHE_SERIALIZER'],
+        compression=app.config['CACHE_COMPRESSION'],
+        compress_threshold=app.config['CACHE_COMPRESS_THRESHOLD'],
+        level=app.config['CACHE_COMPRESSION_LEVEL']
+    )
@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+import logging
+from app import redis_client
+from app.utils import cache_get, cache_set
+
+# Background-refreshed snapshots
+#
+# Figures too slow to gather per request (the dashboard counters, the
+# storage listing) are served from a snapshot: a dict of plain values
+# stored under ``key`` in Redis (shared by all workers) and in process
+# memory, stamped with ``generated_at``.
+#
+# A background thread in each worker re-collects it every
+# ``refresh_setting`` seconds while it has been asked for within
+# ``idle_setting`` seconds, unless another worker's snapshot is still that
+# fresh. A read that finds the snapshot older than the interval (after an
+# idle spell) wakes the refresher early, and request_refresh() wakes it at
+# once; neither waits for it. A Redis lock held while collecting keeps two
+# workers from collecting at the same time.
+#
+# With ``refresh_setting`` set to 0 there is no periodic refresh: a read
+# re-collects once the snapshot is ``idle_setting`` seconds old, inline for
+# ``inline`` snapshots and through the refresher otherwise.
+
+
+class BackgroundSnapshot:
+    """A snapshot under ``key`` gathered by ``collect()`` (run in an app context)
+
+    ``inline`` snapshots are cheap enough to collect during a request, so
+    get() never returns None for them. ``ttl`` defaults to ten intervals,
+    and at least ``idle_setting`` seconds.
+    """
+
+    def __init__(self, key, collect, refresh_setting, idle_setting='DASHBOARD_IDLE',
+                 inline=False, ttl=None, lock_timeout=900):
+        self.key = key
+        self.collect = collect
+        self.refresh_setting = refresh_setting
+        self.idle_setting = idle_setting
+        self.inline = inline
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout  # seconds; frees the lock if a collector dies mid-way
+        self.viewed_key = f'{key}:viewed'
+        self.lock_key = f'{key}:refreshing'
+
+        self._local = None
+        self._local_viewed_at = 0.0
+
+        self._app = None
+        self._refresher_pid = None
+        self._refresher_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._requested = threading.Event()
+        self._collecting = threading.Event()
+
+    def init_app(self, app):
+        """Remember the app so the refresher thread can open app contexts"""
+        self._app = app
+
+    def get(self):
+        """The latest snapshot; None until the first one is collected unless ``inline``"""
+        self._mark_viewed()
+        self._ensure_refresher()
+        snapshot = self.latest()
+        interval = self._config(self.refresh_setting)
+        if snapshot is None or time.time() - snapshot['generated_at'] > (interval or self._config(self.idle_setting)):
+            if self.inline and (snapshot is None or not interval):
+                return self.refresh()
+            self._wake.set()
+        return snapshot
+
+    def latest(self):
+        return cache_get(self.key) or self._local
+
+    def refresh(self):
+        """Collect and publish a new snapshot; returns it"""
+        snapshot = self.collect()
+        snapshot['generated_at'] = time.time()
+        self._local = snapshot
+        cache_set(self.key, snapshot, timeout=self._ttl())
+        return snapshot
+
+    def request_refresh(self):
+        """Have this worker's refresher collect now; does not wait for it"""
+        self._ensure_refresher()
+        self._requested.set()
+        self._wake.set()
+
+    def is_refreshing(self):
+        """Whether some worker is collecting right now"""
+        if self._collecting.is_set():
+            return True
+        if redis_client:
+            try:
+                return bool(redis_client.exists(self.lock_key))
+            except Exception:
+                pass
+        return False
+
+    def _config(self, name):
+        return self._app.config[name] if self._app is not None else 0
+
+    def _ttl(self):
+        if self.ttl is not None:
+            return self.ttl
+        return max(self._config(self.refresh_setting) * 10, self._config(self.idle_setting))
+
+    def _mark_viewed(self):
+        self._local_viewed_at = time.time()
+        if redis_client:
+            try:
+                redis_client.set(self.viewed_key, 1, ex=max(1, self._config(self.idle_setting)))
+            except Exception:
+                pass
+
+    def _recently_viewed(self):
+        if redis_client:
+            try:
+                return bool(redis_client.exists(self.viewed_key))
+            except Exception:
+                pass
+        return time.time() - self._local_viewed_at < self._config(self.idle_setting)
+
+    def _fresh(self, interval):
+        snapshot = self.latest()
+        return snapshot is not None and time.time() - snapshot['generated_at'] < interval
+
+    def _claim_refresh(self):
+        """True if no other worker is collecting; the caller must then _release_refresh()"""
+        if not redis_client:
+            return True
+        try:
+            return bool(redis_client.set(self.lock_key, os.getpid(), nx=True, ex=self.lock_timeout))
+        except Exception:
+            return True
+
+    def _release_refresh(self):
+        if not redis_client:
+            return
+        try:
+            if redis_client.get(self.lock_key) == str(os.getpid()).encode():
+                redis_client.delete(self.lock_key)
+        except Exception:
+            pass
+
+    def _refresh_loop(self, app, interval):
+        while True:
+            # With the periodic refresh disabled, only get() and request_refresh() wake it
+            self._wake.wait(interval or None)
+            self._wake.clear()
+            requested = self._requested.is_set()
+            self._requested.clear()
+            with app.app_context():
+                if not requested and (not self._recently_viewed() or self._fresh(interval)):
+                    continue
+                if not self._claim_refresh():
+                    continue
+                self._collecting.set()
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logging.error(f"Refreshing the {self.key} snapshot failed: {e}")
+                finally:
+                    self._collecting.clear()
+                    self._release_refresh()
+
+    def _ensure_refresher(self):
+        """Start this process's background refresher on first use"""
+        if self._app is None or self._refresher_pid == os.getpid():
+            return
+        with self._refresher_lock:
+            if self._refresher_pid != os.getpid():
+                threading.Thread(
+                    target=self._refresh_loop,
+                    args=(self._app, self._app.config[self.refresh_setting]),
+                    name=f"{self.key.replace(':', '-')}-refresher",
+                    daemon=True
+                ).start()
+            self._refresher_pid = os.getpid()
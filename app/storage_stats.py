@@ -0,0 +1,74 @@
+import time
+from flask import current_app
+from app.snapshots import BackgroundSnapshot
+
+# Storage statistics snapshot
+#
+# Listing every object of every bucket takes seconds to minutes, so admin
+# pages never do it inline: they show the last snapshot collected by
+# refresh_stats() together with its age. The buckets are listed
+# concurrently (STORAGE_STATS_WORKERS threads), each with a paged listing
+# that fetches object sizes only.
+#
+# It is served as a BackgroundSnapshot (app.snapshots), re-listed every
+# STORAGE_STATS_REFRESH seconds while a storage figure has been asked for
+# within DASHBOARD_IDLE seconds, always in the background.
+# request_refresh() (the Refresh button) wakes the refresher at once and
+# returns without waiting. With STORAGE_STATS_REFRESH set to 0 the buckets
+# are re-listed on request, or once the snapshot is DASHBOARD_IDLE old.
+
+STATS_TTL = 86400  # a day-old snapshot still beats an empty page
+
+
+def _list_buckets():
+    from storage import storage
+
+    return storage.get_storage_stats(workers=current_app.config['STORAGE_STATS_WORKERS'])
+
+
+_snapshot = BackgroundSnapshot('storage:stats', _list_buckets, 'STORAGE_STATS_REFRESH', ttl=STATS_TTL)
+
+
+def refresh_stats():
+    """List the buckets and publish a new snapshot; returns it"""
+    return _snapshot.refresh()
+
+
+def _empty_stats():
+    from storage import storage
+
+    return {
+        'total_size_gb': 0,
+        'total_files': 0,
+        'buckets': [],
+        'current_bucket': storage.current_bucket_name,
+        'max_buckets': storage.max_buckets,
+        'generated_at': None
+    }
+
+
+def get_stats():
+    """The latest snapshot; before the first listing finishes, an empty one with ``generated_at`` None"""
+    return _snapshot.get() or _empty_stats()
+
+
+def stats_age(stats):
+    """Seconds since ``stats`` was collected (None for the empty placeholder)"""
+    if not stats.get('generated_at'):
+        return None
+    return int(time.time() - stats['generated_at'])
+
+
+def request_refresh():
+    """Have this worker's refresher list the buckets now; does not wait for it"""
+    _snapshot.request_refresh()
+
+
+def is_refreshing():
+    """Whether some worker is listing the buckets right now"""
+    return _snapshot.is_refreshing()
+
+
+def init_storage_stats(app):
+    """Remember the app so the refresher thread can open app contexts"""
+    _snapshot.init_app(app)
@@ -0,0 +1,122 @@
+import logging
+from sqlalchemy import Integer, column, or_, text
+from app import db
+from app.models import User, Post
+
+# Indexed substring search for the admin consoles.
+#
+# substring_filter(Model, search) is a drop-in replacement for OR-ing
+# `.contains(search)` over a model's text columns, but answered from a
+# trigram index instead of a full table scan:
+#
+#   postgresql  pg_trgm GIN index per column; ILIKE '%search%' uses them
+#   sqlite      an FTS5 table with the trigram tokenizer over the columns,
+#               external-content (no second copy of the text) and kept in
+#               step by triggers; matched with MATCH '"search"'
+#
+# Trigrams need at least three characters, so shorter searches (and
+# databases without the index) fall back to the plain LIKE scan. Matching
+# is case-insensitive on both databases. SQLite batch migrations that
+# recreate user/post drop the triggers; `flask rebuild-search-index` puts
+# them back and refills the tables.
+
+TRIGRAM_COLUMNS = {
+    User: ('username', 'email', 'first_name', 'last_name'),
+    Post: ('title', 'content'),
+}
+
+_available = {}
+
+
+def _table(model):
+    return model.__table__.name
+
+
+def _index_table(model):
+    return f"{_table(model)}_trgm"
+
+
+def create_schema(connection):
+    """Create the trigram indexes (and, on SQLite, their sync triggers) if missing"""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for model, columns in TRIGRAM_COLUMNS.items():
+            for name in columns:
+                connection.execute(text(
+                    f'CREATE INDEX IF NOT EXISTS idx_{_table(model)}_{name}_trgm '
+                    f'ON "{_table(model)}" USING gin ({name} gin_trgm_ops)'
+                ))
+    elif dialect == 'sqlite':
+        for model, columns in TRIGRAM_COLUMNS.items():
+            table, index = _table(model), _index_table(model)
+            names = ', '.join(columns)
+            new = ', '.join(f'new.{name}' for name in columns)
+            old = ', '.join(f'old.{name}' for name in columns)
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5("
+                f"{names}, content='{table}', content_rowid='id', tokenize='trigram')"
+            ))
+            connection.execute(text(
+                f'CREATE TRIGGER IF NOT EXISTS {index}_ai AFTER INSERT ON "{table}" BEGIN '
+                f'INSERT INTO {index} (rowid, {names}) VALUES (new.id, {new}); END'
+            ))
+            connection.execute(text(
+                f'CREATE TRIGGER IF NOT EXISTS {index}_ad AFTER DELETE ON "{table}" BEGIN '
+                f"INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', old.id, {old}); END"
+            ))
+            connection.execute(text(
+                f'CREATE TRIGGER IF NOT EXISTS {index}_au AFTER UPDATE OF {names} ON "{table}" BEGIN '
+                f"INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+                f'INSERT INTO {index} (rowid, {names}) VALUES (new.id, {new}); END'
+            ))
+    _available.clear()
+
+
+def rebuild(connection):
+    """Re-derive the SQLite trigram tables from their content tables"""
+    if connection.dialect.name != 'sqlite':
+        return
+    create_schema(connection)
+    for model in TRIGRAM_COLUMNS:
+        index = _index_table(model)
+        connection.execute(text(f"INSERT INTO {index} ({index}) VALUES ('rebuild')"))
+
+
+def _has_index(model):
+    """Whether the SQLite trigram table for ``model`` exists (checked once per process)"""
+    index = _index_table(model)
+    if index not in _available:
+        try:
+            _available[index] = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': index}
+            ).scalar() is not None
+        except Exception as e:
+            logging.warning(f"Could not check for trigram table {index}: {e}")
+            return False
+    return _available[index]
+
+
+def _like_pattern(search):
+    escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def substring_filter(model, search):
+    """WHERE clause matching rows whose trigram columns contain ``search``"""
+    columns = [getattr(model, name) for name in TRIGRAM_COLUMNS[model]]
+    dialect = db.session.get_bind().dialect.name
+
+    if len(search) >= 3 and dialect == 'sqlite' and _has_index(model):
+        index = _index_table(model)
+        # One quoted FTS5 string: matched as a substring, never parsed as syntax
+        phrase = '"' + search.replace('"', '""') + '"'
+        matches = text(f"SELECT rowid FROM {index} WHERE {index} MATCH :{index}_phrase") \
+            .bindparams(**{f'{index}_phrase': phrase}).columns(column('rowid', Integer))
+        return model.id.in_(matches)
+
+    pattern = _like_pattern(search)
+    if dialect == 'postgresql':
+        return or_(*(col.ilike(pattern, escape='\\') for col in columns))
+    return or_(*(col.like(pattern, escape='\\') for col in columns))
@@ -0,0 +1,260 @@
+import heapq
+import threading
+import time
+import logging
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, islice
+from flask import current_app, url_for
+from app import db, redis_client
+from app.inverted_index import tokenize
+from app.models import User, Post, MediaFile
+from app.utils import cache_get, cache_set
+
+# Search-as-you-type over post titles, usernames and media filenames.
+#
+# Each kind gets a PrefixIndex: a sorted array of the distinct words in its
+# labels, and per word the ascending numbers of the documents using it.
+# Documents are numbered best first (most viewed posts, most prolific users,
+# newest media), so the top results for a prefix are simply the smallest
+# numbers across the words in the prefix's bisect range, read off with a
+# lazy k-way merge. One- and two-letter prefixes, whose ranges span
+# thousands of words, are answered from lists precomputed at build time.
+#
+# The index is a per-worker snapshot built on first use and rebuilt in a
+# background thread every TYPEAHEAD_REFRESH seconds; answers are cached in
+# Redis for TYPEAHEAD_CACHE_TTL seconds.
+
+MIN_QUERY_LENGTH = 2
+
+_index = None
+_built_at = 0.0
+_build_lock = threading.Lock()
+
+
+class PrefixIndex:
+    """Prefix search over short texts given best first"""
+
+    def __init__(self, texts, top_prefix_length=2, top_size=20, max_scan=20000):
+        self.texts = texts
+        self.top_size = top_size
+        self.top_prefix_length = top_prefix_length
+        self.max_scan = max_scan
+        postings = {}
+        for docno, label in enumerate(texts):
+            for word in set(tokenize(label)):
+                entry = postings.get(word)
+                if entry is None:
+                    entry = postings[word] = array('I')
+                entry.append(docno)
+        self.words = sorted(postings)
+        self.postings = [postings[word] for word in self.words]
+        # offsets[i] = postings before word i, so a prefix's match count is one subtraction
+        self.offsets = array('Q', accumulate((len(entry) for entry in self.postings), initial=0))
+        # Forward index: the word numbers of document d are
+        # doc_words[doc_starts[d]:doc_starts[d + 1]]
+        word_numbers = {word: i for i, word in enumerate(self.words)}
+        self.doc_words = array('I')
+        self.doc_starts = array('Q', [0])
+        for label in texts:
+            self.doc_words.extend({word_numbers[word] for word in tokenize(label)})
+            self.doc_starts.append(len(self.doc_words))
+        self.top = {}
+        for length in range(1, top_prefix_length + 1):
+            for prefix in {word[:length] for word in self.words if len(word) >= length}:
+                self.top[prefix] = self._merge(prefix, top_size)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _range(self, prefix):
+        lo = bisect_left(self.words, prefix)
+        hi = bisect_left(self.words, prefix + '\U0010ffff', lo)
+        return lo, hi
+
+    def _merge(self, prefix, limit, required=()):
+        lo, hi = self._range(prefix)
+        found = []
+        last = None
+        for docno in islice(heapq.merge(*self.postings[lo:hi]), self.max_scan):
+            if docno != last and all(_contains(postings, docno) for postings in required):
+                found.append(docno)
+                if len(found) == limit:
+                    break
+            last = docno
+        return found
+
+    def _postings_for(self, word):
+        i = bisect_left(self.words, word)
+        if i < len(self.words) and self.words[i] == word:
+            return self.postings[i]
+        return None
+
+    def search(self, query, limit=10):
+        """Numbers of the best ``limit`` documents matching ``query``
+
+        Every word but the last must appear in the label; the last one may
+        be a prefix of a label word. Multi-word queries look at no more than
+        ``max_scan`` of the best candidates, so a rare combination of common
+        words may come back short rather than slow.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        *words, prefix = terms
+        if not words:
+            if prefix in self.top and limit <= self.top_size:
+                return self.top[prefix][:limit]
+            return self._merge(prefix, limit)
+
+        required = [self._postings_for(word) for word in words]
+        if any(postings is None for postings in required):
+            return []
+        required.sort(key=len)
+
+        # Walk whichever is shorter, the rarest full word or everything under
+        # the prefix, and probe the rest
+        lo, hi = self._range(prefix)
+        if self.offsets[hi] - self.offsets[lo] <= len(required[0]):
+            return self._merge(prefix, limit, required)
+        doc_words, doc_starts = self.doc_words, self.doc_starts
+        found = []
+        for docno in islice(required[0], self.max_scan):
+            if any(lo <= number < hi for number in doc_words[doc_starts[docno]:doc_starts[docno + 1]]) \
+                    and all(_contains(postings, docno) for postings in required[1:]):
+                found.append(docno)
+                if len(found) == limit:
+                    break
+        return found
+
+
+def _contains(postings, docno):
+    i = bisect_left(postings, docno)
+    return i < len(postings) and postings[i] == docno
+
+
+class TypeaheadIndex:
+    """Snapshot of everything search-as-you-type can suggest, best first per kind"""
+
+    def __init__(self, posts, users, media):
+        self.post_ids = array('q', (post_id for post_id, _, _ in posts))
+        self.post_authors = array('q', (user_id for _, _, user_id in posts))
+        self.posts = PrefixIndex([title for _, title, _ in posts])
+        self.author_names = {user_id: name for user_id, _, name in users}
+        self.usernames = [username for _, username, _ in users]
+        self.user_full_names = [name for _, _, name in users]
+        self.users = PrefixIndex([f"{username} {name}" for _, username, name in users])
+        self.media_urls = [url for url, _ in media]
+        self.media = PrefixIndex([filename for _, filename in media])
+
+    @classmethod
+    def build(cls):
+        users = [
+            (user_id, username, f"{first_name} {last_name}")
+            for user_id, username, first_name, last_name in db.session.execute(
+                db.select(User.id, User.username, User.first_name, User.last_name)
+                .where(User.is_active == True)
+                .order_by(User.published_post_count.desc(), User.id.desc())
+            )
+        ]
+        posts = db.session.execute(
+            db.select(Post.id, Post.title, Post.user_id)
+            .where(Post.is_published == True)
+            .order_by(Post.view_count.desc(), Post.id.desc())
+        ).all()
+        media = [
+            (media_file.get_url(), media_file.original_filename)
+            for media_file in db.session.execute(
+                db.select(MediaFile).order_by(MediaFile.id.desc())
+            ).scalars()
+        ]
+        return cls(posts, users, media)
+
+    def suggest(self, query, limit=10, per_kind=3):
+        """Posts, then up to ``per_kind`` users and media files, ``limit`` in all"""
+        users = self.users.search(query, per_kind)
+        media = self.media.search(query, per_kind)
+        posts = self.posts.search(query, max(limit - len(users) - len(media), 0))
+        return [
+            {'type': 'post', 'title': self.posts.texts[docno],
+             'excerpt': f"Post by {self.author_names.get(self.post_authors[docno], 'unknown')}",
+             'url': url_for('main.blog_detail', id=self.post_ids[docno])}
+            for docno in posts
+        ] + [
+            {'type': 'user', 'title': self.usernames[docno],
+             'excerpt': self.user_full_names[docno],
+             'url': url_for('main.user_profile', username=self.usernames[docno])}
+            for docno in users
+        ] + [
+            {'type': 'media', 'title': self.media.texts[docno], 'excerpt': 'Media file',
+             'url': self.media_urls[docno]}
+            for docno in media
+        ]
+
+
+def get_typeahead_index():
+    """This worker's index: built on first use, then refreshed in the background"""
+    global _index
+    if _index is None:
+        with _build_lock:
+            if _index is None:
+                _rebuild()
+    elif time.monotonic() - _built_at > current_app.config['TYPEAHEAD_REFRESH']:
+        if _build_lock.acquire(blocking=False):
+            app = current_app._get_current_object()
+
+            def refresh():
+                try:
+                    with app.app_context():
+                        _rebuild()
+                        db.session.remove()
+                except Exception as e:
+                    logging.error(f"Refreshing the typeahead index failed: {e}")
+                finally:
+                    _build_lock.release()
+
+            threading.Thread(target=refresh, name='typeahead-refresh', daemon=True).start()
+    return _index
+
+
+def _rebuild():
+    global _index, _built_at
+    started = time.monotonic()
+    _index = TypeaheadIndex.build()
+    _built_at = time.monotonic()
+    logging.info(f"Typeahead index built in {_built_at - started:.2f}s ({len(_index.posts)} posts)")
+
+
+def cache_key(query, limit):
+    return f"typeahead:{limit}:" + ' '.join(tokenize(query))
+
+
+def debounced(client_id):
+    """True if ``client_id`` already had a suggestion computed within the debounce window
+
+    One SET NX PX per request; without Redis nothing is debounced.
+    """
+    window = current_app.config['TYPEAHEAD_DEBOUNCE_MS']
+    if not redis_client or not window:
+        return False
+    try:
+        return not redis_client.set(f"typeahead:debounce:{client_id}", 1, px=window, nx=True)
+    except Exception:
+        return False
+
+
+def suggest(query, client_id, limit=10):
+    """Suggestions for ``query``, or None if the client is being debounced
+
+    Cached answers are always served; only computing a new one is subject
+    to the per-client debounce window.
+    """
+    key = cache_key(query, limit)
+    results = cache_get(key)
+    if results is not None:
+        return results
+    if debounced(client_id):
+        return None
+    results = get_typeahead_index().suggest(query, limit)
+    cache_set(key, results, timeout=current_app.config['TYPEAHEAD_CACHE_TTL'])
+    return results
@@ -0,0 +1,138 @@
+import hashlib
+import math
+import threading
+from datetime import datetime, timedelta
+from app import redis_client
+
+# Unique visitors per post (all time and per day) and per day site-wide.
+#
+# Backed by Redis HyperLogLogs (PFADD/PFCOUNT, ~12 KB per key at most) or, when
+# Redis is unavailable, by the pure-Python HyperLogLog below kept in process
+# memory. Either way the memory per post is fixed no matter how much traffic
+# it gets, and per-day sketches are dropped after DAY_KEY_TTL (EXPIRE in
+# Redis, pruning once a day locally); counts are estimates with roughly 1-2%
+# standard error.
+
+DAY_KEY_TTL = 90 * 86400
+
+
+class HyperLogLog:
+    """Minimal HyperLogLog with 2**precision one-byte registers"""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+        if self.m >= 128:
+            self.alpha = 0.7213 / (1 + 1.079 / self.m)
+        else:
+            self.alpha = {16: 0.673, 32: 0.697, 64: 0.709}[self.m]
+
+    def add(self, item):
+        digest = hashlib.blake2b(str(item).encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, 'big')
+        index = value >> (64 - self.precision)
+        remaining = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self):
+        estimate = self.alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Small range correction (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+_local = {}
+_local_days = {}  # per-day key -> its day, for pruning
+_local_lock = threading.Lock()
+_pruned_on = None
+
+
+def post_key(post_id, day=None):
+    return f"uv:post:{post_id}" if day is None else f"uv:post:{post_id}:{day:%Y%m%d}"
+
+
+def site_key(day):
+    return f"uv:site:{day:%Y%m%d}"
+
+
+def record_unique_view(post_id, visitor_id):
+    """Count ``visitor_id`` as a visitor of the post, of the post today and of the site today"""
+    today = datetime.utcnow().date()
+    keys = [post_key(post_id), post_key(post_id, today), site_key(today)]
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.pfadd(key, visitor_id)
+            pipe.expire(keys[1], DAY_KEY_TTL)
+            pipe.expire(keys[2], DAY_KEY_TTL)
+            pipe.execute()
+            return
+        except Exception:
+            pass
+    with _local_lock:
+        _prune_local(today)
+        for key in keys:
+            _local.setdefault(key, HyperLogLog()).add(visitor_id)
+        _local_days[keys[1]] = _local_days[keys[2]] = today
+
+
+def _prune_local(today):
+    """Drop local per-day sketches older than DAY_KEY_TTL (caller holds _local_lock)"""
+    global _pruned_on
+    if _pruned_on == today:
+        return
+    cutoff = today - timedelta(seconds=DAY_KEY_TTL)
+    for key, day in list(_local_days.items()):
+        if day < cutoff:
+            del _local_days[key]
+            _local.pop(key, None)
+    _pruned_on = today
+
+
+def _count(keys):
+    """Estimated size of the union of several HLL keys"""
+    if redis_client:
+        try:
+            return redis_client.pfcount(*keys)
+        except Exception:
+            pass
+    with _local_lock:
+        sketches = [_local[key] for key in keys if key in _local]
+        if not sketches:
+            return 0
+        union = HyperLogLog(sketches[0].precision)
+        for sketch in sketches:
+            union.merge(sketch)
+    return union.count()
+
+
+def unique_view_counts(post_ids, day=None):
+    """Unique visitors per post (all time, or on ``day``) as ``{post_id: count}``"""
+    post_ids = list(post_ids)
+    if redis_client and post_ids:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for post_id in post_ids:
+                pipe.pfcount(post_key(post_id, day))
+            return dict(zip(post_ids, pipe.execute()))
+        except Exception:
+            pass
+    return {post_id: _count([post_key(post_id, day)]) for post_id in post_ids}
+
+
+def unique_visitors(start, end=None):
+    """Unique site visitors on ``start`` or across the days ``start``..``end``"""
+    end = end or start
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    return _count([site_key(day) for day in days])
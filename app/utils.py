@@ -4,16 +4,17 @@ from PIL import Image
 from flask import current_app, flash
 from werkzeug.utils import secure_filename
 import json
+import base64
+import math
+import random
+import time
+from datetime import datetime
+from sqlalchemy import desc, or_
 from app import redis_client
+from app.local_cache import get_local_cache, publish_invalidation
+from app.serialization import serializer
 
 # Optional imports with fallbacks
-try:
-    import boto3
-    HAS_BOTO3 = True
-except ImportError:
-    HAS_BOTO3 = False
-    print("boto3 not available - S3 upload disabled")
-
 try:
     import magic
     HAS_MAGIC = True
@@ -63,49 +64,50 @@ def compress_image(image_path, max_size=(1920, 1080), quality=85):
         print(f"Error compressing image: {e}")
         return False
 
-def upload_to_s3(file_path, filename, bucket_name):
-    """Upload file to AWS S3"""
-    if not HAS_BOTO3:
-        return None, None
-        
-    try:
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=current_app.config.get('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=current_app.config.get('AWS_SECRET_ACCESS_KEY'),
-            region_name=current_app.config.get('AWS_S3_REGION')
-        )
-        
-        s3_key = f"uploads/{filename}"
-        s3_client.upload_file(file_path, bucket_name, s3_key)
-        
-        # Generate URL
-        s3_url = f"https://{bucket_name}.s3.{current_app.config.get('AWS_S3_REGION')}.amazonaws.com/{s3_key}"
-        
-        return s3_key, s3_url
-    except Exception as e:
-        print(f"Error uploading to S3: {e}")
-        return None, None
+# Hit/miss counters for the Redis tier (the L1 tier keeps its own)
+_redis_stats = {'hits': 0, 'misses': 0, 'errors': 0}
 
 def cache_get(key):
-    """Get value from Redis cache"""
+    """Get value from the L1 cache (if enabled) or Redis"""
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        value = local_cache.get(key)
+        if value is not None:
+            return value
     if not redis_client:
         return None
     try:
         value = redis_client.get(key)
-        return json.loads(value) if value else None
     except:
+        _redis_stats['errors'] += 1
         return None
+    if not value:
+        _redis_stats['misses'] += 1
+        return None
+    _redis_stats['hits'] += 1
+    try:
+        decoded = serializer.loads(value)
+    except Exception:
+        return None
+    if local_cache is not None:
+        local_cache.set(key, decoded, len(value))
+    return decoded
 
 def cache_set(key, value, timeout=300):
     """Set value in Redis cache with timeout (default 5 minutes)"""
     if not redis_client:
         return False
     try:
-        redis_client.setex(key, timeout, json.dumps(value))
-        return True
+        payload = serializer.dumps(value)
+        redis_client.setex(key, timeout, payload)
     except:
+        _redis_stats['errors'] += 1
         return False
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        local_cache.set(key, value, len(payload), timeout)
+        publish_invalidation(key)
+    return True
 
 def cache_delete(key):
     """Delete key from Redis cache"""
@@ -113,9 +115,307 @@ def cache_delete(key):
         return False
     try:
         redis_client.delete(key)
-        return True
+    except:
+        _redis_stats['errors'] += 1
+        return False
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        local_cache.delete(key)
+        publish_invalidation(key)
+    return True
+
+def cache_get_many(keys, loader=None, timeout=300):
+    """Get several keys at once: L1 first, then a single Redis MGET
+
+    Keys still missing are passed together to ``loader(missing_keys)``, which
+    should return a ``{key: value}`` dict (typically from one DB query); those
+    values are written back with cache_set_many. Returns ``{key: value}`` for
+    every key that was found or loaded.
+    """
+    keys = list(keys)
+    found = {}
+    remaining = keys
+    
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        remaining = []
+        for key in keys:
+            value = local_cache.get(key)
+            if value is not None:
+                found[key] = value
+            else:
+                remaining.append(key)
+    
+    if remaining and redis_client:
+        try:
+            payloads = redis_client.mget(remaining)
+        except:
+            _redis_stats['errors'] += 1
+            payloads = [None] * len(remaining)
+        missing = []
+        for key, payload in zip(remaining, payloads):
+            if not payload:
+                _redis_stats['misses'] += 1
+                missing.append(key)
+                continue
+            _redis_stats['hits'] += 1
+            try:
+                found[key] = serializer.loads(payload)
+            except Exception:
+                missing.append(key)
+                continue
+            if local_cache is not None:
+                local_cache.set(key, found[key], len(payload))
+        remaining = missing
+    
+    if remaining and loader is not None:
+        loaded = loader(remaining)
+        if loaded:
+            found.update(loaded)
+            cache_set_many(loaded, timeout)
+    
+    return found
+
+def cache_set_many(mapping, timeout=300):
+    """Set several keys with one pipelined round trip of SETEX commands"""
+    if not redis_client or not mapping:
+        return False
+    try:
+        payloads = {key: serializer.dumps(value) for key, value in mapping.items()}
+        pipe = redis_client.pipeline(transaction=False)
+        for key, payload in payloads.items():
+            pipe.setex(key, timeout, payload)
+        pipe.execute()
+    except:
+        _redis_stats['errors'] += 1
+        return False
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        for key, value in mapping.items():
+            local_cache.set(key, value, len(payloads[key]), timeout)
+        publish_invalidation(*payloads)
+    return True
+
+def cache_delete_many(keys):
+    """Delete several keys with a single DEL"""
+    keys = list(keys)
+    if not redis_client or not keys:
+        return False
+    try:
+        redis_client.delete(*keys)
+    except:
+        _redis_stats['errors'] += 1
+        return False
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        for key in keys:
+            local_cache.delete(key)
+        publish_invalidation(*keys)
+    return True
+
+def cache_stats():
+    """Hit/miss counters per cache tier for this worker"""
+    local_cache = get_local_cache()
+    return {
+        'l1': local_cache.stats() if local_cache is not None else None,
+        'redis': dict(_redis_stats, enabled=redis_client is not None),
+        'cached': dict(_cached_stats)
+    }
+
+# Stampede protection
+#
+# cached() stores {'v': value, 'exp': logical expiry, 'delta': seconds the
+# loader took}. The Redis TTL is longer than the logical expiry so a stale
+# copy stays around while a single worker, holding a short Redis lock,
+# recomputes it. Refreshes also start early with probability growing as the
+# expiry nears (XFetch: recompute when now - delta * beta * ln(rand) >= exp),
+# so hot keys are usually rebuilt before anyone sees them expire.
+
+_cached_stats = {'hits': 0, 'misses': 0, 'early_refreshes': 0, 'recomputes': 0,
+                 'stale_served': 0, 'lock_waits': 0}
+
+def cached(key, loader, timeout=300, stale_timeout=None, lock_timeout=10, beta=1.0):
+    """Get ``key`` from the cache, computing it with ``loader()`` at most once at a time
+
+    While one request recomputes an expired entry, others get the stale
+    value (kept for ``stale_timeout`` extra seconds, default ``timeout``).
+    A cold key with no stale copy makes other requests wait up to
+    ``lock_timeout`` seconds for the winner before computing it themselves.
+    """
+    if not redis_client:
+        return loader()
+    
+    stale_timeout = timeout if stale_timeout is None else stale_timeout
+    envelope = cache_get(key)
+    if not isinstance(envelope, dict) or 'exp' not in envelope:
+        envelope = None
+    now = time.time()
+    
+    if envelope is not None:
+        expiry = envelope['exp']
+        if now - envelope['delta'] * beta * math.log(1.0 - random.random()) < expiry:
+            _cached_stats['hits'] += 1
+            return envelope['v']
+        if now < expiry:
+            _cached_stats['early_refreshes'] += 1
+    else:
+        _cached_stats['misses'] += 1
+    
+    try:
+        lock = redis_client.lock(f"lock:{key}", timeout=lock_timeout, blocking=False)
+        acquired = lock.acquire()
+    except:
+        lock, acquired = None, False
+    
+    if not acquired and envelope is not None:
+        _cached_stats['stale_served'] += 1
+        return envelope['v']
+    
+    if not acquired and lock is not None:
+        # Cold key: wait for the worker holding the lock to publish a value
+        _cached_stats['lock_waits'] += 1
+        deadline = now + lock_timeout
+        while time.time() < deadline:
+            time.sleep(0.05)
+            envelope = cache_get(key)
+            if isinstance(envelope, dict) and 'v' in envelope:
+                return envelope['v']
+    
+    try:
+        started = time.time()
+        value = loader()
+        delta = time.time() - started
+        _cached_stats['recomputes'] += 1
+        cache_set(key, {'v': value, 'exp': started + delta + timeout, 'delta': delta},
+                  timeout + stale_timeout)
+        return value
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except:
+                pass
+
+class CursorPagination:
+    """Keyset page of results, loosely mirroring Flask-SQLAlchemy's Pagination
+
+    Only the forward direction is known, so page numbers and totals are not
+    available (``pages`` is 0 so page-number navigation stays hidden).
+    """
+    
+    page = None
+    pages = 0
+    total = None
+    has_prev = False
+    prev_num = None
+    next_num = None
+    
+    def __init__(self, items, per_page, cursor, next_cursor):
+        self.items = items
+        self.per_page = per_page
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+    
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+def encode_cursor(created_at, ident):
+    """Encode a (created_at, id) position as an opaque URL-safe token"""
+    raw = json.dumps([created_at.isoformat(), ident], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a token from encode_cursor, returning None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, ident = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(ident)
+    except (ValueError, TypeError):
+        return None
+
+def keyset_paginate(query, model, cursor=None, per_page=20):
+    """Paginate newest-first on (created_at, id) without OFFSET or COUNT(*)
+
+    ``query`` must not be ordered yet. An empty or invalid cursor starts from
+    the newest row. Each page costs a single index range scan regardless of
+    how deep it is.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, ident = position
+        # The leading <= keeps the predicate sargable so the index is seeked
+        query = query.filter(
+            model.created_at <= created_at,
+            or_(model.created_at < created_at, model.id < ident)
+        )
+    
+    rows = query.order_by(desc(model.created_at), desc(model.id)).limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+    
+    return CursorPagination(items, per_page, cursor, next_cursor)
+
+# Namespaced cache keys
+#
+# Every key built with cache_key() embeds the current generation of its
+# namespace ("feed", "post:<id>"). Bumping the generation with a
+# single INCR makes every key of the old generation unreachable at once; those
+# entries are never deleted explicitly and simply expire with their TTL.
+
+def cache_generation(namespace):
+    """Get the current generation number of a cache namespace"""
+    key = f"gen:{namespace}"
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        generation = local_cache.get(key)
+        if generation is not None:
+            return generation
+    if not redis_client:
+        return 0
+    try:
+        value = redis_client.get(key)
+        generation = int(value) if value else 0
+    except:
+        return 0
+    if local_cache is not None:
+        local_cache.set(key, generation, len(key))
+    return generation
+
+def cache_key(namespace, *parts):
+    """Build a cache key scoped to the current generation of ``namespace``"""
+    return ':'.join([namespace, f"g{cache_generation(namespace)}", *map(str, parts)])
+
+def cache_keys(namespaces, *parts):
+    """cache_key() for many namespaces, reading their generations in one MGET"""
+    namespaces = list(namespaces)
+    # Generation counters are plain INCR integers, which decode as legacy JSON
+    generations = cache_get_many([f"gen:{namespace}" for namespace in namespaces])
+    return [
+        ':'.join([namespace, f"g{generations.get(f'gen:{namespace}', 0)}", *map(str, parts)])
+        for namespace in namespaces
+    ]
+
+def cache_bump(*namespaces):
+    """Invalidate every key in the given namespaces (one INCR each, pipelined)"""
+    if not redis_client or not namespaces:
+        return False
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for namespace in namespaces:
+            pipe.incr(f"gen:{namespace}")
+        pipe.execute()
     except:
         return False
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        keys = [f"gen:{namespace}" for namespace in namespaces]
+        for key in keys:
+            local_cache.delete(key)
+        publish_invalidation(*keys)
+    return True
 
 def validate_file_content(file_path):
     """Validate file content using python-magic or fallback to extension"""
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+import logging
+import uuid
+import redis
+from collections import Counter
+from sqlalchemy import bindparam, func, update
+from app import db, redis_client
+
+# Write-behind view counting
+#
+# Page views are buffered instead of committing a transaction per hit: in a
+# Redis hash (HINCRBY, shared by all workers) or, without Redis, in a
+# per-process Counter. flush_views() moves the buffered deltas into
+# post.view_count with batched "view_count = view_count + :n" updates, either
+# from the background flusher thread or the `flask flush-views` command.
+# The same transaction adds them to the day's total in daily_stats.
+
+PENDING_KEY = 'views:pending'
+
+_local_pending = Counter()
+_local_lock = threading.Lock()
+
+# Keys this process claimed but could not read (a connection error after the
+# RENAME); the next flush picks them up
+_unread_claims = []
+
+_app = None
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def record_view(post_id, count=1):
+    """Buffer ``count`` views of a post"""
+    _ensure_flusher()
+    if redis_client:
+        try:
+            redis_client.hincrby(PENDING_KEY, post_id, count)
+            return
+        except Exception as e:
+            logging.warning(f"Buffering view in Redis failed, keeping it locally: {e}")
+    with _local_lock:
+        _local_pending[post_id] += count
+
+
+def pending_views(post_ids):
+    """Views buffered but not yet flushed, as ``{post_id: delta}``"""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {}
+    with _local_lock:
+        pending = {post_id: _local_pending.get(post_id, 0) for post_id in post_ids}
+    if redis_client:
+        try:
+            for post_id, value in zip(post_ids, redis_client.hmget(PENDING_KEY, post_ids)):
+                pending[post_id] += int(value or 0)
+        except Exception:
+            pass
+    return pending
+
+
+def prefetch_pending_views(posts):
+    """Attach pending deltas to loaded posts with one lookup (see Post.get_view_count)"""
+    pending = pending_views(post.id for post in posts)
+    for post in posts:
+        post._pending_views = pending.get(post.id, 0)
+    return posts
+
+
+def _take_pending():
+    """Atomically claim every buffered delta; returns (deltas, claimed redis keys)"""
+    with _local_lock:
+        deltas = Counter(_local_pending)
+        _local_pending.clear()
+        claimed = list(_unread_claims)
+        _unread_claims.clear()
+
+    if not redis_client:
+        return deltas, []
+
+    # RENAME is atomic, so concurrent flushers never claim the same views
+    claimed_key = f"views:flushing:{uuid.uuid4().hex}"
+    try:
+        redis_client.rename(PENDING_KEY, claimed_key)
+        claimed.append(claimed_key)
+    except redis.ResponseError:
+        pass  # No such key: nothing buffered in Redis
+    except Exception as e:
+        # The RENAME may still have happened; reading a missing key is harmless
+        logging.warning(f"Claiming buffered views failed: {e}")
+        claimed.append(claimed_key)
+
+    read = []
+    for key in claimed:
+        try:
+            redis_client.expire(key, 86400)
+            values = redis_client.hgetall(key)
+        except Exception as e:
+            logging.warning(f"Reading claimed views {key} failed, retrying on the next flush: {e}")
+            with _local_lock:
+                _unread_claims.append(key)
+            continue
+        for post_id, value in values.items():
+            deltas[int(post_id)] += int(value)
+        read.append(key)
+    return deltas, read
+
+
+def _restore_pending(deltas, claimed_keys):
+    if claimed_keys:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for post_id, value in deltas.items():
+                pipe.hincrby(PENDING_KEY, post_id, value)
+            pipe.delete(*claimed_keys)
+            pipe.execute()
+            return
+        except Exception as e:
+            logging.error(f"Could not return unflushed views to Redis: {e}")
+    with _local_lock:
+        _local_pending.update(deltas)
+
+
+def flush_views(batch_size=500):
+    """Apply buffered views to post.view_count in bulk; returns posts updated"""
+    from app.models import Post
+    from app.daily_stats import add_views
+
+    deltas, claimed_keys = _take_pending()
+    deltas = {post_id: n for post_id, n in deltas.items() if n}
+    if not deltas:
+        if claimed_keys:
+            redis_client.delete(*claimed_keys)
+        return 0
+
+    table = Post.__table__
+    statement = update(table)\
+        .where(table.c.id == bindparam('post_id'))\
+        .values(view_count=func.coalesce(table.c.view_count, 0) + bindparam('n'))
+    rows = [{'post_id': post_id, 'n': n} for post_id, n in sorted(deltas.items())]
+
+    try:
+        for i in range(0, len(rows), batch_size):
+            db.session.execute(statement, rows[i:i + batch_size])
+        add_views(sum(deltas.values()))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _restore_pending(deltas, claimed_keys)
+        raise
+
+    if claimed_keys:
+        redis_client.delete(*claimed_keys)
+    return len(rows)
+
+
+def _flush_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                flush_views(app.config['VIEW_FLUSH_BATCH_SIZE'])
+        except Exception as e:
+            logging.error(f"Flushing view counts failed: {e}")
+
+
+def _ensure_flusher():
+    """Start this process's background flusher on first use"""
+    global _flusher_pid
+    if _app is None or _flusher_pid == os.getpid():
+        return
+    interval = _app.config['VIEW_FLUSH_INTERVAL']
+    with _flusher_lock:
+        if _flusher_pid != os.getpid() and interval > 0:
+            threading.Thread(
+                target=_flush_loop,
+                args=(_app, interval),
+                name='view-flusher',
+                daemon=True
+            ).start()
+        _flusher_pid = os.getpid()
+
+
+def init_view_counts(app):
+    """Remember the app so the flusher thread can open app contexts"""
+    global _app
+    _app = app
@@ -0,0 +1,114 @@
+"""Compare the admin console's OR-ed LIKE scans with trigram-indexed search.
+
+Usage:
+    python benchmarks/bench_admin_search.py [--users 1000000] [--db /tmp/bench_admin.db]
+
+Seeds a SQLite database (a throwaway file unless --db names an existing one
+to reuse) with users, builds the FTS5 trigram index with the same code as
+`flask init-db`, then times what admin.manage_users runs per keystroke:
+the first page of matches newest first plus the total count, using the old
+`contains()` filters and substring_filter().
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIRST_NAMES = ['Alice', 'Bob', 'Carol', 'Dmitri', 'Eve', 'Fatima', 'Gustavo', 'Hiroshi',
+               'Ines', 'Jamal', 'Kerstin', 'Liang', 'Maya', 'Nikolai', 'Olu', 'Priya']
+LAST_NAMES = ['Smith', 'Garcia', 'Okafor', 'Nguyen', 'Kowalski', 'Haddad', 'Tanaka',
+              'Johansson', 'Rossi', 'Petrov', 'Silva', 'Mensah', 'Kim', 'Dubois']
+DOMAINS = ['example.com', 'mail.test', 'corp.example', 'uni.example.edu']
+
+
+def seed(db, User, total_users, rng):
+    start = datetime(2020, 1, 1)
+    batch = []
+    for i in range(total_users):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"{first.lower()}{last.lower()}{i}"
+        batch.append({
+            'username': username,
+            'email': f"{username}@{rng.choice(DOMAINS)}",
+            'password_hash': 'x',
+            'first_name': first,
+            'last_name': last,
+            'is_admin': False,
+            'is_active': True,
+            'created_at': start + timedelta(seconds=i),
+            'published_post_count': 0,
+            'approved_comment_count': 0,
+        })
+        if len(batch) == 20000:
+            db.session.execute(User.__table__.insert(), batch)
+            batch = []
+            print(f'  {i + 1} users', end='\r')
+    if batch:
+        db.session.execute(User.__table__.insert(), batch)
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--db', help='SQLite file to create or reuse')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'bench_admin.db')
+    reuse = os.path.exists(path)
+    os.environ['TEST_DATABASE_URL'] = f'sqlite:///{path}'
+
+    from sqlalchemy import desc
+    from app import create_app, db, trigram
+    from app.models import User
+
+    app = create_app('testing')
+    with app.app_context():
+        if not reuse:
+            db.create_all()
+            print(f'Seeding {args.users} users into {path}...')
+            seed(db, User, args.users, random.Random(args.seed))
+            started = time.perf_counter()
+            with db.engine.begin() as connection:
+                trigram.create_schema(connection)
+                trigram.rebuild(connection)
+            print(f'Trigram index built in {time.perf_counter() - started:.1f} s')
+
+        def old_filter(search):
+            return (User.username.contains(search) | User.email.contains(search) |
+                    User.first_name.contains(search) | User.last_name.contains(search))
+
+        def console_page(where):
+            return User.query.filter(where).order_by(desc(User.created_at), desc(User.id)) \
+                .paginate(page=1, per_page=20, error_out=False)
+
+        searches = ['kowalski', 'haddad12', 'priyasilva4242', 'uni.exam', 'zzz', 'ines']
+        print(f"{'search':<18} {'matches':>8} {'contains ms':>12} {'trigram ms':>11}")
+        for search in searches:
+            old_ms, old_page = timed(lambda: console_page(old_filter(search)), args.repeat)
+            new_ms, new_page = timed(lambda: console_page(trigram.substring_filter(User, search)),
+                                     args.repeat)
+            assert old_page.total == new_page.total, search
+            print(f"{search:<18} {new_page.total:>8} {old_ms:>12.1f} {new_ms:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Compare cache serializers and compression on realistic feed payloads.
+
+Usage:
+    python benchmarks/bench_cache_serialization.py [--iterations 200]
+
+Builds a feed page shaped like the one cached by main.index (10 posts with
+rendered content_html) and reports encode/decode time and payload size for
+every codec/compression pair. If REDIS_URL points at a reachable Redis the
+memory Redis reports for each stored payload is shown as well.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import markdown
+import redis
+
+from app.serialization import CacheSerializer, HAS_MSGPACK, HAS_ZSTD
+
+WORDS = ('community platform post media upload comment author markdown cache '
+         'redis bucket storage feed page python flask database index query').split()
+
+
+def paragraph(rng, words=80):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def feed_page(posts=10, paragraphs=30, seed=42):
+    rng = random.Random(seed)
+    items = []
+    for i in range(posts):
+        body = '\n\n'.join(
+            (f'## Section {n}\n\n' if n % 5 == 0 else '') + paragraph(rng)
+            for n in range(paragraphs)
+        )
+        items.append({
+            'id': i + 1,
+            'title': f'Post {i + 1}: ' + paragraph(rng, 6),
+            'content_html': markdown.markdown(body),
+            'summary': paragraph(rng, 30)[:200],
+            'author': 'Jane Smith',
+            'author_username': 'jane_smith',
+            'created_at': '2026-01-01 12:00',
+            'view_count': rng.randint(0, 10000),
+            'comment_count': rng.randint(0, 500),
+        })
+    return {'items': items, 'has_next': True, 'has_prev': False, 'next_num': 2,
+            'prev_num': None, 'next_cursor': 'abc', 'page': 1, 'pages': 100}
+
+
+def timed(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = fn()
+    return (time.perf_counter() - started) / iterations * 1e6, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+    
+    page = feed_page()
+    
+    client = None
+    try:
+        client = redis.from_url(os.environ.get('REDIS_URL') or 'redis://localhost:6379/0')
+        client.ping()
+    except Exception:
+        client = None
+    
+    codecs = ['json', 'pickle'] + (['msgpack'] if HAS_MSGPACK else [])
+    compressions = ['none', 'zlib'] + (['zstd'] if HAS_ZSTD else [])
+    
+    print(f"{'codec':>8} {'compress':>9} {'bytes':>9} {'encode us':>10} {'decode us':>10} {'redis bytes':>12}")
+    for codec in codecs:
+        for compression in compressions:
+            serializer = CacheSerializer(codec=codec, compression=compression)
+            encode_us, payload = timed(lambda: serializer.dumps(page), args.iterations)
+            decode_us, decoded = timed(lambda: serializer.loads(payload), args.iterations)
+            assert decoded == page
+            
+            redis_bytes = '-'
+            if client is not None:
+                key = f'bench:serialization:{codec}:{compression}'
+                client.set(key, payload)
+                redis_bytes = client.memory_usage(key)
+                client.delete(key)
+            
+            print(f'{codec:>8} {compression:>9} {len(payload):>9} {encode_us:>10.1f} '
+                  f'{decode_us:>10.1f} {redis_bytes:>12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Compare index route latency with the per-worker L1 cache on and off.
+
+Usage:
+    REDIS_URL=redis://localhost:6379/0 python benchmarks/bench_cache_tiers.py [--requests 2000]
+
+Requires a reachable Redis. Seeds an in-memory SQLite database, warms the
+feed cache, then reports p50/p99 for GET / served from Redis only and from
+the L1 tier.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+import app as app_module
+from app import local_cache as local_cache_module
+from app.local_cache import init_local_cache
+from app.models import User, Post
+
+
+def seed(posts):
+    user = User(username='bench', email='bench@example.com', first_name='Bench', last_name='User')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.commit()
+    body = '\n\n'.join(['Lorem ipsum dolor sit amet, **consectetur** adipiscing elit.'] * 40)
+    for i in range(posts):
+        db.session.add(Post(title=f'Post {i}', content=body, summary=body[:200], user_id=user.id))
+    db.session.commit()
+
+
+def measure(client, requests):
+    client.get('/')  # warm the cache tier under test
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get('/')
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=30)
+    args = parser.parse_args()
+    
+    app = create_app('testing')
+    if app_module.redis_client is None:
+        sys.exit('Redis is not reachable; set REDIS_URL')
+    
+    with app.app_context():
+        db.create_all()
+        seed(args.posts)
+        client = app.test_client()
+        
+        local_cache_module.local_cache = None
+        off = measure(client, args.requests)
+        
+        init_local_cache(app, app_module.redis_client)
+        on = measure(client, args.requests)
+        
+        print(f"{'L1':>4} {'p50 ms':>10} {'p99 ms':>10}")
+        print(f"{'off':>4} {off[0]:>10.3f} {off[1]:>10.3f}")
+        print(f"{'on':>4} {on[0]:>10.3f} {on[1]:>10.3f}")
+        print(local_cache_module.local_cache.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Compare single-stream and chunked parallel uploads against a simulated object store.
+
+Usage:
+    python benchmarks/bench_chunked_upload.py [--size-mb 100] [--bandwidth-mb 20] [--latency 0.03]
+
+Uploads one --size-mb file to transfer.LocalObjectStore, which charges every
+request --latency seconds and caps each stream at --bandwidth-mb MB/s (the
+per-connection limit that parallel parts work around). Reports throughput
+for the single stream and for chunked_upload() at several concurrencies,
+checking each stored object against the source. --failure-rate makes that
+share of part uploads fail midway to show the cost of per-part retries.
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transfer import MiB, LocalObjectStore, TransferConfig, chunked_upload
+
+
+def digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(MiB), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=100)
+    parser.add_argument('--bandwidth-mb', type=float, default=20, help='per stream, MB/s')
+    parser.add_argument('--latency', type=float, default=0.03, help='seconds per request')
+    parser.add_argument('--part-size-mb', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_upload_')
+    source = os.path.join(workdir, 'source.bin')
+    with open(source, 'wb') as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(MiB))
+    expected = digest(source)
+
+    def run(label, upload):
+        store = LocalObjectStore(
+            os.path.join(workdir, 'store'), latency=args.latency,
+            bandwidth=args.bandwidth_mb * MiB, failure_rate=args.failure_rate, seed=42
+        )
+        with open(source, 'rb') as f:
+            started = time.perf_counter()
+            path = upload(store, f)
+            elapsed = time.perf_counter() - started
+        ok = 'ok' if digest(path) == expected else 'MISMATCH'
+        print(f"{label:<22} {elapsed:>8.2f} {args.size_mb / elapsed:>8.1f} "
+              f"{store.requests:>9} {store.failures:>9}  {ok}")
+        shutil.rmtree(store.root)
+
+    print(f"{args.size_mb} MB, {args.bandwidth_mb} MB/s per stream, "
+          f"{args.latency * 1000:.0f} ms per request, {args.part_size_mb} MB parts")
+    print(f"{'upload':<22} {'seconds':>8} {'MB/s':>8} {'requests':>9} {'failures':>9}")
+    try:
+        run('single stream', lambda store, f: store.put('media/object.bin', f, None))
+        for concurrency in args.concurrency:
+            config = TransferConfig(part_size=args.part_size_mb * MiB, concurrency=concurrency,
+                                    threshold=0, backoff=0.05)
+            run(f'chunked x{concurrency}',
+                lambda store, f: chunked_upload(store, f, 'media/object.bin', config=config))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
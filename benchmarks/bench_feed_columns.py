@@ -0,0 +1,124 @@
+"""Measure what a feed page costs with and without the deferred post body.
+
+Usage:
+    python benchmarks/bench_feed_columns.py [--posts 2000] [--body 50000] [--per-page 20]
+
+Seeds a SQLite database with posts carrying --body characters of Markdown
+(and its rendered HTML), then loads feed pages the way /api/posts does:
+"full" loads whole rows as before (body undeferred), "list" uses
+repositories.published_posts() (load_only, no body). Each variant runs in
+a fresh process and reports the bytes of column data fetched per page, the
+time to load a page, and how far loading pages raised the process's peak
+RSS above what it was after start-up.
+"""
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit',
+         'sed', 'do', 'eiusmod', 'tempor', 'incididunt', 'labore', 'magna', 'aliqua']
+
+
+def seed(db, User, Post, total_posts, body_length, rng):
+    db.session.execute(User.__table__.insert(), [{
+        'username': f'author{i}', 'email': f'author{i}@example.com', 'password_hash': 'x',
+        'first_name': 'Author', 'last_name': str(i), 'is_admin': False, 'is_active': True,
+        'created_at': datetime(2020, 1, 1), 'published_post_count': 0, 'approved_comment_count': 0,
+    } for i in range(50)])
+    start = datetime(2024, 1, 1)
+    batch = []
+    for i in range(total_posts):
+        body = ' '.join(rng.choice(WORDS) for _ in range(body_length // 6))[:body_length]
+        batch.append({
+            'title': f'Post {i}', 'content': body, 'content_html': f'<p>{body}</p>',
+            'summary': body[:200], 'summary_html': f'<p>{body[:200]}</p>', 'render_version': 1,
+            'created_at': start + timedelta(minutes=i), 'is_published': True,
+            'view_count': 0, 'approved_comment_count': 0, 'user_id': 1 + i % 50,
+        })
+        if len(batch) == 200:
+            db.session.execute(Post.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Post.__table__.insert(), batch)
+    db.session.commit()
+
+
+def run_variant(variant, pages, per_page):
+    from sqlalchemy import desc
+    from sqlalchemy.orm import joinedload, undefer_group
+    from app import create_app, db, repositories
+    from app.models import Post
+
+    app = create_app('testing')
+    with app.app_context():
+        if variant == 'full':
+            query = Post.query.filter_by(is_published=True)\
+                .options(undefer_group('body'), joinedload(Post.author))
+        else:
+            query = repositories.published_posts()
+        query = query.order_by(desc(Post.created_at), desc(Post.id))
+
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        for page in range(pages):
+            # Load a page and touch what a feed card shows
+            posts = query.limit(per_page).offset(page * per_page).all()
+            cards = [(post.title, post.summary_html, post.author.username) for post in posts]
+            db.session.expunge_all()
+        elapsed = (time.perf_counter() - started) / pages
+        growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+
+        fetched = 0
+        for page in range(pages):
+            # The exact SQL the ORM sends, run through the driver to see the raw values
+            sql = str(query.limit(per_page).offset(page * per_page).statement
+                      .compile(db.engine, compile_kwargs={'literal_binds': True}))
+            rows = db.session.connection().exec_driver_sql(sql).fetchall()
+            fetched += sum(len(str(value)) for row in rows for value in row if value is not None)
+            del rows
+    print(f"{variant:<5} {fetched / pages / 1024:>12.1f} {elapsed * 1000:>9.2f} {growth / 1024:>16.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--body', type=int, default=50000)
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--db', help='SQLite file to create or reuse')
+    parser.add_argument('--variant', choices=['full', 'list'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'bench_feed.db')
+    os.environ['TEST_DATABASE_URL'] = f'sqlite:///{path}'
+
+    if args.variant:
+        return run_variant(args.variant, args.pages, args.per_page)
+
+    if not os.path.exists(path):
+        from app import create_app, db
+        from app.models import User, Post
+
+        app = create_app('testing')
+        with app.app_context():
+            db.create_all()
+            print(f'Seeding {args.posts} posts of {args.body} characters into {path}...')
+            seed(db, User, Post, args.posts, args.body, random.Random(42))
+
+    print(f"{'query':<5} {'KiB per page':>12} {'ms/page':>9} {'peak RSS +MiB':>16}")
+    for variant in ('full', 'list'):
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--db', path,
+                        '--pages', str(args.pages), '--per-page', str(args.per_page),
+                        '--variant', variant], check=True)
+
+
+if __name__ == '__main__':
+    main()
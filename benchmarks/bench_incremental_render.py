@@ -0,0 +1,140 @@
+"""Measure edit-save rendering latency for long posts and check incremental output.
+
+Usage:
+    python benchmarks/bench_incremental_render.py [--length 50000] [--edits 50]
+                                                  [--check-docs 2000]
+
+First runs a differential check: random Markdown documents (lists, quotes,
+code, headings, rules, setext headings, odd blank lines and line endings)
+and random single-block edits of them are rendered both in full and block by
+block, and the outputs must match byte for byte for both allow-lists.
+
+Then builds a post of about ``--length`` characters, renders it once (as
+creating it would), and times saving ``--edits`` successive one-paragraph
+edits with a full render versus the incremental renderer.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(BENCH_DIR), BENCH_DIR]
+
+from bench_rendering import make_post, sentence
+from app.rendering import Renderer, split_blocks, POST_TAGS, POST_ATTRS, COMMENT_TAGS, COMMENT_ATTRS
+
+PIECES = [
+    lambda rng: sentence(rng),
+    lambda rng: f"# {sentence(rng, 4)}",
+    lambda rng: f"## {sentence(rng, 4)} ##",
+    lambda rng: f"{sentence(rng, 4)}\n{'=' * rng.randint(1, 5)}",
+    lambda rng: f"{sentence(rng, 4)}\n---",
+    lambda rng: f"- {sentence(rng)}\n- {sentence(rng)}",
+    lambda rng: f"1. {sentence(rng)}\n2. {sentence(rng)}",
+    lambda rng: f"  - nested {sentence(rng)}",
+    lambda rng: f"* {sentence(rng)}",
+    lambda rng: f"    code {sentence(rng)}\n    more",
+    lambda rng: '\tcode after a tab',
+    lambda rng: f"> {sentence(rng)}\n> {sentence(rng)}",
+    lambda rng: '***',
+    lambda rng: '* * *',
+    lambda rng: f"   {sentence(rng)}",
+    lambda rng: f"{sentence(rng)}  \n{sentence(rng)}",
+    lambda rng: f"See http://{rng.choice(['a', 'b'])}.example.com and <https://example.org/x>",
+    lambda rng: 'mail <someone@example.com> or someone@example.com',
+    lambda rng: '*unclosed\n\nemphasis*',
+    lambda rng: '`unclosed\n\ncode`',
+    lambda rng: '  ',
+    lambda rng: '    ',
+]
+SEPARATORS = ['\n\n', '\n', '\n\n\n', '\n  \n', '\r\n\r\n', '\n\t\n']
+# Whitespace-only lines before the first block (one can open a code block)
+PREFIXES = ['', '', '', '\n    \n', '\n\t\n', '\r\n    \r\n', '    \n\n', '\n  \n']
+
+
+def random_document(rng, blocks):
+    return rng.choice(PREFIXES) + ''.join(
+        rng.choice(PIECES)(rng) + rng.choice(SEPARATORS) for _ in range(blocks)
+    )
+
+
+def differential_check(documents, seed):
+    rng = random.Random(seed)
+    renderers = [Renderer('check-post', POST_TAGS, POST_ATTRS),
+                 Renderer('check-comment', COMMENT_TAGS, COMMENT_ATTRS)]
+    checked = 0
+    for _ in range(documents):
+        source = random_document(rng, rng.randint(1, 15))
+        edited = source.replace(rng.choice(source.split('\n')), sentence(rng), 1)
+        for text in (source, edited):
+            if split_blocks(text) is None:
+                continue
+            for renderer in renderers:
+                full = renderer.render_uncached(text)
+                incremental = renderer.render_incremental(text)
+                if full != incremental:
+                    raise AssertionError(f"Incremental render differs for {text!r}:\n"
+                                         f"{full!r}\n{incremental!r}")
+                checked += 1
+    print(f"differential check: {checked} renders identical")
+
+
+def long_post(rng, length):
+    parts = []
+    while sum(map(len, parts)) < length:
+        parts.append(make_post(rng))
+    return '\n\n'.join(parts)[:length].rsplit('\n\n', 1)[0]
+
+
+def edit_one_paragraph(rng, source):
+    blocks = source.split('\n\n')
+    candidates = [i for i, block in enumerate(blocks) if block[:1].isalpha()]
+    i = rng.choice(candidates)
+    blocks[i] = ' '.join(sentence(rng) for _ in range(rng.randint(2, 6)))
+    return '\n\n'.join(blocks)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--length', type=int, default=50000)
+    parser.add_argument('--edits', type=int, default=50)
+    parser.add_argument('--check-docs', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    differential_check(args.check_docs, args.seed)
+
+    rng = random.Random(args.seed)
+    source = long_post(rng, args.length)
+    renderer = Renderer('bench', POST_TAGS, POST_ATTRS, incremental_threshold=4096)
+    print(f"post: {len(source)} chars, {len(split_blocks(source))} blocks")
+
+    create_ms, _ = timed(lambda: renderer.render(source))
+    print(f"initial render: {create_ms:.1f} ms")
+
+    full_ms, incremental_ms = [], []
+    for _ in range(args.edits):
+        source = edit_one_paragraph(rng, source)
+        elapsed, expected = timed(lambda: renderer.render_uncached(source))
+        full_ms.append(elapsed)
+        elapsed, html = timed(lambda: renderer.render(source))
+        incremental_ms.append(elapsed)
+        assert html == expected
+
+    for label, samples in (('full', full_ms), ('incremental', incremental_ms)):
+        samples.sort()
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{label:>12} edit save: p50 {statistics.median(samples):7.2f} ms  p95 {p95:7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Compare OFFSET/COUNT pagination with keyset (cursor) pagination on the feed.
+
+Usage:
+    python benchmarks/bench_pagination.py [--posts 100000] [--per-page 10]
+
+Seeds a throwaway in-memory SQLite database and times fetching pages from
+the first to the last page with both strategies.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import desc
+from app import create_app, db
+from app.models import User, Post
+from app.utils import keyset_paginate, encode_cursor
+
+
+def seed(total_posts):
+    user = User(username='bench', email='bench@example.com', first_name='Bench', last_name='User')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.commit()
+    
+    start = datetime(2020, 1, 1)
+    rows = [
+        {
+            'title': f'Post {i}',
+            'content': 'Lorem ipsum dolor sit amet. ' * 20,
+            'content_html': '<p>' + 'Lorem ipsum dolor sit amet. ' * 20 + '</p>',
+            'summary': 'Lorem ipsum',
+            'created_at': start + timedelta(seconds=i),
+            'updated_at': start + timedelta(seconds=i),
+            'is_published': True,
+            'view_count': 0,
+            'approved_comment_count': 0,
+            'user_id': user.id,
+        }
+        for i in range(total_posts)
+    ]
+    for i in range(0, len(rows), 10000):
+        db.session.execute(Post.__table__.insert(), rows[i:i + 10000])
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        print(f'Seeding {args.posts} posts...')
+        seed(args.posts)
+        
+        published = Post.query.filter_by(is_published=True)
+        last_page = max(1, args.posts // args.per_page)
+        pages = sorted({1, 10, 100, 1000, last_page // 2, last_page} & set(range(1, last_page + 1)))
+        
+        print(f"{'page':>8} {'offset ms':>12} {'cursor ms':>12}")
+        for page in pages:
+            offset_ms = timed(lambda: published.order_by(desc(Post.created_at), desc(Post.id)).paginate(
+                page=page, per_page=args.per_page, error_out=False).items, args.repeat)
+            
+            # Cursor pointing just before the requested page (not timed)
+            cursor = ''
+            if page > 1:
+                anchor = published.order_by(desc(Post.created_at), desc(Post.id))\
+                                  .offset((page - 1) * args.per_page - 1).first()
+                cursor = encode_cursor(anchor.created_at, anchor.id)
+            cursor_ms = timed(lambda: keyset_paginate(published, Post, cursor, per_page=args.per_page).items,
+                              args.repeat)
+            
+            print(f'{page:>8} {offset_ms:>12.2f} {cursor_ms:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Compare LIKE '%q%' scans with the full-text search backends.
+
+Usage:
+    python benchmarks/bench_search.py [--posts 1000000] [--db /tmp/bench_search.db]
+
+Seeds a SQLite database (a throwaway file unless --db names an existing one
+to reuse) with posts drawn from a Zipf-distributed vocabulary, builds the
+FTS5 index with the same code as `flask rebuild-search-index` and the
+in-process index of the memory backend, then times the search page query
+(ranked page + total + snippets) for common, medium, rare and multi-word
+queries with each backend.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def vocabulary(size, rng):
+    syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pa', 'do', 'gi']
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def seed(db, Post, User, total_posts, words, rng):
+    user = User(username='bench', email='bench@example.com', first_name='Bench', last_name='User')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.commit()
+
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    start = datetime(2020, 1, 1)
+    batch = []
+    for i in range(total_posts):
+        body = ' '.join(rng.choices(words, weights, k=rng.randint(40, 120)))
+        batch.append({
+            'title': ' '.join(rng.choices(words, weights, k=5)).capitalize(),
+            'content': body,
+            'content_html': f'<p>{body}</p>',
+            'created_at': start + timedelta(seconds=i),
+            'updated_at': start + timedelta(seconds=i),
+            'is_published': True,
+            'view_count': 0,
+            'approved_comment_count': 0,
+            'render_version': 1,
+            'user_id': user.id,
+        })
+        if len(batch) == 20000:
+            db.session.execute(Post.__table__.insert(), batch)
+            batch = []
+            print(f'  {i + 1} posts', end='\r')
+    if batch:
+        db.session.execute(Post.__table__.insert(), batch)
+    db.session.commit()
+
+
+def search_page(backend, query):
+    page = backend.search_posts(query, page=1, per_page=10)
+    for post in page.items:
+        page.snippet(post)
+    return page
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[-1], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--db', help='SQLite file to create or reuse')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+    reuse = os.path.exists(path)
+    os.environ['TEST_DATABASE_URL'] = f'sqlite:///{path}'
+
+    from app import create_app, db
+    from app.models import User, Post
+    from app.search import SearchBackend, SQLiteFTSBackend, MemorySearchBackend
+
+    rng = random.Random(args.seed)
+    words = vocabulary(5000, rng)
+    app = create_app('testing')
+    with app.app_context():
+        fts = SQLiteFTSBackend()
+        if not reuse:
+            db.create_all()
+            print(f'Seeding {args.posts} posts into {path}...')
+            started = time.perf_counter()
+            seed(db, Post, User, args.posts, words, rng)
+            print(f'Seeded in {time.perf_counter() - started:.1f} s')
+            started = time.perf_counter()
+            with db.engine.begin() as connection:
+                fts.rebuild(connection)
+            print(f'FTS5 index built in {time.perf_counter() - started:.1f} s')
+
+        memory = MemorySearchBackend()
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            memory.rebuild(connection)
+        print(f'Memory index built in {time.perf_counter() - started:.1f} s: {memory.posts.stats()}')
+        snapshot = os.path.join(os.path.dirname(path), 'bench_search.snapshot')
+        started = time.perf_counter()
+        memory.posts.save(snapshot)
+        saved = time.perf_counter() - started
+        started = time.perf_counter()
+        memory.posts.load(snapshot)
+        print(f'Snapshot: {os.path.getsize(snapshot) / 2 ** 20:.1f} MiB, saved in {saved:.2f} s, '
+              f'loaded in {time.perf_counter() - started:.2f} s')
+        os.remove(snapshot)
+
+        queries = [words[0], words[50], words[2000], words[4999],
+                   f'{words[10]} {words[300]}', f'{words[1]} {words[2]} {words[3]}']
+        backends = [('like', SearchBackend()), ('fts5', fts), ('memory', memory)]
+        print(f"{'query':<28} {'hits':>8} " + ' '.join(f'{name + " p50/max ms":>22}' for name, _ in backends))
+        for query in queries:
+            cells = []
+            for _, backend in backends:
+                p50, worst, page = timed(lambda: search_page(backend, query), args.repeat)
+                cells.append(f'{p50:>10.1f} / {worst:>9.1f}')
+            print(f'{query:<28} {page.total:>8} ' + ' '.join(f'{cell:>22}' for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
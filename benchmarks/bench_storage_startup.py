@@ -0,0 +1,83 @@
+"""Measure how long setting up CloudStorage holds up a worker, eager versus lazy.
+
+Usage:
+    python benchmarks/bench_storage_startup.py [--latency 0.25] [--first-request 0.6] [--runs 5]
+
+Replaces the GCS client with one whose every API call takes --latency
+seconds (credential lookup, bucket.exists()), then times:
+
+  eager    construct and connect at once (what importing storage.py did)
+  lazy     construct only; the first request pays for the connection
+  warm-up  construct and warm_up(); the connection happens in the background
+
+reporting the time CloudStorage added to the worker boot and how long its
+first storage call, --first-request seconds after boot, waited.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage as storage_module
+
+
+class SlowBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def exists(self):
+        time.sleep(self.client.latency)
+        return True
+
+
+class SlowClient:
+    latency = 0.0
+
+    def __init__(self, **kwargs):
+        time.sleep(self.latency)  # default-credentials lookup
+
+    def bucket(self, name):
+        return SlowBucket(self, name)
+
+
+def run(variant, first_request):
+    started = time.perf_counter()
+    backend = storage_module.CloudStorage()
+    if variant == 'eager':
+        backend._connect()
+    elif variant == 'warm-up':
+        backend.warm_up()
+    boot = time.perf_counter() - started
+
+    time.sleep(first_request)  # the rest of the worker boot and the first request arriving
+    started = time.perf_counter()
+    backend.current_bucket
+    first_call = time.perf_counter() - started
+    return boot, first_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.25, help='seconds per GCS call')
+    parser.add_argument('--first-request', type=float, default=0.6, help='seconds from boot to the first storage call')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    SlowClient.latency = args.latency
+    storage_module.gcs.Client = SlowClient
+
+    print(f"GCS calls at {args.latency * 1000:.0f} ms, median of {args.runs} runs")
+    print(f"{'variant':<8} {'boot ms':>9} {'first call ms':>14}")
+    for variant in ('eager', 'lazy', 'warm-up'):
+        results = [run(variant, args.first_request) for _ in range(args.runs)]
+        boot = statistics.median(result[0] for result in results)
+        first_call = statistics.median(result[1] for result in results)
+        print(f"{variant:<8} {boot * 1000:>9.1f} {first_call * 1000:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Measure search-as-you-type latency of the prefix index behind /api/search.
+
+Usage:
+    python benchmarks/bench_typeahead.py [--titles 1000000] [--queries 20000]
+
+Builds a PrefixIndex over generated post titles (Zipf-distributed words,
+best-ranked first, as TypeaheadIndex does) and replays the requests a user
+typing would send: growing prefixes of one word, and a full word followed
+by a partial one. Reports build time and p50/p99/max lookup latency for a
+top-10 answer, the part of a request the Redis result cache saves.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.typeahead import PrefixIndex
+
+
+def vocabulary(size, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    vowels = 'aeiou'
+    words = set()
+    while len(words) < size:
+        length = rng.randint(2, 5)
+        words.add(''.join(rng.choice(letters) + rng.choice(vowels) for _ in range(length))[:rng.randint(3, 10)])
+    return sorted(words)
+
+
+def typed_queries(rng, titles, count):
+    queries = []
+    while len(queries) < count:
+        words = rng.choice(titles).lower().split()
+        if rng.random() < 0.7:
+            word = rng.choice(words)
+            queries.append(word[:rng.randint(2, len(word))])
+        elif len(words) > 1:
+            i = rng.randrange(len(words) - 1)
+            queries.append(f"{words[i]} {words[i + 1][:rng.randint(1, len(words[i + 1]))]}")
+    return queries
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = vocabulary(30000, rng)
+    cum_weights = list(accumulate(1 / (rank + 1) for rank in range(len(words))))
+    titles = [' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(3, 8))).capitalize()
+              for _ in range(args.titles)]
+
+    started = time.perf_counter()
+    index = PrefixIndex(titles)
+    print(f"index over {len(titles)} titles: {len(index.words)} words, "
+          f"built in {time.perf_counter() - started:.1f} s")
+
+    queries = typed_queries(rng, titles, args.queries)
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, args.limit)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    print(f"{len(queries)} lookups: p50 {statistics.median(samples):.3f} ms  "
+          f"p99 {percentile(samples, 0.99):.3f} ms  max {samples[-1]:.3f} ms")
+
+    worst = sorted(queries, key=lambda query: -timed(index, query, args.limit))[:5]
+    for query in worst:
+        print(f"  slowest: {query!r} {timed(index, query, args.limit):.3f} ms")
+
+
+def timed(index, query, limit):
+    started = time.perf_counter()
+    index.search(query, limit)
+    return (time.perf_counter() - started) * 1000
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Check that the list views run a fixed number of queries whatever the page size.
+
+Usage:
+    python benchmarks/check_list_queries.py [--sizes 3 30]
+
+Builds the testing app on an in-memory SQLite database (Redis disabled, so
+no page is served from cache), seeds posts, comments and media spread over
+many authors, and requests every list view signed in as an admin once per
+page size (POSTS_PER_PAGE, COMMENTS_PER_PAGE, MEDIA_PER_PAGE and
+ADMIN_PER_PAGE all set to it). Statements are counted with a
+before_cursor_execute listener. A view whose count changes with the page
+size is lazy-loading relationships row by row; the script then exits
+non-zero.
+"""
+import argparse
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['TEST_DATABASE_URL'] = 'sqlite:///:memory:'
+os.environ['REDIS_URL'] = 'redis://127.0.0.1:1/0'
+
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User, Post, Comment, MediaFile
+
+PAGE_SIZES = ('POSTS_PER_PAGE', 'COMMENTS_PER_PAGE', 'MEDIA_PER_PAGE', 'ADMIN_PER_PAGE')
+
+VIEWS = [
+    ('index', '/?page=2'),
+    ('index (cursor)', '/?cursor='),
+    ('api_posts', '/api/posts'),
+    ('api_posts (cursor)', '/api/posts?cursor='),
+    ('api_posts (fields)', '/api/posts?fields=id,title,summary_html'),
+    ('blog_detail comments', '/blog/1'),
+    ('media_gallery', '/media'),
+    ('media_gallery (cursor)', '/media?cursor='),
+    ('admin/posts', '/admin/posts'),
+    ('admin/comments', '/admin/comments'),
+    ('admin/media', '/admin/media'),
+]
+
+
+def seed(authors=80, posts=120, comments=300, media=100):
+    admin = User(username='admin', email='admin@example.com', first_name='Ad', last_name='Min', is_admin=True)
+    admin.set_password('admin')
+    db.session.add(admin)
+    db.session.commit()
+
+    now = datetime.utcnow()
+    db.session.execute(User.__table__.insert(), [
+        dict(username=f'user{i}', email=f'user{i}@example.com', first_name='User', last_name=str(i),
+             password_hash='x', created_at=now, is_active=True)
+        for i in range(authors)
+    ])
+    # Every row on a page has a different author (and post), so a lazy load
+    # per row shows up as extra statements
+    db.session.execute(Post.__table__.insert(), [
+        dict(title=f'Post {i}', content='Body', content_html='<p>Body</p>', summary_html='<p>Body</p>',
+             user_id=2 + i % authors, created_at=now - timedelta(minutes=i), is_published=True,
+             view_count=0, approved_comment_count=0)
+        for i in range(posts)
+    ])
+    # Half the comments on the first post, for its detail page
+    db.session.execute(Comment.__table__.insert(), [
+        dict(content=f'Comment {i}', content_html=f'<p>Comment {i}</p>', user_id=2 + (i * 7) % authors,
+             post_id=1 if i % 2 else 1 + i % posts, created_at=now - timedelta(seconds=i), is_approved=True)
+        for i in range(comments)
+    ])
+    db.session.execute(MediaFile.__table__.insert(), [
+        dict(filename=f'file{i}.png', original_filename=f'file{i}.png', file_type='image', file_size=10,
+             user_id=2 + i % authors, post_id=1 + i if i % 2 else None, created_at=now - timedelta(seconds=i))
+        for i in range(media)
+    ])
+    db.session.commit()
+    return admin.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[3, 30])
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    app.config['VIEW_FLUSH_INTERVAL'] = 0  # no flusher thread writing during the counts
+    with app.app_context():
+        db.create_all()
+        admin_id = seed()
+        engine = db.engine
+
+    # Only statements issued by the request, not by background threads
+    counting = {'thread': None, 'statements': 0}
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(*args):
+        if threading.get_ident() == counting['thread']:
+            counting['statements'] += 1
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+
+    def statements(url):
+        client.get(url)  # warm up one-time lookups (table checks, first loads)
+        counting['thread'] = threading.get_ident()
+        counting['statements'] = 0
+        try:
+            response = client.get(url)
+        finally:
+            counting['thread'] = None
+        if response.status_code != 200:
+            raise AssertionError(f'{url} returned {response.status_code}')
+        return counting['statements']
+
+    failures = 0
+    print(f"{'view':<24} " + ' '.join(f'{f"{size}/page":>8}' for size in args.sizes))
+    for name, url in VIEWS:
+        counts = []
+        for size in args.sizes:
+            app.config.update({setting: size for setting in PAGE_SIZES})
+            try:
+                counts.append(statements(url))
+            except Exception as e:
+                counts.append(None)
+                print(f'  {name}: {type(e).__name__}: {e}')
+        constant = None not in counts and len(set(counts)) == 1
+        failures += not constant
+        print(f"{name:<24} " + ' '.join(f'{str(n):>8}' for n in counts) + ('' if constant else '  FAIL'))
+
+    print('all views constant' if not failures else f'{failures} views vary with the page size')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
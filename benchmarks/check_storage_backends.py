@@ -0,0 +1,323 @@
+"""Run the StorageBackend conformance checks and throughput measurements.
+
+Usage:
+    python benchmarks/check_storage_backends.py [--backend memory local s3 gcs] [--live]
+                                                [--objects 200] [--large-mb 32]
+
+Runs fully offline by default: local in a temporary directory, s3 against an
+in-process S3 client and gcs through a storage.CloudStorage on an in-process
+GCS client (benchmarks/fake_stores.py), so throughput figures for those two
+only measure the backend code. The fakes also run backend-specific checks:
+failed S3 batch deletes, and GCS usage counters and bucket extension.
+
+With --live, s3 and gcs are built by storage_backends.create_backend() from
+the environment instead (STORAGE_BACKEND is overridden; AWS_S3_BUCKET and
+credentials, or the GCS settings storage.py reads) and only touch keys under
+a random prefix, which is removed afterwards. Exits non-zero if any check
+fails.
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(BENCH_DIR), BENCH_DIR]
+
+from storage_backends import (
+    HAS_BOTO3, ObjectNotFound, GCSBackend, LocalBackend, MemoryBackend, S3Backend, create_backend
+)
+from transfer import MiB
+
+CHECKS = []
+
+
+def check(fn):
+    CHECKS.append(fn)
+    return fn
+
+
+def expect(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def raises_not_found(fn):
+    try:
+        fn()
+    except ObjectNotFound:
+        return True
+    return False
+
+
+def same_key(stored, key):
+    """Whether put() returned ``key``, possibly qualified with a bucket"""
+    return stored == key or stored.startswith(('gs://', 's3://')) and stored.endswith('/' + key)
+
+
+@check
+def round_trip(backend, prefix):
+    data = os.urandom(100 * 1024)
+    info = backend.put(f'{prefix}a/file.bin', io.BytesIO(data), 'application/octet-stream')
+    expect(same_key(info.key, f'{prefix}a/file.bin') and info.size == len(data), f'put returned {info}')
+    for key in (info.key, f'{prefix}a/file.bin'):
+        stat = backend.stat(key)
+        expect(stat.size == len(data) and stat.content_type and stat.updated, f'stat returned {stat}')
+        expect(backend.get(key) == data, 'get does not return what was put')
+
+
+@check
+def empty_object(backend, prefix):
+    backend.put(f'{prefix}empty.txt', io.BytesIO(b''), 'text/plain')
+    expect(backend.stat(f'{prefix}empty.txt').size == 0, 'empty object has a size')
+    expect(backend.get(f'{prefix}empty.txt') == b'', 'empty object has content')
+
+
+@check
+def overwrite(backend, prefix):
+    backend.put(f'{prefix}over.txt', io.BytesIO(b'first version'), 'text/plain')
+    backend.put(f'{prefix}over.txt', io.BytesIO(b'second'), 'text/plain')
+    expect(backend.get(f'{prefix}over.txt') == b'second', 'put does not replace the object')
+    expect(backend.stat(f'{prefix}over.txt').size == 6, 'stat size not updated by overwrite')
+
+
+@check
+def streaming(backend, prefix):
+    data = os.urandom(3 * 64 * 1024 + 17)
+    backend.put(f'{prefix}stream.bin', io.BytesIO(data), None)
+    chunks = list(backend.stream(f'{prefix}stream.bin', chunk_size=64 * 1024))
+    expect(b''.join(chunks) == data, 'stream does not reproduce the object')
+    expect(all(len(chunk) <= 64 * 1024 for chunk in chunks), 'stream chunk larger than chunk_size')
+    expect(len(chunks) >= 4, f'stream returned {len(chunks)} chunks for 4 chunks of data')
+
+
+@check
+def missing_keys(backend, prefix):
+    key = f'{prefix}missing/{uuid.uuid4().hex}'
+    expect(backend.stat(key) is None, 'stat of a missing key is not None')
+    expect(raises_not_found(lambda: backend.get(key)), 'get of a missing key does not raise ObjectNotFound')
+    expect(raises_not_found(lambda: backend.stream(key)), 'stream of a missing key does not raise at once')
+    expect(backend.delete(key) is False, 'delete of a missing key does not return False')
+
+
+@check
+def delete(backend, prefix):
+    backend.put(f'{prefix}gone.txt', io.BytesIO(b'x'), 'text/plain')
+    expect(backend.delete(f'{prefix}gone.txt') is True, 'delete of an existing key does not return True')
+    expect(backend.stat(f'{prefix}gone.txt') is None, 'deleted object still has a stat')
+
+
+@check
+def listing(backend, prefix):
+    keys = [f'{prefix}list/{name}' for name in ('b.txt', 'a.txt', 'sub/c.txt', 'sub/d.txt')]
+    for key in keys:
+        backend.put(key, io.BytesIO(key.encode()), 'text/plain')
+    listed = [info.key for info in backend.list(f'{prefix}list/')]
+    expect(listed == sorted(keys), f'list returned {listed}')
+    expect([info.key for info in backend.list(f'{prefix}list/sub/')] == sorted(keys)[2:], 'list by sub-prefix')
+    expect(len(backend.list(f'{prefix}list/', limit=2)) == 2, 'list ignores limit')
+    expect(all(info.size == len(info.key) for info in backend.list(f'{prefix}list/')), 'list sizes')
+
+
+@check
+def batches(backend, prefix):
+    items = [(f'{prefix}batch/{i:03d}.txt', io.BytesIO(b'%d' % i), 'text/plain') for i in range(20)]
+    infos = backend.put_many(items)
+    expect(all(same_key(info.key, item[0]) for info, item in zip(infos, items)) and len(infos) == 20,
+           'put_many results out of order')
+    expect(len(backend.list(f'{prefix}batch/')) == 20, 'put_many did not store every item')
+    deleted = backend.delete_many([item[0] for item in items] + [f'{prefix}batch/none.txt'])
+    expect(deleted == 20, f'delete_many reported {deleted} of 20 existing keys')
+    expect(backend.list(f'{prefix}batch/') == [], 'delete_many left objects behind')
+
+
+@check
+def large_object(backend, prefix):
+    # Above the default multipart threshold, so s3 and gcs go through parts
+    data = os.urandom(20 * MiB + 5)
+    backend.put(f'{prefix}large.bin', io.BytesIO(data), None)
+    expect(backend.stat(f'{prefix}large.bin').size == len(data), 'large object size')
+    expect(backend.get(f'{prefix}large.bin') == data, 'large object content')
+
+
+@check
+def urls(backend, prefix):
+    url = backend.url(f'{prefix}a/file.bin')
+    expect(url is None or isinstance(url, str) and url.endswith(f'{prefix}a/file.bin'), f'url {url}')
+
+
+# Checks of one backend's own behaviour, run against the offline fakes
+
+S3_CHECKS = []
+GCS_CHECKS = []
+
+
+def s3_check(fn):
+    S3_CHECKS.append(fn)
+    return fn
+
+
+def gcs_check(fn):
+    GCS_CHECKS.append(fn)
+    return fn
+
+
+@s3_check
+def batch_delete_errors(backend, prefix):
+    keys = [f'{prefix}errors/{i}.txt' for i in range(3)]
+    for key in keys:
+        backend.put(key, io.BytesIO(b'x'), 'text/plain')
+    backend.client.fail_deletes = {keys[1]}
+    try:
+        backend.delete_many(keys)
+        raise AssertionError('delete_many ignored the Errors of DeleteObjects')
+    except RuntimeError:
+        pass
+    finally:
+        backend.client.fail_deletes = set()
+    expect([info.key for info in backend.list(f'{prefix}errors/')] == [keys[1]], 'failed key not kept')
+    expect(backend.delete_many(keys) == 1, 'delete_many counted keys that did not exist')
+
+
+@gcs_check
+def usage_counters(backend, prefix):
+    cloud = backend.storage
+    backend.put(f'{prefix}usage/a.bin', io.BytesIO(b'a' * 1000), None)
+    backend.put(f'{prefix}usage/a.bin', io.BytesIO(b'a' * 10), None)
+    backend.put(f'{prefix}usage/b.bin', io.BytesIO(b'b' * 500), None)
+    backend.delete(f'{prefix}usage/b.bin')
+    backend.delete_many([f'{prefix}usage/b.bin', f'{prefix}usage/none.bin'])
+    drift = cloud._reconcile_bucket(cloud.current_bucket_name)
+    expect(drift == {'bytes': 0, 'objects': 0}, f'usage counters drifted by {drift}')
+
+
+@gcs_check
+def bucket_extension(backend, prefix):
+    cloud = backend.storage
+    data = os.urandom(4096)
+    first = backend.put(f'{prefix}switch/old.bin', io.BytesIO(data), None)
+    old_bucket = cloud.current_bucket_name
+    quota = cloud.storage_quota_gb
+    cloud.storage_quota_gb = 1e-9  # the bucket is now over the critical threshold
+    try:
+        second = backend.put(f'{prefix}switch/new.bin', io.BytesIO(b'new'), None)
+    finally:
+        cloud.storage_quota_gb = quota
+    expect(cloud.current_bucket_name != old_bucket, 'a full bucket did not extend storage')
+    expect(second.key.startswith(f'gs://{cloud.current_bucket_name}/'), f'new object stored as {second.key}')
+    expect(backend.get(first.key) == data, 'object in the previous bucket unreadable after extension')
+    expect(backend.url(first.key).split('/')[3] == old_bucket, 'url points at the wrong bucket')
+    expect(backend.delete(first.key) is True, 'delete missed the object in the previous bucket')
+    expect(backend.stat(first.key) is None, 'object in the previous bucket survived delete')
+    drift = cloud._reconcile_bucket(old_bucket)
+    expect(drift == {'bytes': 0, 'objects': 0}, f'previous bucket counters drifted by {drift}')
+    backend.delete(second.key)
+
+
+def conformance(backend, prefix, checks=CHECKS):
+    failures = 0
+    for fn in checks:
+        try:
+            fn(backend, prefix)
+            print(f'  ok    {fn.__name__}')
+        except Exception as e:
+            failures += 1
+            print(f'  FAIL  {fn.__name__}: {type(e).__name__}: {e}')
+    return failures
+
+
+def throughput(backend, prefix, objects, large_mb):
+    small = [(f'{prefix}tp/{i:05d}.bin', io.BytesIO(os.urandom(4096)), None) for i in range(objects)]
+    started = time.perf_counter()
+    backend.put_many(small)
+    put_rate = objects / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for key, _, _ in small:
+        backend.stat(key)
+    stat_rate = objects / (time.perf_counter() - started)
+
+    data = os.urandom(large_mb * MiB)
+    started = time.perf_counter()
+    backend.put(f'{prefix}tp-large.bin', io.BytesIO(data), None)
+    put_mb = large_mb / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in backend.stream(f'{prefix}tp-large.bin'))
+    stream_mb = size / MiB / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    backend.delete_many(key for key, _, _ in small)
+    delete_rate = objects / (time.perf_counter() - started)
+
+    print(f'  {objects} x 4 KiB: put_many {put_rate:,.0f}/s, stat {stat_rate:,.0f}/s, '
+          f'delete_many {delete_rate:,.0f}/s')
+    print(f'  {large_mb} MiB object: put {put_mb:,.1f} MiB/s, stream {stream_mb:,.1f} MiB/s')
+
+
+def cleanup(backend, prefix):
+    backend.delete_many(info.key for info in backend.list(prefix))
+
+
+def offline_backend(name, workdir):
+    """``(backend, extra checks)`` for a backend that needs no network"""
+    if name == 'memory':
+        return MemoryBackend(), []
+    if name == 'local':
+        return LocalBackend(workdir), []
+    if name == 's3':
+        if not HAS_BOTO3:
+            return None, []
+        from fake_stores import FakeS3Client
+        return S3Backend(FakeS3Client(), 'conformance', 'us-east-1'), S3_CHECKS
+
+    import storage as storage_module
+    from fake_stores import FakeGCSClient
+    cloud = storage_module.CloudStorage()
+    cloud.usage = storage_module.BucketUsage()  # counters in process memory
+    cloud._update_config = lambda: None  # leave .env.runtime alone when extending
+    cloud._client = FakeGCSClient()
+    cloud.current_bucket = cloud._get_or_create_bucket(cloud.current_bucket_name)
+    return GCSBackend(cloud), GCS_CHECKS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', nargs='+', default=['memory', 'local', 's3', 'gcs'],
+                        choices=['memory', 'local', 's3', 'gcs'])
+    parser.add_argument('--live', action='store_true', help='run s3 and gcs against real buckets')
+    parser.add_argument('--objects', type=int, default=200)
+    parser.add_argument('--large-mb', type=int, default=32)
+    args = parser.parse_args()
+
+    failures = 0
+    for name in args.backend:
+        workdir = tempfile.mkdtemp(prefix='storage_backend_')
+        if args.live and name in ('s3', 'gcs'):
+            backend, extra = create_backend(dict(os.environ, STORAGE_BACKEND=name)), []
+        else:
+            backend, extra = offline_backend(name, workdir)
+        prefix = f'conformance-{uuid.uuid4().hex[:8]}/'
+
+        print(f"{name}{'' if args.live or name in ('memory', 'local') else ' (offline fake)'}:")
+        if backend is None:
+            print('  skipped: boto3 is not installed')
+            shutil.rmtree(workdir, ignore_errors=True)
+            continue
+        try:
+            failures += conformance(backend, prefix, CHECKS + extra)
+            throughput(backend, prefix, args.objects, args.large_mb)
+        finally:
+            cleanup(backend, prefix)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print('all checks passed' if not failures else f'{failures} checks failed')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
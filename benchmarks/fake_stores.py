@@ -0,0 +1,269 @@
+"""In-process stand-ins for the S3 and GCS client APIs that storage_backends uses.
+
+Only the calls the backends, storage.CloudStorage and transfer.py make are
+implemented, with the behaviour the real services document for them
+(S3 DeleteObjects reports missing keys as deleted, GCS compose takes at most
+32 sources, ...). Used by check_storage_backends.py to run the conformance
+checks offline.
+"""
+import io
+import threading
+import uuid
+from datetime import datetime, timezone
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:
+    ClientError = None
+
+try:
+    from google.api_core.exceptions import NotFound
+except ImportError:
+    NotFound = None
+
+
+class FakeS3Client:
+    """One boto3 S3 client's worth of buckets in memory
+
+    Keys in ``fail_deletes`` come back under Errors from delete_objects.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.uploads = {}
+        self.fail_deletes = set()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _objects(self, bucket):
+        with self._lock:
+            self.requests += 1
+            return self.buckets.setdefault(bucket, {})
+
+    @staticmethod
+    def _error(code, operation):
+        return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+    @staticmethod
+    def _read(body):
+        return body.read() if hasattr(body, 'read') else bytes(body)
+
+    def _store(self, bucket, key, data, content_type):
+        self._objects(bucket)[key] = {
+            'data': data,
+            'ContentType': content_type or 'binary/octet-stream',
+            'LastModified': datetime.now(timezone.utc),
+        }
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self._store(Bucket, Key, self._read(Body), ContentType)
+        return {'ETag': uuid.uuid4().hex}
+
+    def head_object(self, Bucket, Key):
+        item = self._objects(Bucket).get(Key)
+        if item is None:
+            raise self._error('404', 'HeadObject')
+        return {'ContentLength': len(item['data']), 'ContentType': item['ContentType'],
+                'LastModified': item['LastModified']}
+
+    def get_object(self, Bucket, Key):
+        item = self._objects(Bucket).get(Key)
+        if item is None:
+            raise self._error('NoSuchKey', 'GetObject')
+        return {'Body': io.BytesIO(item['data']), 'ContentLength': len(item['data'])}
+
+    def delete_object(self, Bucket, Key):
+        self._objects(Bucket).pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        objects = self._objects(Bucket)
+        if len(Delete['Objects']) > 1000:
+            raise self._error('MalformedXML', 'DeleteObjects')
+        deleted, errors = [], []
+        for item in Delete['Objects']:
+            if item['Key'] in self.fail_deletes:
+                errors.append({'Key': item['Key'], 'Code': 'AccessDenied', 'Message': 'Access Denied'})
+            else:
+                # Missing keys are reported as deleted too
+                objects.pop(item['Key'], None)
+                deleted.append({'Key': item['Key']})
+        response = {'Errors': errors} if errors else {}
+        if not Delete.get('Quiet'):
+            response['Deleted'] = deleted
+        return response
+
+    def get_paginator(self, operation):
+        assert operation == 'list_objects_v2'
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix=''):
+                keys = sorted(key for key in client._objects(Bucket) if key.startswith(Prefix))
+                for i in range(0, max(len(keys), 1), 1000):
+                    objects = client._objects(Bucket)
+                    contents = [
+                        {'Key': key, 'Size': len(objects[key]['data']),
+                         'LastModified': objects[key]['LastModified']}
+                        for key in keys[i:i + 1000] if key in objects
+                    ]
+                    yield {'Contents': contents} if contents else {}
+
+        return Paginator()
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.uploads[upload_id] = {'key': Key, 'content_type': ContentType, 'parts': {}}
+        return {'UploadId': upload_id}
+
+    def _upload(self, upload_id, operation):
+        with self._lock:
+            self.requests += 1
+            if upload_id not in self.uploads:
+                raise self._error('NoSuchUpload', operation)
+            return self.uploads[upload_id]
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        etag = uuid.uuid4().hex
+        self._upload(UploadId, 'UploadPart')['parts'][PartNumber] = (etag, self._read(Body))
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self._upload(UploadId, 'CompleteMultipartUpload')
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        if numbers != sorted(numbers):
+            raise self._error('InvalidPartOrder', 'CompleteMultipartUpload')
+        data = []
+        for i, part in enumerate(MultipartUpload['Parts']):
+            etag, chunk = upload['parts'].get(part['PartNumber'], (None, b''))
+            if etag != part['ETag']:
+                raise self._error('InvalidPart', 'CompleteMultipartUpload')
+            if i < len(numbers) - 1 and len(chunk) < 5 * 1024 * 1024:
+                raise self._error('EntityTooSmall', 'CompleteMultipartUpload')
+            data.append(chunk)
+        self._store(Bucket, Key, b''.join(data), upload['content_type'])
+        with self._lock:
+            del self.uploads[UploadId]
+        return {'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        with self._lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+
+class FakeBlob:
+    """A google.cloud.storage Blob; metadata is filled in once loaded or uploaded"""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.size = None
+        self.content_type = None
+        self.updated = None
+
+    def _load(self):
+        item = self.bucket._objects.get(self.name)
+        if item is None:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        self.size = len(item['data'])
+        self.content_type = item['content_type']
+        self.updated = item['updated']
+        return item
+
+    def _write(self, data):
+        self.bucket._objects[self.name] = {
+            'data': data, 'content_type': self.content_type or 'application/octet-stream',
+            'updated': datetime.now(timezone.utc),
+        }
+        self._load()
+
+    def upload_from_file(self, file_obj, content_type=None):
+        self.content_type = content_type or self.content_type
+        self._write(file_obj.read())
+
+    def upload_from_string(self, data, content_type=None):
+        self.content_type = content_type or self.content_type
+        self._write(data)
+
+    def compose(self, sources):
+        if len(sources) > 32:
+            raise ValueError('compose takes at most 32 source objects')
+        self._write(b''.join(source._load()['data'] for source in sources))
+
+    def download_as_bytes(self):
+        return self._load()['data']
+
+    def open(self, mode='rb', chunk_size=None):
+        return io.BytesIO(self._load()['data'])
+
+    def make_public(self):
+        self._load()
+
+    def delete(self):
+        self._load()
+        self.bucket._objects.pop(self.name, None)
+
+    @property
+    def public_url(self):
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.lifecycle_rules = []
+
+    @property
+    def _objects(self):
+        return self.client._buckets[self.name]
+
+    def exists(self):
+        return self.name in self.client._buckets
+
+    def make_public(self, recursive=False, future=False):
+        pass
+
+    def patch(self):
+        pass
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        blob = FakeBlob(self, name)
+        try:
+            blob._load()
+        except NotFound:
+            return None
+        return blob
+
+    def list_blobs(self, prefix='', max_results=None, page_size=None, fields=None):
+        names = sorted(name for name in list(self._objects) if name.startswith(prefix or ''))
+        blobs = [blob for blob in map(self.get_blob, names) if blob is not None]
+        return blobs[:max_results] if max_results is not None else blobs
+
+    def delete_blobs(self, blobs, on_error=None):
+        for blob in blobs:
+            try:
+                self.blob(blob.name).delete()
+            except NotFound:
+                if on_error is None:
+                    raise
+                on_error(blob)
+
+
+class FakeGCSClient:
+    """The google.cloud.storage Client calls CloudStorage makes"""
+
+    def __init__(self):
+        self._buckets = {}
+
+    def bucket(self, name):
+        return FakeBucket(self, name)
+
+    def create_bucket(self, name, location=None):
+        self._buckets.setdefault(name, {})
+        return FakeBucket(self, name)
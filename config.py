@@ -16,6 +16,18 @@ class Config:
     # File upload configuration
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'app/static/uploads'
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max file size
+    UPLOAD_PART_SIZE_MB = int(os.environ.get('UPLOAD_PART_SIZE_MB') or 8)  # S3 needs at least 5
+    UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY') or 4)  # parts in flight per upload
+    UPLOAD_MULTIPART_THRESHOLD_MB = int(os.environ.get('UPLOAD_MULTIPART_THRESHOLD_MB') or 16)  # smaller files go in one stream
+    UPLOAD_PART_RETRIES = int(os.environ.get('UPLOAD_PART_RETRIES') or 3)
+    
+    # Media storage: s3, gcs, local, memory or auto (s3 when AWS_S3_BUCKET is set, else local)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'auto'
+    STORAGE_LOCAL_ROOT = os.environ.get('STORAGE_LOCAL_ROOT') or 'app/static'  # local backend, served below /static
+    AWS_S3_BUCKET = os.environ.get('AWS_S3_BUCKET')
+    AWS_S3_REGION = os.environ.get('AWS_S3_REGION') or 'us-east-1'
+    AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
+    AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
     ALLOWED_EXTENSIONS = {
         'image': {'png', 'jpg', 'jpeg', 'gif', 'webp'},
         'video': {'mp4', 'avi', 'mov', 'wmv', 'flv'},
@@ -42,6 +54,7 @@ class Config:
     POSTS_PER_PAGE = 10
     COMMENTS_PER_PAGE = 20
     MEDIA_PER_PAGE = 12
+    ADMIN_PER_PAGE = 20
     
     # Content settings
     MAX_BLOG_TITLE_LENGTH = 200
@@ -50,8 +63,51 @@ class Config:
     MAX_BIO_LENGTH = 500
     
     # Cache configuration
+    REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
     CACHE_TYPE = os.environ.get('CACHE_TYPE') or 'simple'
     CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_SERIALIZER = os.environ.get('CACHE_SERIALIZER') or 'msgpack'  # json, msgpack or pickle
+    CACHE_COMPRESSION = os.environ.get('CACHE_COMPRESSION') or 'zstd'  # none, zlib or zstd
+    CACHE_COMPRESS_THRESHOLD = int(os.environ.get('CACHE_COMPRESS_THRESHOLD') or 1024)
+    CACHE_COMPRESSION_LEVEL = int(os.environ.get('CACHE_COMPRESSION_LEVEL') or 3)
+    
+    # Optional per-worker L1 cache in front of Redis
+    CACHE_L1_ENABLED = os.environ.get('CACHE_L1_ENABLED', 'false').lower() in ['true', 'on', '1']
+    CACHE_L1_MAX_ENTRIES = int(os.environ.get('CACHE_L1_MAX_ENTRIES') or 1024)
+    CACHE_L1_MAX_BYTES = int(os.environ.get('CACHE_L1_MAX_BYTES') or 32 * 1024 * 1024)
+    CACHE_L1_TTL = int(os.environ.get('CACHE_L1_TTL') or 30)
+    CACHE_INVALIDATION_CHANNEL = os.environ.get('CACHE_INVALIDATION_CHANNEL') or 'cache-invalidation'
+    
+    # View counting (buffered, flushed to the database in bulk)
+    VIEW_FLUSH_INTERVAL = int(os.environ.get('VIEW_FLUSH_INTERVAL') or 30)  # seconds, 0 disables
+    VIEW_FLUSH_BATCH_SIZE = 500
+    
+    # Markdown rendering memo (per-process LRU, optionally shared through Redis)
+    RENDER_MEMO_REDIS = os.environ.get('RENDER_MEMO_REDIS', 'true').lower() in ['true', 'on', '1']
+    RENDER_MEMO_ENTRIES = int(os.environ.get('RENDER_MEMO_ENTRIES') or 4096)
+    RENDER_MEMO_BYTES = int(os.environ.get('RENDER_MEMO_BYTES') or 16 * 1024 * 1024)
+    RENDER_MEMO_TTL = int(os.environ.get('RENDER_MEMO_TTL') or 7 * 86400)
+    
+    # Full-text search: auto (by database), fts5, postgres, memory or like
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'auto'
+    SEARCH_SNAPSHOT_PATH = os.environ.get('SEARCH_SNAPSHOT_PATH', 'search_index.snapshot')  # memory backend, '' disables
+    SEARCH_MEMORY_REFRESH = int(os.environ.get('SEARCH_MEMORY_REFRESH') or 30)  # seconds between reconciles, 0 disables
+    
+    # Search-as-you-type (/api/search)
+    TYPEAHEAD_RESULTS = 10
+    TYPEAHEAD_REFRESH = int(os.environ.get('TYPEAHEAD_REFRESH') or 300)  # seconds between index rebuilds
+    TYPEAHEAD_CACHE_TTL = int(os.environ.get('TYPEAHEAD_CACHE_TTL') or 30)
+    TYPEAHEAD_DEBOUNCE_MS = int(os.environ.get('TYPEAHEAD_DEBOUNCE_MS') or 100)  # per client, 0 disables
+    
+    # Daily analytics rollups (`flask rollup-stats`)
+    STATS_ROLLUP_LOOKBACK = int(os.environ.get('STATS_ROLLUP_LOOKBACK') or 2)  # trailing days re-counted each run
+    
+    # Admin dashboard snapshot (refreshed in the background while the dashboard is in use)
+    DASHBOARD_REFRESH = int(os.environ.get('DASHBOARD_REFRESH') or 60)  # seconds, 0 re-collects on a view once DASHBOARD_IDLE old
+    DASHBOARD_IDLE = int(os.environ.get('DASHBOARD_IDLE') or 900)  # stop refreshing after this long unviewed
+    STORAGE_STATS_REFRESH = int(os.environ.get('STORAGE_STATS_REFRESH') or 300)  # seconds, 0 lists on request or once DASHBOARD_IDLE old
+    STORAGE_STATS_WORKERS = int(os.environ.get('STORAGE_STATS_WORKERS') or 8)  # buckets listed concurrently
+    STORAGE_WARM_UP = os.environ.get('STORAGE_WARM_UP', 'true').lower() in ['true', 'on', '1']  # connect to GCS in the background at boot
     
     # Rate limiting
     RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL') or 'memory://'
@@ -65,6 +121,7 @@ class Config:
     ENABLE_REGISTRATION = os.environ.get('ENABLE_REGISTRATION', 'true').lower() in ['true', 'on', '1']
     ENABLE_FILE_UPLOAD = os.environ.get('ENABLE_FILE_UPLOAD', 'true').lower() in ['true', 'on', '1']
     ENABLE_COMMENTS = os.environ.get('ENABLE_COMMENTS', 'true').lower() in ['true', 'on', '1']
+    ENABLE_UNIQUE_VIEWS = os.environ.get('ENABLE_UNIQUE_VIEWS', 'true').lower() in ['true', 'on', '1']
     
     @staticmethod
     def init_app(app):
@@ -78,6 +135,9 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    SEARCH_SNAPSHOT_PATH = None
+    STORAGE_WARM_UP = False
+    STORAGE_BACKEND = 'memory'
 
 class ProductionConfig(Config):
     DEBUG = False
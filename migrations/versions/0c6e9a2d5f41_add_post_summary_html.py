@@ -0,0 +1,29 @@
+"""Add summary_html to posts
+
+Revision ID: 0c6e9a2d5f41
+Revises: f2b8d0c4e613
+Create Date: 2026-03-02 11:26:09.574183
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c6e9a2d5f41'
+down_revision = 'f2b8d0c4e613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('summary_html', sa.Text(), nullable=True))
+
+    # Mark every post stale so `flask rerender-html` fills in summary_html
+    op.execute('UPDATE post SET render_version = 0')
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('summary_html')
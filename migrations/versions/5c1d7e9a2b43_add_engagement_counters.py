@@ -0,0 +1,51 @@
+"""Add denormalized engagement counters
+
+Revision ID: 5c1d7e9a2b43
+Revises: 28eb4f04fcbb
+Create Date: 2026-01-12 10:14:32.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1d7e9a2b43'
+down_revision = '28eb4f04fcbb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('post_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from existing rows (same rules as models.reconcile_counters)
+    op.execute(
+        'UPDATE post SET comment_count = ('
+        'SELECT COUNT(comment.id) FROM comment '
+        'WHERE comment.post_id = post.id AND comment.is_approved = true)'
+    )
+    op.execute(
+        'UPDATE "user" SET post_count = ('
+        'SELECT COUNT(post.id) FROM post '
+        'WHERE post.user_id = "user".id AND post.is_published = true)'
+    )
+    op.execute(
+        'UPDATE "user" SET comment_count = ('
+        'SELECT COUNT(comment.id) FROM comment '
+        'WHERE comment.user_id = "user".id AND comment.is_approved = true)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('comment_count')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('comment_count')
+        batch_op.drop_column('post_count')
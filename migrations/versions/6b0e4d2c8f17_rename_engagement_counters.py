@@ -0,0 +1,41 @@
+"""Rename engagement counters for what they count
+
+Revision ID: 6b0e4d2c8f17
+Revises: a3d6f08e91c2
+Create Date: 2026-03-16 09:52:41.330817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b0e4d2c8f17'
+down_revision = 'a3d6f08e91c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The counters only count published posts and approved comments
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('post_count', new_column_name='published_post_count',
+                              existing_type=sa.Integer(), existing_nullable=False, existing_server_default='0')
+        batch_op.alter_column('comment_count', new_column_name='approved_comment_count',
+                              existing_type=sa.Integer(), existing_nullable=False, existing_server_default='0')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.alter_column('comment_count', new_column_name='approved_comment_count',
+                              existing_type=sa.Integer(), existing_nullable=False, existing_server_default='0')
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.alter_column('approved_comment_count', new_column_name='comment_count',
+                              existing_type=sa.Integer(), existing_nullable=False, existing_server_default='0')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('approved_comment_count', new_column_name='comment_count',
+                              existing_type=sa.Integer(), existing_nullable=False, existing_server_default='0')
+        batch_op.alter_column('published_post_count', new_column_name='post_count',
+                              existing_type=sa.Integer(), existing_nullable=False, existing_server_default='0')
@@ -0,0 +1,44 @@
+"""Add keyset pagination indexes
+
+Revision ID: 9f3a61c0d8e5
+Revises: 5c1d7e9a2b43
+Create Date: 2026-01-19 16:42:07.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f3a61c0d8e5'
+down_revision = '5c1d7e9a2b43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('idx_user_created_id', ['created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.create_index('idx_post_published_created_id', ['is_published', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.create_index('idx_comment_post_created_id', ['post_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('media_file', schema=None) as batch_op:
+        batch_op.create_index('idx_media_created_id', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('media_file', schema=None) as batch_op:
+        batch_op.drop_index('idx_media_created_id')
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_index('idx_comment_post_created_id')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_index('idx_post_published_created_id')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('idx_user_created_id')
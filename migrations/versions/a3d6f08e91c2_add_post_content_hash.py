@@ -0,0 +1,53 @@
+"""Add content_hash to posts
+
+Revision ID: a3d6f08e91c2
+Revises: 0c6e9a2d5f41
+Create Date: 2026-03-09 15:40:27.106552
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d6f08e91c2'
+down_revision = '0c6e9a2d5f41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=16), nullable=True))
+
+    # Fill in existing posts with the digest models.post_content_hash computes,
+    # in id-keyset batches so only one batch of bodies is in memory at a time
+    post = sa.table('post', sa.column('id'), sa.column('title'), sa.column('content'),
+                    sa.column('content_hash'))
+    connection = op.get_bind()
+    statement = post.update()\
+        .where(post.c.id == sa.bindparam('post_id'))\
+        .values(content_hash=sa.bindparam('digest'))
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(post.c.id, post.c.title, post.c.content)
+            .where(post.c.id > last_id)
+            .order_by(post.c.id)
+            .limit(500)
+        ).all()
+        if not rows:
+            break
+        connection.execute(statement, [
+            {'post_id': ident,
+             'digest': hashlib.blake2b(f"{title or ''}\0{content or ''}".encode(), digest_size=8).hexdigest()}
+            for ident, title, content in rows
+        ])
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('content_hash')
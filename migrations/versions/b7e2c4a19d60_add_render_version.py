@@ -0,0 +1,37 @@
+"""Add render_version to posts and comments
+
+Revision ID: b7e2c4a19d60
+Revises: 9f3a61c0d8e5
+Create Date: 2026-02-03 10:12:45.218306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c4a19d60'
+down_revision = '9f3a61c0d8e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows start at version 0, so `flask rerender-html` picks them all up
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('render_version', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_post_render_version'), ['render_version'], unique=False)
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('render_version', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_comment_render_version'), ['render_version'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_comment_render_version'))
+        batch_op.drop_column('render_version')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_post_render_version'))
+        batch_op.drop_column('render_version')
@@ -0,0 +1,53 @@
+"""Add full-text search indexes for posts and media
+
+Revision ID: d41f8b6e2a97
+Revises: b7e2c4a19d60
+Create Date: 2026-02-11 14:27:09.551820
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f8b6e2a97'
+down_revision = 'b7e2c4a19d60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        # FTS5 tables keyed by post.id / media_file.id; app/search.py keeps them in sync
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS post_fts "
+                   "USING fts5(title, content, tokenize='porter unicode61')")
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS media_fts "
+                   "USING fts5(original_filename, description, tokenize='porter unicode61')")
+        op.execute("INSERT INTO post_fts (rowid, title, content) SELECT id, title, content FROM post")
+        op.execute("INSERT INTO media_fts (rowid, original_filename, description) "
+                   "SELECT id, original_filename, coalesce(description, '') FROM media_file")
+    elif dialect == 'postgresql':
+        # Generated columns are filled for existing rows and kept current by Postgres
+        op.execute("ALTER TABLE post ADD COLUMN search_vector tsvector "
+                   "GENERATED ALWAYS AS ("
+                   "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                   "setweight(to_tsvector('english', coalesce(content, '')), 'B')) STORED")
+        op.execute("CREATE INDEX idx_post_search_vector ON post USING gin (search_vector)")
+        op.execute("ALTER TABLE media_file ADD COLUMN search_vector tsvector "
+                   "GENERATED ALWAYS AS ("
+                   "setweight(to_tsvector('simple', coalesce(original_filename, '')), 'A') || "
+                   "setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED")
+        op.execute("CREATE INDEX idx_media_search_vector ON media_file USING gin (search_vector)")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS media_fts")
+        op.execute("DROP TABLE IF EXISTS post_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS idx_media_search_vector")
+        op.execute("ALTER TABLE media_file DROP COLUMN IF EXISTS search_vector")
+        op.execute("DROP INDEX IF EXISTS idx_post_search_vector")
+        op.execute("ALTER TABLE post DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,63 @@
+"""Add trigram indexes for admin substring search
+
+Revision ID: e5a9c3f17b20
+Revises: d41f8b6e2a97
+Create Date: 2026-02-18 09:51:33.406172
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a9c3f17b20'
+down_revision = 'd41f8b6e2a97'
+branch_labels = None
+depends_on = None
+
+COLUMNS = {
+    'user': ('username', 'email', 'first_name', 'last_name'),
+    'post': ('title', 'content'),
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table, columns in COLUMNS.items():
+            for name in columns:
+                op.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{name}_trgm '
+                           f'ON "{table}" USING gin ({name} gin_trgm_ops)')
+    elif dialect == 'sqlite':
+        # External-content FTS5 tables kept in sync by triggers (see app/trigram.py).
+        # SQLite batch migrations that recreate user/post drop these triggers;
+        # `flask rebuild-search-index` restores and refills them.
+        for table, columns in COLUMNS.items():
+            index = f'{table}_trgm'
+            names = ', '.join(columns)
+            new = ', '.join(f'new.{name}' for name in columns)
+            old = ', '.join(f'old.{name}' for name in columns)
+            op.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5("
+                       f"{names}, content='{table}', content_rowid='id', tokenize='trigram')")
+            op.execute(f'CREATE TRIGGER IF NOT EXISTS {index}_ai AFTER INSERT ON "{table}" BEGIN '
+                       f'INSERT INTO {index} (rowid, {names}) VALUES (new.id, {new}); END')
+            op.execute(f'CREATE TRIGGER IF NOT EXISTS {index}_ad AFTER DELETE ON "{table}" BEGIN '
+                       f"INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', old.id, {old}); END")
+            op.execute(f'CREATE TRIGGER IF NOT EXISTS {index}_au AFTER UPDATE OF {names} ON "{table}" BEGIN '
+                       f"INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+                       f'INSERT INTO {index} (rowid, {names}) VALUES (new.id, {new}); END')
+            op.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table, columns in COLUMNS.items():
+            for name in columns:
+                op.execute(f'DROP INDEX IF EXISTS idx_{table}_{name}_trgm')
+    elif dialect == 'sqlite':
+        for table in COLUMNS:
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_trgm_{suffix}')
+            op.execute(f'DROP TABLE IF EXISTS {table}_trgm')
@@ -0,0 +1,45 @@
+"""Add daily_stats rollup tables
+
+Revision ID: f2b8d0c4e613
+Revises: e5a9c3f17b20
+Create Date: 2026-02-23 14:07:52.310948
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d0c4e613'
+down_revision = 'e5a9c3f17b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `flask rollup-stats` (the first run backfills every day)
+    op.create_table('daily_stats',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('new_users', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('new_posts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('new_comments', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('new_media', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('media_bytes', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('views', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('unique_visitors', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rolled_up_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('day')
+    )
+    op.create_table('daily_user_stats',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('posts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('comments', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('day', 'user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('daily_user_stats')
+    op.drop_table('daily_stats')
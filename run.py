@@ -1,5 +1,6 @@
 import os
 import logging
+import click
 from flask.logging import default_handler
 from app import create_app, db
 from app.models import User, Post, Comment, MediaFile
@@ -50,9 +51,85 @@ def deploy():
 @app.cli.command()
 def init_db():
     """Initialize the database."""
+    from app import trigram
+    from app.search import get_search_backend
+    
     db.create_all()
+    with db.engine.begin() as connection:
+        get_search_backend().create_schema(connection)
+        trigram.create_schema(connection)
     print('Database initialized.')
 
+@app.cli.command()
+def reconcile_counters():
+    """Backfill and repair denormalized post/comment counters."""
+    from app.models import reconcile_counters as reconcile
+    
+    repaired = reconcile()
+    for counter, rows in repaired.items():
+        print(f'{counter}: {rows} rows repaired')
+
+@app.cli.command()
+def rebuild_search_index():
+    """Re-index all posts and media for full-text search (and admin trigram search)."""
+    from app import trigram
+    from app.search import get_search_backend
+    
+    backend = get_search_backend()
+    with db.engine.begin() as connection:
+        posts, media = backend.rebuild(connection)
+        trigram.rebuild(connection)
+    print(f'Search index ({backend.name}): {posts} posts, {media} media files')
+
+@app.cli.command()
+def flush_views():
+    """Apply buffered post views to the database."""
+    from app.view_counts import flush_views as flush
+    
+    updated = flush(app.config['VIEW_FLUSH_BATCH_SIZE'])
+    print(f'View counts flushed for {updated} posts')
+
+@app.cli.command()
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Re-count from this day (default: continue from the last run).')
+def rollup_stats(since):
+    """Update the daily_stats rollups behind the admin analytics page."""
+    from app.daily_stats import run_rollup
+    
+    days = run_rollup(
+        since=since.date() if since else None,
+        lookback=app.config['STATS_ROLLUP_LOOKBACK'],
+        progress=lambda day: print(f'Rolled up through {day}', end='\r')
+    )
+    print(f'Daily stats rolled up for {days} days')
+
+@app.cli.command()
+def reconcile_storage_usage():
+    """Correct the per-bucket storage usage counters against the bucket listings."""
+    from storage import storage
+    
+    for bucket_name, drift in storage.reconcile_usage().items():
+        print(f"{bucket_name}: {drift['objects']:+d} objects, {drift['bytes']:+d} bytes corrected")
+
+@app.cli.command()
+@click.option('--workers', type=int, default=None, help='Render processes (default: CPU count).')
+@click.option('--batch-size', type=int, default=500, help='Rows per render task and UPDATE.')
+@click.option('--force', is_flag=True, help='Also re-render rows already at the current version.')
+def rerender_html(workers, batch_size, force):
+    """Re-render stored post and comment HTML with the current renderer."""
+    from app.rendering import RENDERER_VERSION, rerender_html as rerender
+    
+    for model in (Post, Comment):
+        label = model.__tablename__
+        rendered = rerender(
+            model,
+            workers=workers,
+            batch_size=batch_size,
+            force=force,
+            progress=lambda total: print(f'{label}: {total} rows re-rendered', end='\r')
+        )
+        print(f'{label}: {rendered} rows re-rendered to version {RENDERER_VERSION}')
+
 @app.cli.command()
 def create_sample_data():
     """Create sample data for development."""
@@ -155,22 +155,6 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Infinite scroll for feeds
-    const infiniteScrollContainer = document.querySelector('[data-infinite-scroll]');
-    if (infiniteScrollContainer) {
-        let loading = false;
-        let page = 1;
-
-        window.addEventListener('scroll', function() {
-            if (loading) return;
-
-            if (window.innerHeight + window.scrollY >= document.body.offsetHeight - 1000) {
-                loading = true;
-                loadMoreContent(++page);
-            }
-        });
-    }
-
     // Real-time character count for textareas
     const textareasWithCount = document.querySelectorAll('textarea[data-max-length]');
     textareasWithCount.forEach(function(textarea) {
@@ -227,9 +211,12 @@ function performSearch(query) {
     if (query.length < 2) return;
     
     fetch(`/api/search?q=${encodeURIComponent(query)}`)
-        .then(response => response.json())
+        .then(response => {
+            // 429: the server debounced this keystroke; keep the current results
+            return response.status === 429 ? null : response.json();
+        })
         .then(data => {
-            displaySearchResults(data);
+            if (data) displaySearchResults(data);
         })
         .catch(error => {
             console.error('Search error:', error);
@@ -248,39 +235,23 @@ function displaySearchResults(results) {
     }
     
     results.forEach(result => {
+        // Titles and filenames are user input: set them as text, never as HTML
         const resultElement = document.createElement('div');
         resultElement.className = 'search-result p-2 border-bottom';
-        resultElement.innerHTML = `
-            <h6><a href="${result.url}" class="text-decoration-none">${result.title}</a></h6>
-            <p class="small text-muted mb-0">${result.excerpt}</p>
-        `;
+        const heading = document.createElement('h6');
+        const link = document.createElement('a');
+        link.href = result.url;
+        link.className = 'text-decoration-none';
+        link.textContent = result.title;
+        heading.appendChild(link);
+        const excerpt = document.createElement('p');
+        excerpt.className = 'small text-muted mb-0';
+        excerpt.textContent = result.excerpt;
+        resultElement.append(heading, excerpt);
         resultsContainer.appendChild(resultElement);
     });
 }
 
-function loadMoreContent(page) {
-    const container = document.querySelector('[data-infinite-scroll]');
-    const url = container.dataset.infiniteScroll;
-    
-    fetch(`${url}?page=${page}`)
-        .then(response => response.json())
-        .then(data => {
-            if (data.html) {
-                container.insertAdjacentHTML('beforeend', data.html);
-            }
-            
-            if (!data.has_more) {
-                window.removeEventListener('scroll', arguments.callee);
-            }
-        })
-        .catch(error => {
-            console.error('Load more error:', error);
-        })
-        .finally(() => {
-            loading = false;
-        });
-}
-
 function confirmDelete(message = 'Are you sure you want to delete this item?') {
     return confirm(message);
 }
@@ -1,13 +1,79 @@
-from google.cloud import storage
+from google.cloud import storage as gcs
 from google.oauth2 import service_account
 from google.api_core import exceptions
 import os
+import threading
+import time
+import redis
+from concurrent.futures import ThreadPoolExecutor
+from transfer import GCSComposeTarget, TransferConfig, chunked_upload
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import logging
 import json
 
+
+class BucketUsage:
+    """Byte and object counters per bucket, so usage checks never list a bucket
+
+    Each bucket has a Redis hash (``storage:usage:<bucket>``) adjusted with
+    HINCRBY on every upload and delete, atomic across workers; without Redis
+    the counters live in process memory. A bucket counts as unknown until
+    CloudStorage.reconcile_usage() has listed it once (``reconciled_at``).
+    """
+    
+    def __init__(self, redis_url=None):
+        self.redis = redis.from_url(redis_url) if redis_url else None
+        self._local = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(bucket_name):
+        return f"storage:usage:{bucket_name}"
+    
+    def get(self, bucket_name):
+        """``{'bytes', 'objects', 'reconciled_at'}`` for the bucket, or None if never reconciled"""
+        values = None
+        if self.redis:
+            try:
+                raw = self.redis.hgetall(self.key(bucket_name))
+                values = {key.decode(): float(value) for key, value in raw.items()}
+            except Exception as e:
+                logging.warning(f"Reading storage usage from Redis failed: {e}")
+        if values is None:
+            with self._lock:
+                values = dict(self._local.get(bucket_name, {}))
+        if 'reconciled_at' not in values:
+            return None
+        return {
+            'bytes': int(values.get('bytes', 0)),
+            'objects': int(values.get('objects', 0)),
+            'reconciled_at': values['reconciled_at']
+        }
+    
+    def add(self, bucket_name, size, objects, reconciled_at=None):
+        """Atomically add ``size`` bytes and ``objects`` objects (negative to subtract)"""
+        if self.redis:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.hincrby(self.key(bucket_name), 'bytes', int(size))
+                pipe.hincrby(self.key(bucket_name), 'objects', int(objects))
+                if reconciled_at is not None:
+                    pipe.hset(self.key(bucket_name), 'reconciled_at', reconciled_at)
+                pipe.execute()
+                return
+            except Exception as e:
+                logging.warning(f"Updating storage usage in Redis failed, counting locally: {e}")
+        with self._lock:
+            counters = self._local.setdefault(bucket_name, {'bytes': 0, 'objects': 0})
+            counters['bytes'] += int(size)
+            counters['objects'] += int(objects)
+            if reconciled_at is not None:
+                counters['reconciled_at'] = reconciled_at
+
 class CloudStorage:
+    CONNECT_RETRY_SECONDS = 30
+    
     def __init__(self):
         # Google Cloud Storage configuration
         self.project_id = os.environ.get('GCS_PROJECT_ID')
@@ -16,28 +82,91 @@ class CloudStorage:
         self.max_buckets = int(os.environ.get('STORAGE_MAX_BUCKETS', 10))
         self.storage_quota_gb = float(os.environ.get('MAX_SIZE_PER_BUCKET_GB', 100))
         self.critical_threshold = float(os.environ.get('STORAGE_CRITICAL_THRESHOLD', 95))
-        
-        # Initialize GCS client
-        credentials_path = os.environ.get('GCS_CREDENTIALS_PATH')
-        if credentials_path and os.path.exists(credentials_path):
-            credentials = service_account.Credentials.from_service_account_file(
-                credentials_path
-            )
-            self.client = storage.Client(
-                project=self.project_id,
-                credentials=credentials
-            )
-        else:
-            # Use default credentials (for Google Cloud environments)
-            self.client = storage.Client(project=self.project_id)
-        
-        # Get or create current bucket
+        self.usage = BucketUsage(os.environ.get('REDIS_URL') or 'redis://localhost:6379/0')
+        self.transfer_config = TransferConfig.from_settings(os.environ)
+        self.credentials_path = os.environ.get('GCS_CREDENTIALS_PATH')
         self.current_bucket_name = f"{self.bucket_prefix}-{self.current_bucket_index}"
-        self.current_bucket = self._get_or_create_bucket(self.current_bucket_name)
         
         # Public URL pattern
         self.public_url_pattern = os.environ.get('GCS_PUBLIC_URL', 
             f"https://storage.googleapis.com/{self.current_bucket_name}")
+        
+        # The client and current bucket are set up on first use (or by
+        # warm_up()), so importing this module never waits on GCS
+        self._client = None
+        self._current_bucket = None
+        self._connect_lock = threading.Lock()
+        self.healthy = None  # None until the first connection attempt
+        self.last_error = None
+        self._retry_at = 0
+    
+    def _connect(self):
+        """Create the GCS client and open (or create) the current bucket, once"""
+        if self._current_bucket is not None:
+            return
+        with self._connect_lock:
+            if self._current_bucket is not None:
+                return
+            # After a failure, fail fast instead of making every request wait on GCS
+            if time.time() < self._retry_at:
+                raise ConnectionError(f"Storage unavailable: {self.last_error}")
+            try:
+                # Initialize GCS client
+                if self.credentials_path and os.path.exists(self.credentials_path):
+                    credentials = service_account.Credentials.from_service_account_file(
+                        self.credentials_path
+                    )
+                    client = gcs.Client(
+                        project=self.project_id,
+                        credentials=credentials
+                    )
+                else:
+                    # Use default credentials (for Google Cloud environments)
+                    client = gcs.Client(project=self.project_id)
+                self._client = client
+                
+                # Get or create current bucket
+                self._current_bucket = self._get_or_create_bucket(self.current_bucket_name)
+            except Exception as e:
+                self.healthy = False
+                self.last_error = str(e)
+                self._retry_at = time.time() + self.CONNECT_RETRY_SECONDS
+                raise
+            self.healthy = True
+            self.last_error = None
+    
+    @property
+    def client(self):
+        if self._client is None:
+            self._connect()
+        return self._client
+    
+    @property
+    def current_bucket(self):
+        self._connect()
+        return self._current_bucket
+    
+    @current_bucket.setter
+    def current_bucket(self, bucket):
+        self._current_bucket = bucket
+    
+    def warm_up(self):
+        """Connect in a background thread, so the first request finds the client ready"""
+        def run():
+            try:
+                self._connect()
+            except Exception as e:
+                logging.error(f"Storage warm-up failed: {e}")
+        
+        threading.Thread(target=run, name='storage-warm-up', daemon=True).start()
+    
+    def health(self):
+        """Connection state for health checks (never connects itself)"""
+        return {
+            'ready': self._current_bucket is not None,
+            'healthy': self.healthy,
+            'error': self.last_error
+        }
     
     def _get_or_create_bucket(self, bucket_name):
         """Get existing bucket or create new one"""
@@ -67,27 +196,75 @@ class CloudStorage:
             raise
     
     def _check_bucket_usage(self):
-        """Check current bucket usage"""
-        total_size = 0
-        file_count = 0
-        
-        try:
-            for blob in self.current_bucket.list_blobs():
-                total_size += blob.size
-                file_count += 1
-        except Exception as e:
-            logging.error(f"Error checking bucket usage: {e}")
-            return {'size_gb': 0, 'percentage': 0, 'file_count': 0}
+        """Check current bucket usage from its counters (listed only if never counted)"""
+        usage = self.usage.get(self.current_bucket_name)
+        if usage is None:
+            try:
+                self._reconcile_bucket(self.current_bucket_name)
+            except Exception as e:
+                logging.error(f"Error checking bucket usage: {e}")
+                return {'size_gb': 0, 'percentage': 0, 'file_count': 0}
+            usage = self.usage.get(self.current_bucket_name) or {'bytes': 0, 'objects': 0}
         
-        size_gb = total_size / (1024 ** 3)
+        size_gb = usage['bytes'] / (1024 ** 3)
         percentage = (size_gb / self.storage_quota_gb) * 100
         
         return {
             'size_gb': size_gb,
             'percentage': percentage,
-            'file_count': file_count
+            'file_count': usage['objects']
         }
     
+    def _list_usage(self, bucket_name, page_size=1000):
+        """``(bytes, objects)`` of a bucket from a paged listing of object sizes only"""
+        total_size = 0
+        file_count = 0
+        blobs = self.client.bucket(bucket_name).list_blobs(
+            page_size=page_size,
+            fields='items(size),nextPageToken'
+        )
+        for blob in blobs:
+            total_size += blob.size or 0
+            file_count += 1
+        return total_size, file_count
+    
+    def _map_buckets(self, fn, workers):
+        """``{bucket_name: fn(bucket_name)}`` over all buckets, ``workers`` at a time
+        
+        Buckets that do not exist (yet) or fail to list are logged and left out.
+        """
+        names = [f"{self.bucket_prefix}-{i}" for i in range(1, self.current_bucket_index + 1)]
+        
+        def run(bucket_name):
+            try:
+                return fn(bucket_name)
+            except exceptions.NotFound:
+                return None
+            except Exception as e:
+                logging.error(f"Error listing bucket {bucket_name}: {e}")
+                return None
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(names)))) as pool:
+            results = pool.map(run, names)
+            return {name: result for name, result in zip(names, results) if result is not None}
+    
+    def _reconcile_bucket(self, bucket_name):
+        """List a bucket and correct its counters; returns the drift found"""
+        before = self.usage.get(bucket_name) or {'bytes': 0, 'objects': 0}
+        total_size, file_count = self._list_usage(bucket_name)
+        
+        # Applied as a delta so uploads and deletes counted while listing are kept
+        drift = {'bytes': total_size - before['bytes'], 'objects': file_count - before['objects']}
+        self.usage.add(bucket_name, drift['bytes'], drift['objects'], reconciled_at=time.time())
+        return drift
+    
+    def reconcile_usage(self, workers=8):
+        """Correct every bucket's counters against a full listing (run periodically)
+
+        Returns ``{bucket_name: {'bytes': drift, 'objects': drift}}``.
+        """
+        return self._map_buckets(self._reconcile_bucket, workers)
+    
     def _extend_storage(self):
         """Create new bucket when current is full"""
         if self.current_bucket_index >= self.max_buckets:
@@ -134,33 +311,64 @@ class CloudStorage:
         except Exception as e:
             logging.error(f"Failed to update config: {e}")
     
+    def put_object(self, blob_name, file_obj, content_type=None, config=None, public=True):
+        """Store a seekable file object in the current bucket, extending storage when it is full
+        
+        Large files go up in parallel parts joined with compose. The bucket's
+        usage counters are adjusted. Returns ``(bucket_name, blob)``.
+        """
+        # Check if we need to extend storage
+        usage = self._check_bucket_usage()
+        if usage['percentage'] >= self.critical_threshold:
+            if not self._extend_storage():
+                raise Exception("Storage full and cannot extend")
+        
+        bucket = self.current_bucket
+        # A replaced object no longer counts towards the bucket
+        previous = bucket.get_blob(blob_name)
+        
+        file_obj.seek(0)  # Reset file pointer
+        blob = chunked_upload(
+            GCSComposeTarget(bucket),
+            file_obj,
+            blob_name,
+            content_type=content_type,
+            config=config or self.transfer_config
+        )
+        if previous is None:
+            self.usage.add(bucket.name, blob.size or 0, 1)
+        else:
+            self.usage.add(bucket.name, (blob.size or 0) - (previous.size or 0), 0)
+        
+        if public:
+            blob.make_public()
+        return bucket.name, blob
+    
+    def delete_object(self, bucket_name, blob_name):
+        """Delete a blob and take it off its bucket's counters; False if it did not exist"""
+        # get_blob() fetches the size, so the bucket's counters can be adjusted
+        blob = self.client.bucket(bucket_name).get_blob(blob_name)
+        if blob is None:
+            return False
+        try:
+            blob.delete()
+        except exceptions.NotFound:
+            return False  # deleted concurrently, and counted there
+        self.usage.add(bucket_name, -(blob.size or 0), -1)
+        return True
+    
     def upload_file(self, file_obj, folder='media'):
         """Upload file to GCS with automatic bucket extension"""
         try:
-            # Check if we need to extend storage
-            usage = self._check_bucket_usage()
-            if usage['percentage'] >= self.critical_threshold:
-                if not self._extend_storage():
-                    raise Exception("Storage full and cannot extend")
-            
             # Generate unique filename
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = secure_filename(file_obj.filename)
             blob_name = f"{folder}/{timestamp}_{filename}"
             
-            # Upload to GCS
-            blob = self.current_bucket.blob(blob_name)
-            
             # Set content type
             content_type = file_obj.content_type or 'application/octet-stream'
-            blob.content_type = content_type
             
-            # Upload file
-            file_obj.seek(0)  # Reset file pointer
-            blob.upload_from_file(file_obj)
-            
-            # Make blob public
-            blob.make_public()
+            _, blob = self.put_object(blob_name, file_obj, content_type)
             
             # Return public URL
             return blob.public_url
@@ -169,36 +377,32 @@ class CloudStorage:
             logging.error(f"Error uploading file: {e}")
             return None
     
+    def _parse_url(self, file_url):
+        """``(bucket_name, blob_name)`` of a public GCS URL, or None"""
+        # https://bucket-name.storage.googleapis.com/folder/file.ext
+        if '.storage.googleapis.com/' in file_url:
+            bucket_name = file_url.split('.storage.googleapis.com/')[0].split('//')[-1]
+            return bucket_name, file_url.split('.storage.googleapis.com/', 1)[-1]
+        # https://storage.googleapis.com/bucket-name/folder/file.ext
+        if 'storage.googleapis.com/' in file_url:
+            parts = file_url.split('storage.googleapis.com/')[-1].split('/', 1)
+            if len(parts) == 2:
+                return parts[0], parts[1]
+        return None
+    
     def delete_file(self, file_url):
         """Delete file from GCS"""
         try:
-            # Extract bucket name and blob name from URL
-            # URL format: https://storage.googleapis.com/bucket-name/folder/file.ext
-            if 'storage.googleapis.com' in file_url:
-                parts = file_url.split('storage.googleapis.com/')[-1].split('/', 1)
-                if len(parts) == 2:
-                    bucket_name, blob_name = parts
-                    bucket = self.client.bucket(bucket_name)
-                    blob = bucket.blob(blob_name)
-                    blob.delete()
-                    return True
-            
-            # Alternative URL format: https://bucket-name.storage.googleapis.com/folder/file.ext
-            elif '.storage.googleapis.com' in file_url:
-                bucket_name = file_url.split('.storage.googleapis.com')[0].split('//')[-1]
-                blob_name = file_url.split('.storage.googleapis.com/')[-1]
-                bucket = self.client.bucket(bucket_name)
-                blob = bucket.blob(blob_name)
-                blob.delete()
-                return True
-                
+            location = self._parse_url(file_url)
+            if location:
+                return self.delete_object(*location)
         except Exception as e:
             logging.error(f"Error deleting file: {e}")
         
         return False
     
-    def get_storage_stats(self):
-        """Get storage statistics across all buckets"""
+    def get_storage_stats(self, workers=8):
+        """Get storage statistics across all buckets (listed ``workers`` at a time)"""
         stats = {
             'total_size_gb': 0,
             'total_files': 0,
@@ -207,28 +411,16 @@ class CloudStorage:
             'max_buckets': self.max_buckets
         }
         
-        for i in range(1, self.current_bucket_index + 1):
-            bucket_name = f"{self.bucket_prefix}-{i}"
-            try:
-                bucket = self.client.bucket(bucket_name)
-                if bucket.exists():
-                    bucket_size = 0
-                    bucket_files = 0
-                    for blob in bucket.list_blobs():
-                        bucket_size += blob.size
-                        bucket_files += 1
-                    
-                    bucket_size_gb = bucket_size / (1024 ** 3)
-                    stats['total_size_gb'] += bucket_size_gb
-                    stats['total_files'] += bucket_files
-                    stats['buckets'].append({
-                        'name': bucket_name,
-                        'size_gb': bucket_size_gb,
-                        'files': bucket_files,
-                        'usage_percentage': (bucket_size_gb / self.storage_quota_gb) * 100
-                    })
-            except Exception as e:
-                logging.error(f"Error getting stats for bucket {bucket_name}: {e}")
+        for bucket_name, (bucket_size, bucket_files) in self._map_buckets(self._list_usage, workers).items():
+            bucket_size_gb = bucket_size / (1024 ** 3)
+            stats['total_size_gb'] += bucket_size_gb
+            stats['total_files'] += bucket_files
+            stats['buckets'].append({
+                'name': bucket_name,
+                'size_gb': bucket_size_gb,
+                'files': bucket_files,
+                'usage_percentage': (bucket_size_gb / self.storage_quota_gb) * 100
+            })
         
         return stats
     
@@ -0,0 +1,420 @@
+import os
+import uuid
+import shutil
+import mimetypes
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from transfer import MiB, S3MultipartTarget, TransferConfig, chunked_upload
+
+# Optional imports with fallbacks
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+    HAS_BOTO3 = True
+except ImportError:
+    HAS_BOTO3 = False
+    print("boto3 not available - S3 storage backend disabled")
+
+# Object storage backends
+#
+# One interface over every place media can live, picked by STORAGE_BACKEND:
+#
+#   s3      an S3 bucket (AWS_S3_BUCKET), large files as multipart uploads
+#   gcs     the buckets of storage.CloudStorage, large files composed
+#   local   files under a directory served as static files (development)
+#   memory  a dict, for tests and benchmarks
+#   auto    s3 when AWS_S3_BUCKET is set, else local (the old behaviour)
+#
+# Keys are '/'-separated paths such as 'uploads/<name>'. put() takes a
+# seekable file object and returns the key to record for the object, which
+# gcs qualifies with its bucket; large files go through
+# transfer.chunked_upload() where the store supports parts. Reads either return the whole object
+# (get) or iterate over it in chunks (stream). put_many() and
+# delete_many() run a thread pool unless the store has a batch call.
+#
+# benchmarks/check_storage_backends.py runs the same conformance checks and
+# throughput measurements against any of them.
+
+ObjectInfo = namedtuple('ObjectInfo', 'key size content_type updated')
+
+
+class ObjectNotFound(KeyError):
+    """The key does not exist in the backend"""
+
+
+class StorageBackend:
+    """Interface of an object store; subclasses implement the single-object methods"""
+
+    name = None
+    remote = False  # objects are served from their own URL rather than the app
+
+    def put(self, key, file_obj, content_type=None):
+        """Store a seekable file object under ``key`` (replacing it); returns its ObjectInfo
+
+        The returned key is the one to record: it addresses the object in
+        every other method even where ``key`` alone would not (gcs).
+        """
+        raise NotImplementedError
+
+    def get(self, key):
+        """The whole object as bytes"""
+        return b''.join(self.stream(key))
+
+    def stream(self, key, chunk_size=MiB):
+        """An iterator over the object in chunks of at most ``chunk_size`` bytes"""
+        raise NotImplementedError
+
+    def stat(self, key):
+        """ObjectInfo for ``key``, or None if it does not exist"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove ``key``; False if it did not exist"""
+        raise NotImplementedError
+
+    def list(self, prefix='', limit=None):
+        """ObjectInfo for the keys starting with ``prefix``, in key order"""
+        raise NotImplementedError
+
+    def url(self, key):
+        """Where clients fetch the object (None if it is not served)"""
+        return None
+
+    def put_many(self, items, workers=8):
+        """Store ``(key, file_obj, content_type)`` items concurrently; returns their ObjectInfo"""
+        items = list(items)
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+            return list(pool.map(lambda item: self.put(*item), items))
+
+    def delete_many(self, keys, workers=8):
+        """Remove several keys concurrently; returns how many existed"""
+        keys = list(keys)
+        if not keys:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(workers, len(keys))) as pool:
+            return sum(pool.map(self.delete, keys))
+
+
+def _chunks(f, chunk_size):
+    try:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            yield chunk
+    finally:
+        f.close()
+
+
+def _content_type(key, content_type):
+    return content_type or mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+class MemoryBackend(StorageBackend):
+    """Objects in a dict; nothing outlives the process"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def put(self, key, file_obj, content_type=None):
+        data = file_obj.read()
+        info = ObjectInfo(key, len(data), _content_type(key, content_type), datetime.now(timezone.utc))
+        with self._lock:
+            self._objects[key] = (data, info)
+        return info
+
+    def _entry(self, key):
+        with self._lock:
+            if key not in self._objects:
+                raise ObjectNotFound(key)
+            return self._objects[key]
+
+    def get(self, key):
+        return self._entry(key)[0]
+
+    def stream(self, key, chunk_size=MiB):
+        data = self._entry(key)[0]
+        return (data[offset:offset + chunk_size] for offset in range(0, len(data), chunk_size))
+
+    def stat(self, key):
+        with self._lock:
+            entry = self._objects.get(key)
+        return entry[1] if entry else None
+
+    def delete(self, key):
+        with self._lock:
+            return self._objects.pop(key, None) is not None
+
+    def list(self, prefix='', limit=None):
+        with self._lock:
+            infos = [info for key, (_, info) in sorted(self._objects.items()) if key.startswith(prefix)]
+        return infos[:limit] if limit is not None else infos
+
+
+class LocalBackend(StorageBackend):
+    """Objects as files under ``root``, served below ``base_url``"""
+
+    name = 'local'
+
+    def __init__(self, root, base_url='/static'):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/')
+
+    def path(self, key):
+        path = os.path.abspath(os.path.join(self.root, *key.split('/')))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Key outside the storage root: {key}")
+        return path
+
+    def _info(self, key, path):
+        status = os.stat(path)
+        return ObjectInfo(
+            key, status.st_size, _content_type(key, None),
+            datetime.fromtimestamp(status.st_mtime, timezone.utc)
+        )
+
+    def put(self, key, file_obj, content_type=None):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write beside the target and rename, so readers never see half a file
+        partial = f"{path}.{uuid.uuid4().hex}.partial"
+        try:
+            with open(partial, 'wb') as f:
+                shutil.copyfileobj(file_obj, f, MiB)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return self._info(key, path)
+
+    def stream(self, key, chunk_size=MiB):
+        try:
+            return _chunks(open(self.path(key), 'rb'), chunk_size)
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+
+    def stat(self, key):
+        path = self.path(key)
+        return self._info(key, path) if os.path.isfile(path) else None
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list(self, prefix='', limit=None):
+        keys = []
+        for directory, _, files in os.walk(self.root):
+            relative = os.path.relpath(directory, self.root)
+            for name in files:
+                if name.endswith('.partial'):
+                    continue
+                key = name if relative == '.' else '/'.join(relative.split(os.sep) + [name])
+                if key.startswith(prefix):
+                    keys.append(key)
+        keys.sort()
+        if limit is not None:
+            keys = keys[:limit]
+        return [self._info(key, self.path(key)) for key in keys]
+
+    def url(self, key):
+        return f"{self.base_url}/{key}"
+
+
+class S3Backend(StorageBackend):
+    """Objects in an S3 bucket"""
+
+    name = 's3'
+    remote = True
+
+    def __init__(self, client, bucket_name, region=None, transfer_config=None):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.region = region
+        self.transfer_config = transfer_config or TransferConfig()
+
+    def put(self, key, file_obj, content_type=None):
+        content_type = _content_type(key, content_type)
+        chunked_upload(S3MultipartTarget(self.client, self.bucket_name), file_obj, key,
+                       content_type=content_type, config=self.transfer_config)
+        return self.stat(key)
+
+    def stream(self, key, chunk_size=MiB):
+        try:
+            body = self.client.get_object(Bucket=self.bucket_name, Key=key)['Body']
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                raise ObjectNotFound(key)
+            raise
+        return _chunks(body, chunk_size)
+
+    def stat(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+        return ObjectInfo(key, head['ContentLength'], head.get('ContentType'), head.get('LastModified'))
+
+    def delete(self, key):
+        # S3 deletes succeed for missing keys, so ask first
+        if self.stat(key) is None:
+            return False
+        self.client.delete_object(Bucket=self.bucket_name, Key=key)
+        return True
+
+    def delete_many(self, keys, workers=8):
+        keys = list(keys)
+        if not keys:
+            return 0
+        # DeleteObjects also reports keys that did not exist, so count them first
+        with ThreadPoolExecutor(max_workers=min(workers, len(keys))) as pool:
+            existed = sum(info is not None for info in pool.map(self.stat, keys))
+
+        # One DeleteObjects request per 1000 keys
+        errors = []
+        for i in range(0, len(keys), 1000):
+            response = self.client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': key} for key in keys[i:i + 1000]], 'Quiet': True}
+            )
+            errors.extend(response.get('Errors', []))
+        if errors:
+            for error in errors:
+                logging.error(f"Deleting {error.get('Key')} from S3 failed: "
+                              f"{error.get('Code')} {error.get('Message')}")
+            raise RuntimeError(f"Could not delete {len(errors)} of {len(keys)} objects from {self.bucket_name}")
+        return existed
+
+    def list(self, prefix='', limit=None):
+        infos = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for item in page.get('Contents', []):
+                infos.append(ObjectInfo(item['Key'], item['Size'], None, item['LastModified']))
+                if limit is not None and len(infos) >= limit:
+                    return infos
+        return infos
+
+    def url(self, key):
+        return f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/{key}"
+
+
+class GCSBackend(StorageBackend):
+    """Objects in the buckets of a storage.CloudStorage
+
+    Uploads go through CloudStorage.put_object() and deletes through
+    delete_object(), so they keep its bucket usage counters current and
+    storage extends to a new bucket when the current one fills up. put()
+    returns keys qualified with their bucket ('gs://<bucket>/<key>'), which
+    stay valid after that; plain keys address the current bucket, which is
+    also the one list() covers.
+    """
+
+    name = 'gcs'
+    remote = True
+
+    def __init__(self, storage, transfer_config=None, public=True):
+        self.storage = storage
+        self.transfer_config = transfer_config or TransferConfig()
+        self.public = public
+
+    def _locate(self, key):
+        """``(bucket_name, blob_name)`` of a qualified or plain key"""
+        if key.startswith('gs://'):
+            bucket_name, _, blob_name = key[len('gs://'):].partition('/')
+            return bucket_name, blob_name
+        return self.storage.current_bucket_name, key
+
+    def _bucket(self, bucket_name):
+        return self.storage.client.bucket(bucket_name)
+
+    def put(self, key, file_obj, content_type=None):
+        bucket_name, blob_name = self._locate(key)
+        if bucket_name != self.storage.current_bucket_name:
+            raise ValueError(f"Objects can only be stored in the current bucket: {key}")
+        bucket_name, _ = self.storage.put_object(
+            blob_name, file_obj, _content_type(key, content_type),
+            config=self.transfer_config, public=self.public
+        )
+        return self.stat(f"gs://{bucket_name}/{blob_name}")
+
+    def _blob(self, key):
+        bucket_name, blob_name = self._locate(key)
+        blob = self._bucket(bucket_name).get_blob(blob_name)
+        if blob is None:
+            raise ObjectNotFound(key)
+        return blob
+
+    def get(self, key):
+        return self._blob(key).download_as_bytes()
+
+    def stream(self, key, chunk_size=MiB):
+        return _chunks(self._blob(key).open('rb', chunk_size=chunk_size), chunk_size)
+
+    def stat(self, key):
+        try:
+            blob = self._blob(key)
+        except ObjectNotFound:
+            return None
+        return ObjectInfo(key, blob.size, blob.content_type, blob.updated)
+
+    def delete(self, key):
+        return self.storage.delete_object(*self._locate(key))
+
+    def list(self, prefix='', limit=None):
+        return [
+            ObjectInfo(blob.name, blob.size, blob.content_type, blob.updated)
+            for blob in self.storage.current_bucket.list_blobs(prefix=prefix, max_results=limit)
+        ]
+
+    def url(self, key):
+        bucket_name, blob_name = self._locate(key)
+        return self._bucket(bucket_name).blob(blob_name).public_url
+
+
+BACKENDS = ('s3', 'gcs', 'local', 'memory')
+
+
+def create_backend(settings):
+    """The backend named by STORAGE_BACKEND in ``os.environ`` or a Flask config"""
+    name = settings.get('STORAGE_BACKEND') or 'auto'
+    if name == 'auto':
+        name = 's3' if settings.get('AWS_S3_BUCKET') and HAS_BOTO3 else 'local'
+    transfer_config = TransferConfig.from_settings(settings)
+
+    if name == 's3':
+        if not HAS_BOTO3:
+            raise RuntimeError("STORAGE_BACKEND is 's3' but boto3 is not installed")
+        client = boto3.client(
+            's3',
+            aws_access_key_id=settings.get('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=settings.get('AWS_SECRET_ACCESS_KEY'),
+            region_name=settings.get('AWS_S3_REGION')
+        )
+        return S3Backend(client, settings['AWS_S3_BUCKET'], settings.get('AWS_S3_REGION'), transfer_config)
+    if name == 'gcs':
+        from storage import storage
+        return GCSBackend(storage, transfer_config)
+    if name == 'local':
+        return LocalBackend(settings.get('STORAGE_LOCAL_ROOT') or 'app/static',
+                            settings.get('STORAGE_LOCAL_URL') or '/static')
+    if name == 'memory':
+        return MemoryBackend()
+    raise ValueError(f"Unknown STORAGE_BACKEND {name!r} (expected one of {', '.join(BACKENDS)} or auto)")
@@ -0,0 +1,292 @@
+import os
+import time
+import uuid
+import random
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Chunked, parallel uploads
+#
+# chunked_upload() sends files below the multipart threshold in one stream
+# and splits larger ones into parts that a bounded thread pool uploads
+# concurrently. A part that fails is retried on its own with exponential
+# backoff; only when it keeps failing is the whole upload aborted. The
+# object store is a "target" offering:
+#
+#   put(key, file_obj, content_type)        single-stream upload
+#   start(key, content_type) -> upload      begin a multipart upload
+#   upload_part(upload, number, data)       one part (numbered from 1)
+#   complete(upload, parts)                 join the parts (in order)
+#   abort(upload)                           drop whatever was uploaded
+#
+# GCSComposeTarget uploads parts as temporary objects and joins them with
+# compose, S3MultipartTarget uses S3 multipart uploads, and LocalObjectStore
+# is an on-disk stand-in with simulated latency, per-stream bandwidth and
+# failures for benchmarks (benchmarks/bench_chunked_upload.py).
+
+MiB = 1024 * 1024
+
+
+class TransferError(Exception):
+    """A part kept failing after its retries; the upload was aborted"""
+
+
+class TransferConfig:
+    """Part size, concurrency and retry settings for chunked_upload()"""
+
+    def __init__(self, part_size=8 * MiB, concurrency=4, threshold=16 * MiB, retries=3, backoff=0.5):
+        self.part_size = part_size
+        self.concurrency = max(1, concurrency)
+        self.threshold = threshold
+        self.retries = retries
+        self.backoff = backoff
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Read UPLOAD_* values from ``os.environ`` or a Flask config"""
+        def number(name, default):
+            value = settings.get(name)
+            return float(value) if value not in (None, '') else default
+
+        return cls(
+            part_size=int(number('UPLOAD_PART_SIZE_MB', 8) * MiB),
+            concurrency=int(number('UPLOAD_CONCURRENCY', 4)),
+            threshold=int(number('UPLOAD_MULTIPART_THRESHOLD_MB', 16) * MiB),
+            retries=int(number('UPLOAD_PART_RETRIES', 3))
+        )
+
+
+def plan_parts(size, part_size):
+    """``(number, offset, length)`` for each part of a ``size``-byte file"""
+    return [
+        (number, offset, min(part_size, size - offset))
+        for number, offset in enumerate(range(0, size, part_size), start=1)
+    ]
+
+
+def _file_size(file_obj):
+    position = file_obj.tell()
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(position)
+    return size
+
+
+def chunked_upload(target, file_obj, key, content_type=None, config=None):
+    """Upload a seekable ``file_obj`` to ``key``; returns what the target's put/complete returns"""
+    config = config or TransferConfig()
+    size = _file_size(file_obj)
+    if size < max(config.threshold, 1):
+        file_obj.seek(0)
+        return target.put(key, file_obj, content_type)
+
+    part_size = max(config.part_size, getattr(target, 'min_part_size', 1))
+    parts = plan_parts(size, part_size)
+    read_lock = threading.Lock()
+
+    def send(number, offset, length):
+        # Read inside the worker, so at most `concurrency` parts sit in memory
+        with read_lock:
+            file_obj.seek(offset)
+            data = file_obj.read(length)
+        for attempt in range(config.retries + 1):
+            try:
+                return target.upload_part(upload, number, data)
+            except Exception as e:
+                if attempt == config.retries:
+                    raise TransferError(
+                        f"Part {number} of {key} failed after {attempt + 1} attempts: {e}"
+                    ) from e
+                logging.warning(f"Retrying part {number} of {key}: {e}")
+                time.sleep(config.backoff * 2 ** attempt)
+
+    upload = target.start(key, content_type)
+    pool = ThreadPoolExecutor(max_workers=min(config.concurrency, len(parts)))
+    try:
+        futures = {pool.submit(send, *part): part[0] for part in parts}
+        uploaded = {}
+        for future in as_completed(futures):
+            uploaded[futures[future]] = future.result()
+        pool.shutdown()
+        return target.complete(upload, [uploaded[number] for number, _, _ in parts])
+    except BaseException:
+        pool.shutdown(cancel_futures=True)
+        try:
+            target.abort(upload)
+        except Exception as e:
+            logging.error(f"Aborting the upload of {key} failed: {e}")
+        raise
+
+
+class GCSComposeTarget:
+    """Parts as temporary objects in the bucket, joined with compose"""
+
+    MAX_COMPOSE_SOURCES = 32
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def put(self, key, file_obj, content_type):
+        blob = self.bucket.blob(key)
+        blob.content_type = content_type
+        blob.upload_from_file(file_obj)
+        return blob
+
+    def start(self, key, content_type):
+        return {'key': key, 'content_type': content_type, 'prefix': f"{key}.parts-{uuid.uuid4().hex}/"}
+
+    def upload_part(self, upload, number, data):
+        blob = self.bucket.blob(f"{upload['prefix']}{number:05d}")
+        blob.upload_from_string(data)
+        return blob
+
+    def complete(self, upload, parts):
+        sources = list(parts)
+        temporary = list(parts)
+        level = 0
+        # compose takes at most 32 sources, so join larger sets in rounds
+        while len(sources) > self.MAX_COMPOSE_SOURCES:
+            merged = []
+            for i in range(0, len(sources), self.MAX_COMPOSE_SOURCES):
+                blob = self.bucket.blob(f"{upload['prefix']}compose-{level}-{len(merged):05d}")
+                blob.compose(sources[i:i + self.MAX_COMPOSE_SOURCES])
+                merged.append(blob)
+            temporary.extend(merged)
+            sources = merged
+            level += 1
+
+        blob = self.bucket.blob(upload['key'])
+        blob.content_type = upload['content_type']
+        blob.compose(sources)
+        self.bucket.delete_blobs(temporary, on_error=lambda blob: None)
+        return blob
+
+    def abort(self, upload):
+        leftovers = list(self.bucket.list_blobs(prefix=upload['prefix']))
+        self.bucket.delete_blobs(leftovers, on_error=lambda blob: None)
+
+
+class S3MultipartTarget:
+    """S3 multipart uploads (parts of at least 5 MiB, except the last)"""
+
+    min_part_size = 5 * MiB
+
+    def __init__(self, client, bucket_name):
+        self.client = client
+        self.bucket_name = bucket_name
+
+    def _content_type(self, content_type):
+        return {'ContentType': content_type} if content_type else {}
+
+    def put(self, key, file_obj, content_type):
+        return self.client.put_object(
+            Bucket=self.bucket_name, Key=key, Body=file_obj, **self._content_type(content_type)
+        )
+
+    def start(self, key, content_type):
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=key, **self._content_type(content_type)
+        )
+        return {'key': key, 'upload_id': response['UploadId']}
+
+    def upload_part(self, upload, number, data):
+        response = self.client.upload_part(
+            Bucket=self.bucket_name, Key=upload['key'], UploadId=upload['upload_id'],
+            PartNumber=number, Body=data
+        )
+        return {'PartNumber': number, 'ETag': response['ETag']}
+
+    def complete(self, upload, parts):
+        return self.client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=upload['key'], UploadId=upload['upload_id'],
+            MultipartUpload={'Parts': parts}
+        )
+
+    def abort(self, upload):
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket_name, Key=upload['key'], UploadId=upload['upload_id']
+        )
+
+
+class LocalObjectStore:
+    """Objects as files under ``root``, with simulated network costs
+
+    Every request waits ``latency`` seconds and moves data at ``bandwidth``
+    bytes per second per stream (unlimited if None); ``failure_rate`` of the
+    part uploads fail midway, to exercise retries.
+    """
+
+    def __init__(self, root, latency=0.0, bandwidth=None, failure_rate=0.0, seed=None):
+        self.root = root
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def _send(self, nbytes):
+        if self.bandwidth:
+            time.sleep(nbytes / self.bandwidth)
+
+    def _request(self, nbytes, may_fail=False):
+        with self._lock:
+            self.requests += 1
+            fail = may_fail and self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        time.sleep(self.latency)
+        if fail:
+            self._send(nbytes // 2)
+            raise ConnectionError('simulated connection reset')
+        self._send(nbytes)
+
+    def _write(self, key, chunks):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        return path
+
+    def put(self, key, file_obj, content_type):
+        def chunks():
+            while True:
+                chunk = file_obj.read(MiB)
+                if not chunk:
+                    return
+                self._send(len(chunk))
+                yield chunk
+
+        self._request(0)
+        return self._write(key, chunks())
+
+    def start(self, key, content_type):
+        self._request(0)
+        return {'key': key, 'prefix': f".uploads/{uuid.uuid4().hex}"}
+
+    def upload_part(self, upload, number, data):
+        self._request(len(data), may_fail=True)
+        return self._write(f"{upload['prefix']}/{number:05d}", [data])
+
+    def complete(self, upload, parts):
+        self._request(0)
+
+        def chunks():
+            for part in parts:
+                with open(part, 'rb') as f:
+                    yield f.read()
+
+        path = self._write(upload['key'], chunks())
+        shutil.rmtree(self.path(upload['prefix']), ignore_errors=True)
+        return path
+
+    def abort(self, upload):
+        shutil.rmtree(self.path(upload['prefix']), ignore_errors=True)